@@ -1,46 +1,30 @@
 # api_peas.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func, and_, or_, distinct
-from calendar import monthrange
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import desc, func, or_, select, union_all
 from fastapi import File, UploadFile, Form
-from botocore.config import Config
-import pandas as pd
 from io import BytesIO
-from pydantic import BaseModel
-from fastapi.responses import FileResponse
-import openpyxl
-import calendar
-from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List
+from fastapi.responses import FileResponse, Response
 
 # Importa tus módulos locales (ajusta los puntos si tu estructura es distinta)
 from . import models, schemas
-from .database import get_db
-from datetime import datetime, date, timedelta
+from .database import get_db, get_async_db
 import pytz
-import os
 import uuid
-import boto3
 from . import security
 from . import models
 from . import schemas
+from .services import asistencia_excel, asistencia_service, storage, formatos_nacionales_service, plantillas_service
+import asyncio
 
 router = APIRouter(
     prefix="/api/peas",
     tags=["PEAS Asistencia"]
 )
 
-s3_client = boto3.client(
-   's3',
-    endpoint_url=os.getenv('B2_ENDPOINT'),
-    aws_access_key_id=os.getenv('B2_KEY_ID'),
-    aws_secret_access_key=os.getenv('B2_APPLICATION_KEY'),
-    config=Config(
-        signature_version='s3v4',
-        s3={'addressing_style': 'virtual'}
-    )
-)
-
 class RechazoRequest(BaseModel):
     observaciones: str
 
@@ -96,64 +80,24 @@ async def previsualizar_excel_asistencia(
     if not archivo.filename.endswith(('.xls', '.xlsx')):
         raise HTTPException(status_code=400, detail="El archivo debe ser un formato de Excel (.xlsx)")
 
-    fecha_ini = date(anio, mes, 1) if quincena == 1 else date(anio, mes, 16)
-    fecha_fin = date(anio, mes, 15) if quincena == 1 else date(anio, mes, monthrange(anio, mes)[1])
-
     try:
         contents = await archivo.read()
-        df = pd.read_excel(BytesIO(contents))
-        df = df.dropna(how='all')
-
-        asistencias_extraidas = []
-        dias_validos = 0
-
-        for index, row in df.iterrows():    
-            if pd.isna(row.get('FECHA (DD/MM/AAAA)')):
-                continue
-
-            fecha_cruda = pd.to_datetime(row['FECHA (DD/MM/AAAA)'], dayfirst=True)
-
-            if not (fecha_ini <= fecha_cruda.date() <= fecha_fin):
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Error en fila {index + 2}: La fecha {fecha_cruda.strftime('%d/%m/%Y')} no pertenece a la Quincena {quincena} del mes {mes}/{anio}. Por favor, corrige el Excel."
-                )
-            
-            fecha_str = fecha_cruda.strftime('%Y-%m-%d')
-            turno = str(row.get('TIPO_TURNO', 'No especificado')).strip()
-            
-            entrada_val = row.get('HORA_ENTRADA (HH:MM)')
-            salida_val = row.get('HORA_SALIDA (HH:MM)')
-
-            # Si el médico puso horas, las convertimos a string. Si lo dejó vacío, ponemos "--:--"
-            hora_entrada = str(entrada_val).strip() if pd.notnull(entrada_val) and str(entrada_val).strip() != "" else "--:--"
-            hora_salida = str(salida_val).strip() if pd.notnull(salida_val) and str(salida_val).strip() != "" else "--:--"
-
-            if hora_entrada != "--:--" or hora_salida != "--:--":
-                dias_validos += 1
-
-            asistencias_extraidas.append({
-                "fecha": fecha_str,
-                "turno": turno,
-                "entrada": hora_entrada,
-                "salida": hora_salida,
-                "observaciones": str(row.get('OBSERVACIONES', '')).strip() if pd.notnull(row.get('OBSERVACIONES')) else ""
-            })
+        asistencia = await asyncio.to_thread(asistencia_excel.leer_asistencia, contents, anio, mes, quincena)
 
         return {
             "mensaje": "Excel procesado exitosamente",
-            "total_dias_registrados": dias_validos,
-            "detalle_asistencias": asistencias_extraidas
+            "total_dias_registrados": asistencia.dias_validos,
+            "detalle_asistencias": asistencia_excel.detalle(asistencia)
         }
 
-    except HTTPException as http_exc:
-        raise http_exc 
+    except asistencia_excel.ErrorExcel as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno al leer el Excel. Verifica que tenga las columnas correctas. Error: {str(e)}")
 
 # 1. Endpoint para traer los reportes pendientes de un Estado
 @router.get("/coordinador/reportes-pendientes/{entidad}", tags=["Coordinador Estatal"])
-async def obtener_reportes_pendientes_estado(entidad: str, db: Session = Depends(get_db)):
+async def obtener_reportes_pendientes_estado(entidad: str, db: AsyncSession = Depends(get_async_db)):
     entidad_limpia = entidad.upper().strip()
 
     mapa_entidades = {
@@ -186,11 +130,12 @@ async def obtener_reportes_pendientes_estado(entidad: str, db: Session = Depends
 
     # REGLA DE ORO: Solo traemos reportes cuyo estado sea explícitamente PENDIENTE.
     # Si fue RECHAZADO, ya no entrará aquí, aunque no esté en la tabla de validados.
-    reportes = db.query(models.ReporteQuincenal, models.Doctor)\
-        .join(models.Doctor, models.ReporteQuincenal.id_imss == models.Doctor.id_imss)\
-        .filter(models.Doctor.entidad == entidad_query)\
-        .filter(models.ReporteQuincenal.estado == models.EstadoReporte.PENDIENTE)\
-        .all()
+    reportes = (await db.execute(
+        select(models.ReporteQuincenal, models.Doctor)
+        .join(models.Doctor, models.ReporteQuincenal.id_imss == models.Doctor.id_imss)
+        .where(models.Doctor.entidad == entidad_query)
+        .where(models.ReporteQuincenal.estado == models.EstadoReporte.PENDIENTE)
+    )).all()
         
     resultado = []
     for reporte, doctor in reportes:
@@ -243,6 +188,7 @@ async def validar_reporte_estatal(
     if reporte_original:
         reporte_original.estado = "aprobado"
     db.commit()
+    formatos_nacionales_service.invalidar(db, datos_validacion["quincena"])
     
     return {"mensaje": "Documento validado e insertado en la Bitácora Estatal"}
 
@@ -267,12 +213,19 @@ async def subir_reporte_y_excel(
     if not doctor:
         raise HTTPException(status_code=404, detail="Médico no encontrado")
 
-    # 2. Subir ambos archivos a Backblaze B2
+    # 2. Leer el Excel antes de tocar la nube o la BD: si tiene errores no se borra ni se sube nada
+    excel_contents = await archivo_excel.read()
+    try:
+        asistencia = await asyncio.to_thread(asistencia_excel.leer_asistencia, excel_contents, anio, mes, quincena)
+    except asistencia_excel.ErrorExcel as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"No se pudo leer el Excel. Verifica que tenga las columnas correctas. Error: {str(e)}")
+
+    # 3. Subir ambos archivos a Backblaze B2
     periodo_str = f"{anio}-{mes:02d}-Q{quincena}"
-    fecha_ini = date(anio, mes, 1) if quincena == 1 else date(anio, mes, 16)
-    fecha_fin = date(anio, mes, 15) if quincena == 1 else date(anio, mes, monthrange(anio, mes)[1])
+    fecha_ini, fecha_fin = asistencia_excel.periodo(anio, mes, quincena)
     
-    bucket_name = os.getenv('B2_BUCKET_NAME')
     nombre_pdf = f"reportes/{anio}/{mes:02d}/Q{quincena}/{id_imss}_FIRMADO.pdf"
     nombre_excel = f"reportes/{anio}/{mes:02d}/Q{quincena}/{id_imss}_DATOS.xlsx"
 
@@ -288,36 +241,29 @@ async def subir_reporte_y_excel(
                 detail=f"La quincena {periodo_str} ya fue APROBADA por el Coordinador Estatal. Si necesitas corregirla, contáctalo directamente."
             )
         else:
-            # Borramos los archivos viejos de Backblaze PRIMERO
-            if reporte_existente.url_documento:
-                try: s3_client.delete_object(Bucket=bucket_name, Key=reporte_existente.url_documento)
-                except: pass
-            if getattr(reporte_existente, 'url_excel', None):
-                try: s3_client.delete_object(Bucket=bucket_name, Key=reporte_existente.url_excel)
-                except: pass
+            # Borramos los archivos viejos de Backblaze PRIMERO (los dos a la vez)
+            viejos = [k for k in (reporte_existente.url_documento, getattr(reporte_existente, 'url_excel', None)) if k]
+            await asyncio.gather(*[storage.peas.try_delete(k) for k in viejos])
             
-            # Borramos de la BD las asistencias y el reporte viejo
+            # Borramos de la BD el reporte viejo; sus asistencias se reemplazan al final, junto con las nuevas
             db.delete(reporte_existente)
-            db.query(models.PeasAsistencia).filter(
-                models.PeasAsistencia.id_imss == id_imss,
-                func.date(models.PeasAsistencia.fecha_hora) >= fecha_ini,
-                func.date(models.PeasAsistencia.fecha_hora) <= fecha_fin
-            ).delete(synchronize_session=False)
             db.commit()
 
-    # 3. Ahora sí, subimos los archivos NUEVOS a la nube con el camino totalmente libre
-    try:
-        excel_contents = await archivo_excel.read() # Leemos el excel primero para tenerlo listo
-        
-        # Subir PDF
-        s3_client.upload_fileobj(archivo_pdf.file, bucket_name, nombre_pdf, ExtraArgs={"ContentType": "application/pdf"})
-        
-        # Subir Excel
-        s3_client.upload_fileobj(BytesIO(excel_contents), bucket_name, nombre_excel, ExtraArgs={"ContentType": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al subir archivos a la nube: {str(e)}")
+    # 4. Ahora sí, subimos los archivos NUEVOS a la nube con el camino totalmente libre
+    # PDF y Excel en paralelo, fuera del event loop. Se esperan las dos subidas aunque una falle
+    # para no dejar en la nube un archivo huérfano sin reporte que lo apunte
+    resultados = await asyncio.gather(
+        storage.peas.put(nombre_pdf, archivo_pdf.file, "application/pdf"),
+        storage.peas.put(nombre_excel, BytesIO(excel_contents), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+        return_exceptions=True
+    )
+    errores = [r for r in resultados if isinstance(r, BaseException)]
+    if errores:
+        subidos = [r for r in resultados if not isinstance(r, BaseException)]
+        await asyncio.gather(*[storage.peas.try_delete(k) for k in subidos])
+        raise HTTPException(status_code=500, detail=f"Error al subir archivos a la nube: {str(errores[0])}")
 
-    # 4. Crear el nuevo registro principal en la BD
+    # 5. Crear el nuevo registro principal en la BD
     nuevo_reporte = models.ReporteQuincenal(
         id_imss=id_imss,
         quincena=periodo_str,
@@ -329,96 +275,122 @@ async def subir_reporte_y_excel(
     )
     db.add(nuevo_reporte)
 
-    # 4. Procesar el Excel y crear las Asistencias
-    df = pd.read_excel(BytesIO(excel_contents))
-    df = df.dropna(how='all')
-    mx_tz = pytz.timezone('America/Mexico_City')
-    
-    asistencias_a_guardar = []
-    dias_validos = 0 
-
-    for index, row in df.iterrows():
-        if pd.isna(row.get('FECHA (DD/MM/AAAA)')):
-            continue
-
-        fecha_cruda = pd.to_datetime(row['FECHA (DD/MM/AAAA)'], dayfirst=True)
-        
-        # Leemos los valores crudos exactamente igual que en tu previsualizador
-        entrada_val = row.get('HORA_ENTRADA (HH:MM)')
-        salida_val = row.get('HORA_SALIDA (HH:MM)')
-
-        # Validamos de forma segura con Pandas
-        hora_entrada = str(entrada_val).strip() if pd.notnull(entrada_val) and str(entrada_val).strip() != "" else "--:--"
-        hora_salida = str(salida_val).strip() if pd.notnull(salida_val) and str(salida_val).strip() != "" else "--:--"
-
-        # Sumamos 1 día si hay registro de entrada o salida
-        if hora_entrada != "--:--" or hora_salida != "--:--":
-            dias_validos += 1
-
-        # Formateo y guardado de Entradas
-        if hora_entrada != "--:--":
-            entrada_limpia = hora_entrada[:5] # Extraemos solo HH:MM por seguridad
-            dt_entrada_local = mx_tz.localize(datetime.strptime(f"{fecha_cruda.strftime('%Y-%m-%d')} {entrada_limpia}", "%Y-%m-%d %H:%M"))
-            dt_entrada_utc = dt_entrada_local.astimezone(pytz.utc).replace(tzinfo=None)
-            asistencias_a_guardar.append(models.PeasAsistencia(id_imss=id_imss, tipo="Entrada", fecha_hora=dt_entrada_utc))
-
-        # Formateo y guardado de Salidas
-        if hora_salida != "--:--":
-            salida_limpia = hora_salida[:5]
-            dt_salida_local = mx_tz.localize(datetime.strptime(f"{fecha_cruda.strftime('%Y-%m-%d')} {salida_limpia}", "%Y-%m-%d %H:%M"))
-            dt_salida_utc = dt_salida_local.astimezone(pytz.utc).replace(tzinfo=None)
-            asistencias_a_guardar.append(models.PeasAsistencia(id_imss=id_imss, tipo="Salida", fecha_hora=dt_salida_utc))
-
-    # Guardamos todas las asistencias de golpe (Bulk Insert)
-    if asistencias_a_guardar:
-        db.add_all(asistencias_a_guardar)
+    # 6. Reemplazar las asistencias del periodo en la misma transacción: borrado por rango
+    # indexado y un solo COPY con las horas ya convertidas a UTC por el lector
+    asistencia_service.borrar_periodo(db, id_imss, fecha_ini, fecha_fin)
+    asistencia_service.guardar_marcajes(db, id_imss, asistencia_excel.marcajes(asistencia))
 
     # 👇 LE ASIGNAMOS EL CONTEO EXACTO
-    nuevo_reporte.total_dias = dias_validos
+    nuevo_reporte.total_dias = asistencia.dias_validos
 
     # Confirmamos todos los cambios en la base de datos
     db.commit()
 
     return {
         "mensaje": "Archivos subidos y asistencias registradas exitosamente.",
-        "dias_procesados": dias_validos
+        "dias_procesados": asistencia.dias_validos
     }
 
 @router.get("/reporte-quincenal/ver-documento", tags=["Encargado Unidad"])
-async def obtener_url_documento(ruta: str):
+async def obtener_url_documento(
+    ruta: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
     """
     Genera una URL temporal y segura (válida por 1 hora) 
     para ver un documento almacenado en Backblaze B2.
+    Solo firma rutas de reportes o formatos que el usuario puede ver (mismas reglas que ver-documentos).
     """
     if not ruta:
         raise HTTPException(status_code=400, detail="Ruta del documento no proporcionada")
+
+    # 404 y no 403 para no revelar qué rutas existen fuera de su alcance
+    if ruta not in await _rutas_visibles(db, [ruta], current_user):
+        raise HTTPException(status_code=404, detail="Documento no encontrado")
         
     try:
-        bucket_name = os.getenv('B2_BUCKET_NAME')
-        
-        # Generamos la "Presigned URL" con boto3
-        url_temporal = s3_client.generate_presigned_url(
-            ClientMethod='get_object',
-            Params={
-                'Bucket': bucket_name,
-                'Key': ruta
-            },
-            ExpiresIn=3600 # El link expira en 1 hora (3600 segundos)
-        )
+        # URL firmada del backend de almacenamiento; el link expira en 1 hora (3600 segundos)
+        url_temporal = await storage.peas.presign(ruta, expira=3600)
         
         return {"url": url_temporal}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al generar enlace seguro: {str(e)}")
 
+class DocumentosRequest(BaseModel):
+    rutas: List[str] = Field(..., min_length=1, max_length=500)
+
+async def _rutas_visibles(db: AsyncSession, rutas: List[str], current_user) -> set:
+    """
+    Rutas de la lista que corresponden a un reporte o formato registrado que el usuario puede ver:
+    responsable_unidad solo los reportes de su CLUES, coordinador_estatal los reportes y formatos
+    estatales de su entidad, los demás roles todo (formatos nacionales incluidos).
+    """
+    rol_usuario = getattr(current_user, "rol", "")
+    reporte = models.ReporteQuincenal
+    estatal = models.FormatoEstatalFirmado
+    nacional = models.FormatoNacionalFirmado
+
+    reportes = [
+        select(columna.label("ruta")).where(columna.in_(rutas))
+        for columna in (reporte.url_documento, reporte.url_excel)
+    ]
+    if rol_usuario == "responsable_unidad":
+        if not current_user.clues:
+            raise HTTPException(status_code=403, detail="Tu usuario no tiene una CLUES asignada.")
+        reportes = [
+            c.join(models.Doctor, models.Doctor.id_imss == reporte.id_imss).where(models.Doctor.clues == current_user.clues)
+            for c in reportes
+        ]
+        consultas = reportes
+    elif rol_usuario == "coordinador_estatal":
+        if not current_user.entidad:
+            raise HTTPException(status_code=403, detail="Tu usuario no tiene una Entidad asignada.")
+        reportes = [
+            c.join(models.Doctor, models.Doctor.id_imss == reporte.id_imss).where(models.Doctor.entidad == current_user.entidad)
+            for c in reportes
+        ]
+        consultas = reportes + [
+            select(estatal.url_documento).where(
+                estatal.url_documento.in_(rutas),
+                estatal.entidad == current_user.entidad.upper().strip()
+            )
+        ]
+    else:
+        consultas = reportes + [
+            select(estatal.url_documento).where(estatal.url_documento.in_(rutas)),
+            select(nacional.url_documento).where(nacional.url_documento.in_(rutas)),
+        ]
+
+    # Una sola ida a la BD para todas las tablas
+    return {ruta for (ruta,) in await db.execute(union_all(*consultas))}
+
+@router.post("/reporte-quincenal/ver-documentos", tags=["Encargado Unidad"])
+async def obtener_urls_documentos(
+    req: DocumentosRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    """
+    Igual que ver-documento pero para todas las filas de una pantalla en una sola petición.
+    Solo se firman rutas registradas en reportes o formatos que el usuario puede ver; las demás,
+    y las que no se pudieron firmar, regresan en null.
+    """
+    visibles = await _rutas_visibles(db, req.rutas, current_user)
+    urls = await storage.peas.presign_muchos([r for r in req.rutas if r in visibles], expira=3600)
+    return {"urls": {ruta: urls.get(ruta) for ruta in req.rutas}}
+
 @router.get("/coordinador/generar-formato2/{entidad}/{quincena}", tags=["Coordinador Estatal"])
-async def obtener_datos_formato_2(entidad: str, quincena: str, db: Session = Depends(get_db)):
+async def obtener_datos_formato_2(entidad: str, quincena: str, db: AsyncSession = Depends(get_async_db)):
     entidad = entidad.upper().strip()
     
     # 1. Buscamos todos los registros validados de ese estado en esa quincena
-    registros = db.query(models.BitacoraEstatalValidada).filter(
-        models.BitacoraEstatalValidada.entidad == entidad,
-        models.BitacoraEstatalValidada.quincena_validada == quincena
-    ).order_by(models.BitacoraEstatalValidada.profesional_salud).all()
+    registros = (await db.execute(
+        select(models.BitacoraEstatalValidada).where(
+            models.BitacoraEstatalValidada.entidad == entidad,
+            models.BitacoraEstatalValidada.quincena_validada == quincena
+        ).order_by(models.BitacoraEstatalValidada.profesional_salud)
+    )).scalars().all()
     
     if not registros:
         raise HTTPException(status_code=404, detail="No hay registros validados para esta quincena.")
@@ -470,22 +442,16 @@ async def subir_formato_estatal(
     ).first()
 
     # Generar ruta única en Backblaze
-    bucket_name = os.getenv('B2_BUCKET_NAME')
     nombre_unico = f"formatos_estatales/{anio}/{mes:02d}/Q{quincena}/{entidad}_FORMATO2.pdf"
 
     try:
         # 1. SI YA HABÍA UNO VIEJO, LO BORRAMOS DE B2 PRIMERO 
         # (Esto libera el nombre exacto en la nube antes de subir el nuevo)
         if formato_existente and formato_existente.url_documento:
-            try: 
-                s3_client.delete_object(Bucket=bucket_name, Key=formato_existente.url_documento)
-            except Exception: 
-                pass
+            await storage.peas.try_delete(formato_existente.url_documento)
 
         # 2. SUBIMOS EL NUEVO ARCHIVO CON EL CAMINO TOTALMENTE LIBRE
-        s3_client.upload_fileobj(
-            archivo.file, bucket_name, nombre_unico, ExtraArgs={"ContentType": "application/pdf"}
-        )
+        await storage.peas.put(nombre_unico, archivo.file, "application/pdf")
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al subir a la nube: {str(e)}")
@@ -508,17 +474,21 @@ async def subir_formato_estatal(
         db.add(nuevo_formato)
 
     db.commit()
+    # El formato vuelve a PENDIENTE: la entidad sale de los formatos nacionales hasta que se apruebe
+    formatos_nacionales_service.invalidar(db, periodo_str)
 
     return {"mensaje": "Formato Estatal Firmado guardado con éxito", "url": nombre_unico}
 
 @router.get("/coordinador/historial-formatos/{entidad}", tags=["Coordinador Estatal"])
-async def obtener_historial_formatos(entidad: str, db: Session = Depends(get_db)):
+async def obtener_historial_formatos(entidad: str, db: AsyncSession = Depends(get_async_db)):
     entidad_limpia = entidad.upper().strip()
     
     # Traemos los formatos ordenados del más reciente al más antiguo
-    formatos = db.query(models.FormatoEstatalFirmado).filter(
-        models.FormatoEstatalFirmado.entidad == entidad_limpia
-    ).order_by(desc(models.FormatoEstatalFirmado.fecha_subida)).all()
+    formatos = (await db.execute(
+        select(models.FormatoEstatalFirmado).where(
+            models.FormatoEstatalFirmado.entidad == entidad_limpia
+        ).order_by(desc(models.FormatoEstatalFirmado.fecha_subida))
+    )).scalars().all()
     
     historial = []
     for f in formatos:
@@ -535,163 +505,43 @@ async def obtener_historial_formatos(entidad: str, db: Session = Depends(get_db)
     return historial
 
 @router.get("/nacional/formato3/{anio}/{mes}/{quincena}", tags=["Nacional"])
-async def obtener_formato_3_nacional(anio: int, mes: int, quincena: str, db: Session = Depends(get_db)):
-    
-    # 1. Configuración dinámica del texto para el Excel
-    meses_nombres = ["", "ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", "JULIO", "AGOSTO", "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE"]
-    nombre_mes = meses_nombres[mes]
-    ultimo_dia = calendar.monthrange(anio, mes)[1] # Detecta automáticamente si el mes trae 28, 30 o 31 días
-    
-    if quincena == "completo":
-        periodos = [f"{anio}-{mes:02d}-Q1", f"{anio}-{mes:02d}-Q2"]
-        texto_periodo_excel = f"1 AL {ultimo_dia} DE {nombre_mes} DE {anio}"
-    elif quincena == "1":
-        periodos = [f"{anio}-{mes:02d}-Q1"]
-        texto_periodo_excel = f"1 AL 15 DE {nombre_mes} DE {anio}"
-    elif quincena == "2":
-        periodos = [f"{anio}-{mes:02d}-Q2"]
-        texto_periodo_excel = f"16 AL {ultimo_dia} DE {nombre_mes} DE {anio}"
-    else:
+async def obtener_formato_3_nacional(anio: int, mes: int, quincena: str):
+    try:
+        datos = await formatos_nacionales_service.obtener(anio, mes, quincena)
+    except ValueError:
         raise HTTPException(status_code=400, detail="Quincena inválida")
-    
-    # 2. Buscamos formatos APROBADOS
-    formatos_aprobados = db.query(models.FormatoEstatalFirmado).filter(
-        models.FormatoEstatalFirmado.quincena.in_(periodos),
-        models.FormatoEstatalFirmado.estado == models.EstadoReporte.APROBADO
-    ).all()
-    
-    if not formatos_aprobados:
+    except formatos_nacionales_service.SinAprobados:
         raise HTTPException(status_code=400, detail="No se encontraron registros aprobados para este periodo.")
 
-    # 3. Candado de seguridad
-    condiciones_aprobadas = [
-        and_(
-            models.BitacoraEstatalValidada.entidad == f.entidad,
-            models.BitacoraEstatalValidada.quincena_validada == f.quincena
-        ) for f in formatos_aprobados
-    ]
-
-    # 4. LA MAGIA ESTÁ AQUÍ: Agrupamos por médico y sumamos los días
-    registros = db.query(
-        models.BitacoraEstatalValidada.entidad,
-        models.BitacoraEstatalValidada.unidad_medica,
-        models.BitacoraEstatalValidada.clues_ib,
-        models.BitacoraEstatalValidada.especialidad,
-        models.BitacoraEstatalValidada.turno,
-        models.BitacoraEstatalValidada.profesional_salud,
-        func.sum(models.BitacoraEstatalValidada.dias_participacion).label("dias_totales") # Sumamos los días
-    ).filter(
-        or_(*condiciones_aprobadas)
-    ).group_by(
-        # Le decimos a SQL que agrupe todas las filas que compartan estos datos idénticos
-        models.BitacoraEstatalValidada.entidad,
-        models.BitacoraEstatalValidada.unidad_medica,
-        models.BitacoraEstatalValidada.clues_ib,
-        models.BitacoraEstatalValidada.especialidad,
-        models.BitacoraEstatalValidada.turno,
-        models.BitacoraEstatalValidada.profesional_salud
-    ).order_by(
-        models.BitacoraEstatalValidada.entidad, 
-        models.BitacoraEstatalValidada.unidad_medica
-    ).all()
-    
-    # 5. Formateamos la respuesta
-    detalle = []
-    for i, reg in enumerate(registros, start=1):
-        detalle.append({
-            "no": i,
-            "unidad": reg.unidad_medica or "SIN UNIDAD",
-            "entidad": reg.entidad,
-            "clues": reg.clues_ib,
-            "especialidad": reg.especialidad,
-            "turno": reg.turno,
-            "medico": reg.profesional_salud,
-            "dias": reg.dias_totales # Inyectamos la suma correcta
-        })
-        
     return {
-        "periodo_texto": texto_periodo_excel, # Pasamos el string perfecto para tu título
+        "periodo_texto": datos["periodo_texto"], # Pasamos el string perfecto para tu título
         "anio": anio,
         "mes": mes,
         "quincena": quincena,
-        "medicos": detalle
+        "medicos": datos["medicos"]
     }
 
 @router.get("/nacional/formato4/{anio}/{mes}/{quincena}", tags=["Nacional"])
-async def obtener_formato_4_nacional(anio: int, mes: int, quincena: str, db: Session = Depends(get_db)):
-    
-    # 1. Configuración dinámica del texto y periodos
-    meses_nombres = ["", "ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", "JULIO", "AGOSTO", "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE"]
-    nombre_mes = meses_nombres[mes]
-    ultimo_dia = calendar.monthrange(anio, mes)[1]
-    
-    if quincena == "completo":
-        periodos = [f"{anio}-{mes:02d}-Q1", f"{anio}-{mes:02d}-Q2"]
-        texto_periodo_excel = f"1 AL {ultimo_dia} DE {nombre_mes} DE {anio}"
-    elif quincena == "1":
-        periodos = [f"{anio}-{mes:02d}-Q1"]
-        texto_periodo_excel = f"1 AL 15 DE {nombre_mes} DE {anio}"
-    elif quincena == "2":
-        periodos = [f"{anio}-{mes:02d}-Q2"]
-        texto_periodo_excel = f"16 AL {ultimo_dia} DE {nombre_mes} DE {anio}"
-    else:
+async def obtener_formato_4_nacional(anio: int, mes: int, quincena: str):
+    # Mismos datos que el Formato 3 (misma consulta y misma entrada de caché), resumidos por entidad
+    try:
+        datos = await formatos_nacionales_service.obtener(anio, mes, quincena)
+    except ValueError:
         raise HTTPException(status_code=400, detail="Quincena inválida")
-    
-    # 2. Buscamos qué formatos están APROBADOS
-    formatos_aprobados = db.query(models.FormatoEstatalFirmado).filter(
-        models.FormatoEstatalFirmado.quincena.in_(periodos),
-        models.FormatoEstatalFirmado.estado == models.EstadoReporte.APROBADO
-    ).all()
-    
-    if not formatos_aprobados:
+    except formatos_nacionales_service.SinAprobados:
         raise HTTPException(
             status_code=400, 
             detail="No se puede generar el resumen: Aún no hay registros APROBADOS para este periodo."
         )
-    
-    # 3. Armamos el mismo candado de seguridad que en el formato 3
-    condiciones_aprobadas = [
-        and_(
-            models.BitacoraEstatalValidada.entidad == f.entidad,
-            models.BitacoraEstatalValidada.quincena_validada == f.quincena
-        ) for f in formatos_aprobados
-    ]
-    
-    # 4. Le pedimos a PostgreSQL que cuente los médicos (SIN REPETIR) y sume los días
-    resultados = db.query(
-        models.BitacoraEstatalValidada.entidad,
-        func.count(distinct(models.BitacoraEstatalValidada.profesional_salud)).label("total_medicos"), # <-- CRÍTICO: Cuenta médicos únicos
-        func.sum(models.BitacoraEstatalValidada.dias_participacion).label("total_dias")
-    ).filter(
-        or_(*condiciones_aprobadas)
-    ).group_by(
-        models.BitacoraEstatalValidada.entidad
-    ).order_by(
-        models.BitacoraEstatalValidada.entidad
-    ).all()
-    
-    detalle = []
-    gran_total_medicos = 0
-    gran_total_dias = 0
-    
-    for res in resultados:
-        dias_validos = res.total_dias or 0
-        detalle.append({
-            "entidad": res.entidad,
-            "medicos": res.total_medicos,
-            "dias": dias_validos
-        })
-        gran_total_medicos += res.total_medicos
-        gran_total_dias += dias_validos
-        
+
     return {
-        "periodo_texto": texto_periodo_excel, # Mismo título exacto que el formato 3
+        "periodo_texto": datos["periodo_texto"], # Mismo título exacto que el formato 3
         "anio": anio,
         "mes": mes,
         "quincena": quincena,
-        "resumen": detalle,
-        "gran_total_medicos": gran_total_medicos,
-        "gran_total_dias": gran_total_dias
+        "resumen": datos["resumen"],
+        "gran_total_medicos": sum(r["medicos"] for r in datos["resumen"]),
+        "gran_total_dias": sum(r["dias"] for r in datos["resumen"])
     }
 
 @router.post("/nacional/subir-formato-nacional", tags=["Nacional"])
@@ -709,7 +559,6 @@ async def subir_formato_nacional(
     # Normalizamos el periodo para que coincida con la lógica que ya usamos
     periodo_str = f"{anio}-{mes:02d}-Q{quincena}"
     
-    bucket_name = os.getenv('B2_BUCKET_NAME')
     # Ajustamos la ruta para que soporte el string "completo" en el nombre del archivo
     nombre_unico = f"formatos_nacionales/{anio}/{mes:02d}/{quincena}/NACIONAL_FORMATO3y4.pdf"
 
@@ -720,19 +569,11 @@ async def subir_formato_nacional(
 
     # 2. Borrado seguro en la nube
     if formato_existente and formato_existente.url_documento:
-        try:
-            s3_client.delete_object(Bucket=bucket_name, Key=formato_existente.url_documento)
-        except Exception:
-            pass
+        await storage.peas.try_delete(formato_existente.url_documento)
 
     # 3. Subida a la nube
     try:
-        s3_client.upload_fileobj(
-            archivo.file, 
-            bucket_name, 
-            nombre_unico, 
-            ExtraArgs={"ContentType": "application/pdf"}
-        )
+        await storage.peas.put(nombre_unico, archivo.file, "application/pdf")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al subir a la nube: {str(e)}")
 
@@ -825,6 +666,7 @@ async def rechazar_formato_estatal(id_formato: int, req: RechazoRequest, db: Ses
     formato.observaciones = req.observaciones
     
     db.commit()
+    formatos_nacionales_service.invalidar(db, formato.quincena)
     return {"mensaje": "Formato estatal rechazado. El Coordinador ha sido notificado."}
 
 @router.get("/nacional/estado-formatos/{anio}/{mes}/{quincena}", tags=["Nacional"])
@@ -877,24 +719,31 @@ async def aprobar_formato_estatal(id_formato: int, db: Session = Depends(get_db)
     formato.observaciones = None # Limpiamos cualquier observación vieja
     
     db.commit()
+    formatos_nacionales_service.invalidar(db, formato.quincena)
     return {"mensaje": "Formato estatal aprobado y bloqueado para su generación."}
 
 @router.get("/coordinador/reportes-validados/{entidad}/{periodo}", tags=["Coordinador Estatal"])
-async def obtener_reportes_validados(entidad: str, periodo: str, db: Session = Depends(get_db)):
+async def obtener_reportes_validados(entidad: str, periodo: str, db: AsyncSession = Depends(get_async_db)):
     entidad_limpia = entidad.upper().strip()
     
-    # Traemos los registros de la bitácora estatal validada para ese periodo y entidad
-    registros = db.query(models.BitacoraEstatalValidada).filter(
-        models.BitacoraEstatalValidada.entidad == entidad_limpia,
-        models.BitacoraEstatalValidada.quincena_validada == periodo
-    ).order_by(models.BitacoraEstatalValidada.profesional_salud).all()
-    
-    validados = []
-    for reg in registros:
-        reporte_orig = db.query(models.ReporteQuincenal).filter(
-            models.ReporteQuincenal.id == reg.id_reporte_quincenal
-        ).first()
-        validados.append({
+    # Bitácora estatal validada del periodo y entidad con la URL del PDF original en una sola
+    # consulta (LEFT JOIN: si el reporte ya no existe, url_pdf queda en None)
+    bitacora = models.BitacoraEstatalValidada
+    filas = (await db.execute(
+        select(
+            bitacora.id, bitacora.id_reporte_quincenal, bitacora.quincena_validada, bitacora.clues_ib,
+            bitacora.unidad_medica, bitacora.profesional_salud, bitacora.id_imss, bitacora.especialidad,
+            bitacora.turno, bitacora.dias_participacion, models.ReporteQuincenal.url_documento
+        ).outerjoin(
+            models.ReporteQuincenal, models.ReporteQuincenal.id == bitacora.id_reporte_quincenal
+        ).where(
+            bitacora.entidad == entidad_limpia,
+            bitacora.quincena_validada == periodo
+        ).order_by(bitacora.profesional_salud)
+    )).all()
+
+    return [
+        {
             "id_bitacora": reg.id,
             "id_reporte": reg.id_reporte_quincenal,
             "quincena": reg.quincena_validada,
@@ -905,10 +754,10 @@ async def obtener_reportes_validados(entidad: str, periodo: str, db: Session = D
             "especialidad": reg.especialidad,
             "turno": reg.turno,
             "dias": reg.dias_participacion,
-            "url_pdf": reporte_orig.url_documento if reporte_orig else None
-        })
-        
-    return validados
+            "url_pdf": reg.url_documento
+        }
+        for reg in filas
+    ]
 
 class RevocarRequest(BaseModel):
     observaciones: str
@@ -921,6 +770,9 @@ async def revocar_reporte(id_reporte: int, req: RevocarRequest, db: Session = De
         raise HTTPException(status_code=404, detail="Reporte original no encontrado")
         
     # 2. Eliminamos el registro validado de la bitácora estatal
+    periodos_revocados = [q for (q,) in db.query(models.BitacoraEstatalValidada.quincena_validada).filter(
+       models.BitacoraEstatalValidada.id_reporte_quincenal == id_reporte
+    ).all()]
     db.query(models.BitacoraEstatalValidada).filter(
        models.BitacoraEstatalValidada.id_reporte_quincenal == id_reporte
     ).delete()
@@ -930,102 +782,39 @@ async def revocar_reporte(id_reporte: int, req: RevocarRequest, db: Session = De
     reporte_original.observaciones = req.observaciones
     
     db.commit()
+    formatos_nacionales_service.invalidar(db, *periodos_revocados)
     return {"mensaje": "Reporte revocado exitosamente y devuelto a la unidad."}
 
-@router.get("/reporte-quincenal/descargar-formato-impresion", tags=["Reportes PEAS"])
-async def descargar_formato_impresion(anio: int, mes: int, quincena: int):
-    # 1. Cargamos tu plantilla base
-    directorio_actual = os.path.dirname(os.path.abspath(__file__))
-    ruta_plantilla = os.path.join(directorio_actual, "plantilla_firma_manual.xlsx")
-    
-    if not os.path.exists(ruta_plantilla):
+async def _descargar_plantilla(request: Request, plantilla: str, anio: int, mes: int, quincena: int, nombre_archivo: str):
+    # Variantes ya generadas en memoria; si el navegador ya la tiene, 304 sin generar nada
+    try:
+        etag = plantillas_service.etag(plantilla, anio, mes, quincena)
+    except plantillas_service.PlantillaNoEncontrada:
         raise HTTPException(status_code=404, detail="Plantilla base no encontrada.")
 
-    wb = openpyxl.load_workbook(ruta_plantilla)
-    ws = wb.active
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if plantillas_service.coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
 
-    # 2. Configuramos el rango de días según el mes y quincena elegidos
-    meses = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
-    nombre_mes = meses[mes]
+    contenido = await plantillas_service.obtener(plantilla, anio, mes, quincena)
+    headers["Content-Disposition"] = f"attachment; filename={nombre_archivo}"
+    return Response(content=contenido, media_type=plantillas_service.MEDIA_TYPE, headers=headers)
 
-    if quincena == 1:
-        dia_inicio = 1
-        dia_fin = 15
-    else:
-        dia_inicio = 16
-        dia_fin = calendar.monthrange(anio, mes)[1] 
+def _validar_periodo(mes: int, quincena: int) -> int:
+    if not 1 <= mes <= 12:
+        raise HTTPException(status_code=400, detail="Mes inválido")
+    # Cualquier valor distinto de 1 siempre se trató como segunda quincena
+    return 1 if quincena == 1 else 2
 
-    # 3. Escribir el "Periodo" dinámico en el encabezado
-    # SUSTITUYE 'G4' por la celda real donde está tu texto de "Periodo: 16 al 30..."
-    ws['I4'] = f"{dia_inicio} al {dia_fin} de {nombre_mes} de {anio}"
-
-    # 4. Escribir las fechas fila por fila
-    fila_inicio = 8 
-    dias_totales = range(dia_inicio, dia_fin + 1)
-    
-    for i in range(16): # 16 es el máximo de filas necesarias (ej. meses con 31 días en Q2)
-        celda = ws.cell(row=fila_inicio + i, column=2) # Asumiendo que la Fecha está en la Columna A (1)
-        
-        if i < len(dias_totales):
-            dia = dias_totales[i]
-            # Formato estricto DD/MM/AAAA
-            celda.value = f"{dia:02d}/{mes:02d}/{anio}"
-        else:
-            # Si sobran filas (ej. la primera quincena solo usa 15), las dejamos en blanco
-            celda.value = ""
-
-    # 5. Guardar en memoria virtual (StreamingResponse no gasta disco de tu servidor)
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    nombre_archivo = f"Registro_Firmas_{nombre_mes}_Q{quincena}.xlsx"
-    
-    return StreamingResponse(
-        output, 
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={nombre_archivo}"}
-    )
+@router.get("/reporte-quincenal/descargar-formato-impresion", tags=["Reportes PEAS"])
+async def descargar_formato_impresion(anio: int, mes: int, quincena: int, request: Request):
+    quincena = _validar_periodo(mes, quincena)
+    nombre_archivo = f"Registro_Firmas_{plantillas_service.MESES[mes]}_Q{quincena}.xlsx"
+    return await _descargar_plantilla(request, "firma_manual", anio, mes, quincena, nombre_archivo)
 
 @router.get("/reporte-quincenal/descargar-plantilla-dinamica", tags=["Reportes PEAS"])
-async def descargar_plantilla_dinamica(anio: int, mes: int, quincena: int):
-    directorio_actual = os.path.dirname(os.path.abspath(__file__))
-    ruta_plantilla = os.path.join(directorio_actual, "formato_asistencias.xlsx")
-    
-    if not os.path.exists(ruta_plantilla):
-        raise HTTPException(status_code=404, detail="Plantilla base no encontrada.")
-
-    wb = openpyxl.load_workbook(ruta_plantilla)
-    ws = wb.active
-
-    if quincena == 1:
-        dia_inicio = 1
-        dia_fin = 15
-    else:
-        dia_inicio = 16
-        dia_fin = calendar.monthrange(anio, mes)[1]
-
-    dias_totales = range(dia_inicio, dia_fin + 1)
-    fila_inicio = 2 
-    
-    for i in range(16): 
-        celda = ws.cell(row=fila_inicio + i, column=1) 
-        
-        if i < len(dias_totales):
-            dia = dias_totales[i]
-            celda.value = f"{dia:02d}/{mes:02d}/{anio}"
-        else:
-            celda.value = ""
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
+async def descargar_plantilla_dinamica(anio: int, mes: int, quincena: int, request: Request):
+    quincena = _validar_periodo(mes, quincena)
     nombre_archivo = f"Plantilla_Asistencia_{anio}_{mes:02d}_Q{quincena}.xlsx"
-    
-    return StreamingResponse(
-        output, 
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={nombre_archivo}"}
-    )
+    return await _descargar_plantilla(request, "asistencias", anio, mes, quincena, nombre_archivo)
 
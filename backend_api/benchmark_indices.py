@@ -0,0 +1,127 @@
+import sys
+import os
+import re
+import traceback
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from sqlalchemy import text
+    from backend_api.database import SessionLocal
+except ImportError as e:
+    print(f"Error importando módulos: {e}")
+    sys.exit(1)
+
+# Consultas representativas de cada router, con los mismos filtros que usan los endpoints.
+# Uso: python backend_api/benchmark_indices.py [--planes]
+CONSULTAS = [
+    ("graficas", "dashboard: total por coordinación", """
+        SELECT COUNT(*) FROM doctores
+        WHERE is_deleted = false AND coordinacion = :coord AND estatus != '06 BAJA'
+    """),
+    ("graficas", "estadística agrupada por entidad", """
+        SELECT entidad, nombre_unidad, clues, especialidad, nivel_atencion, COUNT(*)
+        FROM doctores
+        WHERE is_deleted = false AND coordinacion = :coord AND entidad = :entidad
+        GROUP BY entidad, nombre_unidad, clues, especialidad, nivel_atencion
+        ORDER BY entidad LIMIT 10
+    """),
+    ("graficas", "histórico de bajas", """
+        SELECT DATE_TRUNC('month', fecha_estatus) AS mes, COUNT(*)
+        FROM doctores
+        WHERE is_deleted = false AND coordinacion = :coord
+          AND estatus = '06 BAJA' AND fecha_estatus IS NOT NULL
+        GROUP BY mes ORDER BY mes
+    """),
+    ("catalogos", "capacidad por entidad", """
+        SELECT COUNT(*) FROM doctores
+        WHERE is_deleted = false AND estatus = '01 ACTIVO'
+          AND coordinacion != '1' AND entidad = :entidad
+    """),
+    ("catalogos", "unidades de una entidad", """
+        SELECT DISTINCT nombre_unidad FROM doctores
+        WHERE is_deleted = false AND coordinacion = '0' AND entidad = :entidad
+          AND nombre_unidad IS NOT NULL AND nombre_unidad != ''
+        ORDER BY nombre_unidad
+    """),
+    ("doctores", "listado de una CLUES", """
+        SELECT id_imss FROM doctores
+        WHERE is_deleted = false AND clues = :clues
+        ORDER BY id_imss LIMIT 30
+    """),
+    ("doctores", "alertas de vencimiento", """
+        SELECT id_imss FROM doctores
+        WHERE is_deleted = false AND fecha_fin IS NOT NULL
+          AND estatus ILIKE '05 INCAPACIDAD%'
+        ORDER BY fecha_fin
+    """),
+    ("doctores", "historial de un doctor", """
+        SELECT * FROM estatus_historico
+        WHERE id_imss = :id_imss
+        ORDER BY fecha_inicio, id
+    """),
+    ("reportes", "reporte por entidad y estatus", """
+        SELECT id_imss FROM doctores
+        WHERE is_deleted = false AND entidad = :entidad AND estatus = :estatus
+        ORDER BY id_imss LIMIT 500
+    """),
+]
+
+# "Antes" se mide con el planificador sin recorridos por índice (SET LOCAL, solo en esa
+# transacción), sin tocar el esquema ni tomar locks: es la cota de una tabla sin los índices
+# de 0002_indices_filtros. Como tampoco usa los que ya existían, puede salir más lento que antes
+# de la migración; para comparar contra un índice puntual usar una copia de la BD
+SIN_INDICES = ("enable_indexscan", "enable_indexonlyscan", "enable_bitmapscan")
+
+
+def _parametros(db) -> dict:
+    fila = db.execute(text("""
+        SELECT entidad, clues, id_imss FROM doctores
+        WHERE is_deleted = false AND entidad IS NOT NULL AND clues IS NOT NULL
+        LIMIT 1
+    """)).first()
+    if not fila:
+        raise RuntimeError("No hay doctores para tomar valores de prueba.")
+    return {"coord": "0", "entidad": fila.entidad, "clues": fila.clues,
+            "id_imss": fila.id_imss, "estatus": "01 ACTIVO"}
+
+
+def _explicar(db, sql: str, params: dict, sin_indices: bool):
+    try:
+        if sin_indices:
+            for parametro in SIN_INDICES:
+                db.execute(text(f"SET LOCAL {parametro} = off"))
+        plan = [r[0] for r in db.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"), params)]
+    finally:
+        db.rollback()
+    tiempo = next((float(m.group(1)) for linea in plan
+                   for m in [re.search(r"Execution Time: ([\d.]+) ms", linea)] if m), None)
+    return plan, tiempo
+
+
+def _ms(valor, ancho: int) -> str:
+    return f"{valor:>{ancho}.2f}" if valor is not None else f"{'-':>{ancho}}"
+
+
+def benchmark(mostrar_planes: bool = False):
+    db = SessionLocal()
+    try:
+        params = _parametros(db)
+        db.rollback()
+        print(f"{'router':<10} {'consulta':<34} {'antes ms':>10} {'después ms':>11}")
+        for router, nombre, sql in CONSULTAS:
+            plan_antes, antes = _explicar(db, sql, params, sin_indices=True)
+            plan_despues, despues = _explicar(db, sql, params, sin_indices=False)
+            print(f"{router:<10} {nombre:<34} {_ms(antes, 10)} {_ms(despues, 11)}")
+            if mostrar_planes:
+                print("  -- antes --")
+                print("\n".join(f"  {l}" for l in plan_antes))
+                print("  -- después --")
+                print("\n".join(f"  {l}" for l in plan_despues))
+    except Exception as e:
+        print(f"Error: {e}")
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    benchmark(mostrar_planes="--planes" in sys.argv)
@@ -1,40 +1,295 @@
 # backend_api/cache.py
+import os
+import sys
 import json
+import asyncio
+import inspect
 import hashlib
+import threading
 import time
+from collections import OrderedDict
 from typing import Optional
 
+
+def _estimar_tamano(key: str, value) -> int:
+    # Estimación barata en bytes: serializamos como lo haría la respuesta JSON
+    if isinstance(value, (bytes, bytearray)):
+        return len(value) + len(key) + 64
+    try:
+        payload = len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        payload = sys.getsizeof(value)
+    return payload + len(key) + 64
+
+
 class CountCache:
-    def __init__(self):
-        self._cache = {}
-        self._default_ttl = 300
+    """
+    Caché LRU con TTL, acotada por número de entradas y por bytes estimados.
+
+    Cada entrada puede llevar etiquetas (p. ej. "entidad:OAXACA"). `invalidate_tag`
+    solo incrementa un contador de generación por etiqueta (O(1)); una entrada
+    cuya generación guardada ya no coincide se considera inválida al leerla.
+    """
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 32 * 1024 * 1024,
+                 default_ttl: int = 300, sweep_interval: int = 60):
+        self._cache = OrderedDict()
+        self._lock = threading.RLock()
+        self._default_ttl = default_ttl
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._bytes = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._stale_hits = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+        # Generación actual de cada etiqueta
+        self._tag_gens = {}
+        # Cálculos en curso por llave (single-flight); solo se toca desde el event loop
+        self._inflight = {}
+        # Cambia en cada invalidate() por patrón para no guardar resultados calculados antes
+        self._epoch = 0
+
+        self._sweep_interval = sweep_interval
+        self._sweeper = None
+        # Callback para avisar a otros procesos (lo registra services/cache_bus.py)
+        self._publisher = None
 
     def get(self, key: str) -> Optional[int]:
-        if key in self._cache:
-            entry = self._cache[key]
-            if time.time() - entry['time'] < entry['ttl']:
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry['expires'] <= time.monotonic():
+                self._misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return entry['value']
+
+    def set(self, key: str, value, ttl: int = None, stale_ttl: int = 0, tags=()):
+        with self._lock:
+            snapshot = self._snapshot(tags)
+        self._store(key, value, ttl, stale_ttl, snapshot)
+
+    async def get_or_compute(self, key: str, fn, ttl: int = None, stale_ttl: int = 0, tags=()):
+        """
+        Devuelve el valor en caché o lo calcula con `fn` (función normal o async).
+        Solo un llamador calcula cada llave; los demás esperan ese mismo resultado.
+        Si la entrada venció hace menos de `stale_ttl` segundos se devuelve el valor
+        viejo y se lanza un único refresco en segundo plano.
+
+        Como el refresco puede terminar después de la petición, `fn` debe abrir
+        su propia sesión de BD en lugar de usar la de la petición.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            now = time.monotonic()
+            if entry is not None and entry['expires'] > now:
+                self._cache.move_to_end(key)
+                self._hits += 1
                 return entry['value']
+            stale = entry
+            if stale is not None:
+                self._stale_hits += 1
             else:
-                del self._cache[key]
-        return None
+                self._misses += 1
+            snapshot = self._snapshot(tags)
+
+        # Solo nos unimos a un cálculo en curso si empezó después de la última invalidación
+        en_curso = self._inflight.get(key)
+        if en_curso is None or en_curso[1] != (self._epoch, snapshot):
+            futuro = asyncio.ensure_future(self._compute(key, fn, ttl, stale_ttl, snapshot))
+            self._inflight[key] = (futuro, (self._epoch, snapshot))
+            futuro.add_done_callback(self._log_background_error)
+        else:
+            futuro = en_curso[0]
+
+        if stale is not None:
+            return stale['value']
+        return await asyncio.shield(futuro)
+
+    async def _compute(self, key: str, fn, ttl, stale_ttl, snapshot):
+        epoch = self._epoch
+        try:
+            value = fn()
+            if inspect.isawaitable(value):
+                value = await value
+            # Si hubo invalidación durante el cálculo no guardamos, para no pisar
+            # un resultado más nuevo con uno que ya nace inválido
+            with self._lock:
+                vigente = epoch == self._epoch and self._vigente({'tags': snapshot})
+            if vigente:
+                self._store(key, value, ttl, stale_ttl, snapshot)
+            return value
+        finally:
+            en_curso = self._inflight.get(key)
+            if en_curso is not None and en_curso[0] is asyncio.current_task():
+                del self._inflight[key]
 
-    def set(self, key: str, value, ttl: int = None):
+    @staticmethod
+    def _log_background_error(futuro):
+        if not futuro.cancelled() and futuro.exception() is not None:
+            print(f"ERROR_CACHE_COMPUTE: {futuro.exception()}")
+
+    def set_publisher(self, publisher):
+        self._publisher = publisher
+
+    # propagar=False se usa al aplicar invalidaciones que llegan de otro proceso
+    def invalidate_tag(self, *tags: str, propagar: bool = True):
+        with self._lock:
+            for tag in tags:
+                self._tag_gens[tag] = self._tag_gens.get(tag, 0) + 1
+            self._invalidations += len(tags)
+        if propagar and tags and self._publisher is not None:
+            self._publisher({"tags": list(tags)})
+
+    def invalidate(self, pattern: str = None, propagar: bool = True):
+        with self._lock:
+            self._epoch += 1
+            if pattern is None:
+                self._cache.clear()
+                self._bytes = 0
+            else:
+                keys_to_delete = [k for k in self._cache if pattern in k]
+                for k in keys_to_delete:
+                    self._remove(k)
+        if propagar and self._publisher is not None:
+            self._publisher({"pattern": pattern})
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                k for k, e in self._cache.items()
+                if e['stale_until'] <= now or not self._vigente(e)
+            ]
+            for k in expired:
+                self._remove(k)
+            self._expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "bytes": self._bytes,
+                "max_entries": self._max_entries,
+                "max_bytes": self._max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "stale_hits": self._stale_hits,
+                "inflight": len(self._inflight),
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "tag_invalidations": self._invalidations,
+                "tags": len(self._tag_gens),
+            }
+
+    def _store(self, key: str, value, ttl, stale_ttl, snapshot):
         if ttl is None:
             ttl = self._default_ttl
-        self._cache[key] = {'value': value, 'time': time.time(), 'ttl': ttl}
+        size = _estimar_tamano(key, value)
 
-    def invalidate(self, pattern: str = None):
-        if pattern is None:
-            self._cache.clear()
-        else:
-            keys_to_delete = [k for k in self._cache if pattern in k]
-            for k in keys_to_delete:
-                del self._cache[k]
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+            if size > self._max_bytes:
+                return
+            expires = time.monotonic() + ttl
+            self._cache[key] = {
+                'value': value, 'expires': expires,
+                'stale_until': expires + stale_ttl, 'size': size, 'tags': snapshot
+            }
+            self._bytes += size
+            self._evict()
+
+        self._ensure_sweeper()
+
+    # Los siguientes métodos deben llamarse con el lock tomado
+
+    def _snapshot(self, tags) -> tuple:
+        return tuple((tag, self._tag_gens.get(tag, 0)) for tag in tags)
+
+    def _vigente(self, entry) -> bool:
+        return all(self._tag_gens.get(tag, 0) == gen for tag, gen in entry['tags'])
+
+    # Devuelve la entrada si no está invalidada ni fuera de su ventana stale
+    def _lookup(self, key: str):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if not self._vigente(entry):
+            self._remove(key)
+            return None
+        if entry['stale_until'] <= time.monotonic():
+            self._remove(key)
+            self._expirations += 1
+            return None
+        return entry
 
-count_cache = CountCache()
+    def _remove(self, key: str):
+        entry = self._cache.pop(key)
+        self._bytes -= entry['size']
+
+    def _evict(self):
+        while self._cache and (len(self._cache) > self._max_entries or self._bytes > self._max_bytes):
+            _, entry = self._cache.popitem(last=False)
+            self._bytes -= entry['size']
+            self._evictions += 1
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="count-cache-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self._sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"ERROR_CACHE_SWEEP: {e}")
+
+
+count_cache = CountCache(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", 2048)),
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", 32 * 1024 * 1024))
+)
 
 def generate_cache_key(prefix: str, **params) -> str:
     sorted_params = sorted(params.items())
     params_str = json.dumps(sorted_params, default=str)
     params_hash = hashlib.md5(params_str.encode()).hexdigest()[:8]
-    return f"{prefix}:{params_hash}"
\ No newline at end of file
+    return f"{prefix}:{params_hash}"
+
+
+def tag_nacional(coordinacion) -> str:
+    # Agregados de todo el país. Todo lo que no es '1' (administrativos) cuenta como médicos,
+    # igual que en las gráficas
+    return f"nacional:{'1' if coordinacion == '1' else '0'}"
+
+
+def tags_doctor(entidad=None, coordinacion=None, clues=None) -> list:
+    """
+    Etiquetas que deben invalidarse cuando cambia un doctor con estos datos. Solo las de su
+    entidad y su CLUES: los agregados nacionales se renuevan con su TTL (y el dashboard además
+    con "padron" en altas y bajas), así editar un doctor de un estado no vacía los de todos.
+    Un doctor sin entidad no cae en ninguna etiqueta estatal y sí invalida lo nacional.
+    """
+    tags = []
+    if entidad:
+        tags.append(f"entidad:{entidad}")
+    else:
+        tags.append(tag_nacional(coordinacion))
+    if clues:
+        tags.append(f"clues:{clues}")
+    return tags
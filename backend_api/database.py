@@ -1,5 +1,7 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -18,6 +20,19 @@ if not DATABASE_URL:
     print("ERROR: DATABASE_URL no está definida")
     sys.exit(1)
 
+
+def _url_async(url: str):
+    # asyncpg no entiende 'sslmode'; lo traducimos a su parámetro 'ssl'
+    url_obj = make_url(url).set(drivername="postgresql+asyncpg")
+    connect_args = {}
+    sslmode = url_obj.query.get("sslmode")
+    if sslmode:
+        url_obj = url_obj.difference_update_query(["sslmode"])
+        if sslmode != "disable":
+            connect_args["ssl"] = sslmode
+    return url_obj, connect_args
+
+
 try:
     engine = create_engine(
         DATABASE_URL,
@@ -39,6 +54,41 @@ try:
         finally:
             db.close()
 
+    # ── Capa asíncrona (asyncpg) para no bloquear el event loop ──
+    ASYNC_DATABASE_URL, _async_connect_args = _url_async(DATABASE_URL)
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=False,
+        pool_size=5,
+        max_overflow=10,
+        pool_timeout=30,
+        pool_recycle=1800,
+        pool_pre_ping=True,
+        connect_args=_async_connect_args
+    )
+
+    AsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
+    async def get_async_db():
+        async with AsyncSessionLocal() as db:
+            yield db
+
+    # Conexión asyncpg directa, fuera del pool (LISTEN/NOTIFY necesita una conexión dedicada)
+    async def connect_asyncpg():
+        import asyncpg
+        dsn = ASYNC_DATABASE_URL.set(drivername="postgresql").render_as_string(hide_password=False)
+        return await asyncpg.connect(dsn, **_async_connect_args)
+
+    # Para cálculos que corren fuera de la petición (hilos, refrescos de caché)
+    def run_with_session(fn, *args, **kwargs):
+        db = SessionLocal()
+        try:
+            return fn(db, *args, **kwargs)
+        finally:
+            db.close()
+
 except Exception as e:
     print(f"No pude conectar a la BD: {e}")
     sys.exit(1)
\ No newline at end of file
@@ -1,3 +1,5 @@
+import os
+import asyncio
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -6,6 +8,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from backend_api.config import initialize_firebase
 from backend_api.routers import doctores, auth, admin, reportes, graficas, archivos, catalogos
 from backend_api import api_peas
+from backend_api.services.cache_bus import cache_bus
+from backend_api.services import export_jobs, plantillas_service
+from backend_api.services.resumen_service import asegurar_resumen
+from backend_api.database import run_with_session
+from backend_api.migraciones import aplicar_migraciones
 
 app = FastAPI(title="API de Doctores IMSS Bienestar")
 
@@ -35,9 +42,39 @@ app.include_router(graficas.router)
 app.include_router(archivos.router)
 app.include_router(catalogos.router)
 
+async def preparar_bd():
+    # CREATE INDEX CONCURRENTLY y el llenado del resumen pueden tardar minutos en tablas
+    # grandes: corren después del arranque para no detener el servicio ni los health checks.
+    # Con MIGRACIONES_AL_ARRANCAR=0 se aplican solo con `python backend_api/migraciones.py`
+    if os.getenv("MIGRACIONES_AL_ARRANCAR", "1") != "0":
+        try:
+            await asyncio.to_thread(aplicar_migraciones)
+        except Exception as e:
+            print(f"ERROR_MIGRACIONES: {e}")
+    try:
+        await asyncio.to_thread(run_with_session, asegurar_resumen)
+    except Exception as e:
+        print(f"ERROR_RESUMEN: no se pudo preparar doctores_resumen: {e}")
+    try:
+        # Retoma las exportaciones que quedaron pendientes o huérfanas por un reinicio
+        await asyncio.to_thread(export_jobs.iniciar)
+    except Exception as e:
+        print(f"ERROR_EXPORT_JOBS: {e}")
+
 @app.on_event("startup")
 async def startup():
     initialize_firebase()
+    app.state.preparacion = asyncio.create_task(preparar_bd())
+    # Plantillas Excel de asistencia en memoria antes de la primera descarga
+    await asyncio.to_thread(plantillas_service.cargar)
+    # Con un solo worker se puede apagar con CACHE_BUS=0
+    if os.getenv("CACHE_BUS", "1") != "0":
+        await cache_bus.iniciar()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await cache_bus.detener()
+    export_jobs.detener()
 
 @app.get("/")
 async def root():
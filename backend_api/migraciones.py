@@ -0,0 +1,183 @@
+import sys
+import os
+import traceback
+from collections import namedtuple
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from sqlalchemy import text
+    from backend_api.database import engine
+    from backend_api import models
+except ImportError as e:
+    print(f"Error importando módulos: {e}")
+    sys.exit(1)
+
+# Un paso puede ser SQL, un Indice o una función que recibe la conexión (para pasos que
+# necesitan su propia transacción)
+# Índice creado con CONCURRENTLY; si una corrida anterior lo dejó inválido se borra y se recrea
+Indice = namedtuple("Indice", ["nombre", "sql"])
+
+# Llave del advisory lock para que dos workers no migren al mismo tiempo
+LOCK_MIGRACIONES = 727100
+
+
+def _indice(nombre: str, tabla: str, columnas: str, where: str = "is_deleted = false") -> Indice:
+    condicion = f"WHERE {where}" if where else ""
+    return Indice(nombre, f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nombre} ON {tabla} ({columnas}) {condicion}")
+
+
+def _tabla(modelo):
+    """Paso que crea la tabla desde su modelo: el esquema se define solo en models.py."""
+    def crear(conn):
+        modelo.__table__.create(bind=conn, checkfirst=True)
+    return crear
+
+
+def _reconstruir_resumen(conn):
+    # LOCK TABLE necesita transacción y conn está en AUTOCOMMIT: se usa una sesión aparte
+    from backend_api.database import SessionLocal
+    from backend_api.services.resumen_service import reconstruir_resumen
+    models.DoctorResumen.__table__.create(bind=engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        reconstruir_resumen(db)
+    finally:
+        db.close()
+
+
+def _trigram(columna: str) -> Indice:
+    nombre = f"ix_doctores_{columna}_trgm"
+    return Indice(nombre, f"""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS {nombre}
+        ON doctores USING gin ({columna} gin_trgm_ops)
+        WHERE is_deleted = false
+    """)
+
+
+# Migraciones que pueden fallar sin detener las siguientes: no se registran y se reintentan en el
+# próximo arranque. pg_trgm necesita un privilegio que en Postgres administrado el rol no suele tener
+OPCIONALES = {"0001_busqueda_trigram"}
+
+# Lista ordenada; nunca cambiar una migración ya publicada, agregar otra al final
+MIGRACIONES = [
+    ("0001_busqueda_trigram", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        _trigram("nombre"),
+        _trigram("apellido_paterno"),
+        _trigram("apellido_materno"),
+        _trigram("id_imss"),
+        _trigram("matrimonio_id"),
+        _trigram("clues"),
+    ]),
+    # Índices para los filtros reales de graficas, catalogos, reportes y doctores.
+    # Ver benchmark_indices.py para comparar los planes
+    ("0002_indices_filtros", [
+        # Dashboard, estadística, capacidad por entidad, conteos de /api/doctores
+        _indice("ix_doctores_coord_estatus_entidad", "doctores", "coordinacion, estatus, entidad"),
+        # Filtros dinámicos y reportes por entidad/unidad
+        _indice("ix_doctores_entidad_unidad", "doctores", "entidad, nombre_unidad"),
+        # Estadística agrupada y especialidades agrupadas
+        _indice("ix_doctores_coord_especialidad", "doctores", "coordinacion, especialidad, nivel_atencion"),
+        # Usuarios responsable_unidad (filtran por su CLUES)
+        _indice("ix_doctores_clues", "doctores", "clues"),
+        # Histórico de bajas por mes
+        _indice("ix_doctores_bajas_fecha", "doctores", "coordinacion, fecha_estatus",
+                where="is_deleted = false AND estatus = '06 BAJA'"),
+        # Alertas de vencimiento
+        _indice("ix_doctores_fecha_fin", "doctores", "fecha_fin",
+                where="is_deleted = false AND fecha_fin IS NOT NULL"),
+        # Historial por doctor en orden cronológico (asistencia, reportes)
+        _indice("ix_estatus_historico_doctor_fecha", "estatus_historico", "id_imss, fecha_inicio, id", where=None),
+        "ANALYZE doctores",
+        "ANALYZE estatus_historico",
+    ]),
+    # Cola de exportaciones en segundo plano (services/export_jobs.py)
+    ("0003_export_jobs", [
+        _tabla(models.ExportJob),
+        "CREATE INDEX IF NOT EXISTS ix_export_jobs_estado ON export_jobs (estado)",
+    ]),
+    # Borrado por periodo al volver a subir la asistencia de una quincena (asistencia_service)
+    ("0004_indice_peas_asistencia", [
+        _indice("ix_peas_asistencia_doctor_fecha", "peas_asistencia", "id_imss, fecha_hora", where=None),
+        "ANALYZE peas_asistencia",
+    ]),
+    # Formatos 3 y 4 nacionales: formatos aprobados de la quincena unidos a la bitácora por (entidad, quincena)
+    ("0005_indices_formatos_nacionales", [
+        _indice("ix_formatos_estatales_quincena_estado", "formatos_estatales_firmados", "quincena, estado, entidad", where=None),
+        _indice("ix_bitacora_estatal_entidad_quincena", "bitacora_estatal_validada", "entidad, quincena_validada", where=None),
+        "ANALYZE formatos_estatales_firmados",
+        "ANALYZE bitacora_estatal_validada",
+    ]),
+    # Resultado persistido de los formatos nacionales de quincenas finalizadas
+    ("0006_formatos_nacionales_cache", [
+        _tabla(models.FormatoNacionalCache),
+    ]),
+    # doctores_resumen distingue coordinacion NULL de '' (resumen_service.COORDINACION_NULA)
+    ("0007_resumen_coordinacion_nula", [
+        _reconstruir_resumen,
+    ]),
+]
+
+
+def _crear_indice(conn, indice: Indice):
+    invalido = conn.execute(text("""
+        SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE c.relname = :nombre AND NOT i.indisvalid
+    """), {"nombre": indice.nombre}).first()
+    if invalido:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {indice.nombre}"))
+    conn.execute(text(indice.sql))
+
+
+def _aplicar_paso(conn, paso):
+    if isinstance(paso, Indice):
+        _crear_indice(conn, paso)
+    elif callable(paso):
+        paso(conn)
+    else:
+        conn.execute(text(paso))
+
+
+def aplicar_migraciones() -> list:
+    """Aplica en orden las migraciones pendientes y devuelve las que se aplicaron."""
+    aplicadas_ahora = []
+    # CREATE INDEX CONCURRENTLY no puede correr dentro de una transacción
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": LOCK_MIGRACIONES})
+        try:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS schema_migraciones (
+                    version VARCHAR(100) PRIMARY KEY,
+                    aplicada_en TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """))
+            aplicadas = {r[0] for r in conn.execute(text("SELECT version FROM schema_migraciones"))}
+
+            for version, pasos in MIGRACIONES:
+                if version in aplicadas:
+                    continue
+                print(f"Aplicando migración {version}...")
+                try:
+                    for paso in pasos:
+                        _aplicar_paso(conn, paso)
+                except Exception as e:
+                    if version not in OPCIONALES:
+                        raise
+                    print(f"ADVERTENCIA_MIGRACIONES: se omitió {version}, se reintenta en el próximo arranque: {e}")
+                    continue
+                conn.execute(text("INSERT INTO schema_migraciones (version) VALUES (:v)"), {"v": version})
+                aplicadas_ahora.append(version)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_MIGRACIONES})
+
+    return aplicadas_ahora
+
+
+if __name__ == "__main__":
+    try:
+        aplicadas = aplicar_migraciones()
+        print(f"Listo, {len(aplicadas)} migraciones aplicadas" if aplicadas else "No había migraciones pendientes")
+    except Exception as e:
+        print(f"Error: {e}")
+        traceback.print_exc()
+        sys.exit(1)
@@ -163,6 +163,47 @@ class EntidadCupos(Base):
     maximo = Column(Integer, nullable=False, default=0)
 
 
+# Conteos precalculados de doctores no eliminados; lo mantiene services/resumen_service.py
+class DoctorResumen(Base):
+    __tablename__ = "doctores_resumen"
+
+    # Los NULL se guardan como '' para poder usarlos en la llave primaria
+    # (coordinacion NULL como resumen_service.COORDINACION_NULA)
+    entidad = Column(String(100), primary_key=True, default='')
+    coordinacion = Column(String(100), primary_key=True, default='')
+    estatus_code = Column(String(2), primary_key=True, default='')
+    nivel_atencion = Column(String(50), primary_key=True, default='')
+    sexo = Column(String(15), primary_key=True, default='')
+
+    total = Column(Integer, nullable=False, default=0)
+    activos = Column(Integer, nullable=False, default=0) # estatus = '01 ACTIVO'
+    no_baja = Column(Integer, nullable=False, default=0) # estatus != '06 BAJA'
+    cedulas_lic = Column(Integer, nullable=False, default=0) # no_baja con cédula de licenciatura válida
+    cedulas_esp = Column(Integer, nullable=False, default=0) # no_baja con cédula de especialidad válida
+
+
+class ExportJob(Base):
+    __tablename__ = "export_jobs"
+
+    id = Column(String(36), primary_key=True) # uuid4
+    tipo = Column(String(20), nullable=False) # general o dinamico
+    formato = Column(String(10), nullable=False) # xlsx, csv o parquet
+    parametros = Column(Text, nullable=True) # ReporteDinamicoRequest en JSON
+    estado = Column(String(20), nullable=False, default="pendiente", index=True) # pendiente, en_proceso, terminado, error
+    filas_escritas = Column(Integer, nullable=False, default=0)
+    filas_totales = Column(Integer, nullable=True)
+    ruta_archivo = Column(String(500), nullable=True)
+    nombre_archivo = Column(String(255), nullable=True)
+    error = Column(Text, nullable=True)
+    worker = Column(String(100), nullable=True) # host:pid que lo está generando
+
+    creado_por = Column(String(255), nullable=True)
+    creado_en = Column(DateTime(timezone=True), server_default=func.now())
+    iniciado_en = Column(DateTime(timezone=True), nullable=True)
+    terminado_en = Column(DateTime(timezone=True), nullable=True)
+    actualizado_en = Column(DateTime(timezone=True), nullable=True) # latido del worker
+
+
 class PeasAsistencia(Base):
     __tablename__ = "peas_asistencia"
 
@@ -257,3 +298,13 @@ class FormatoNacionalFirmado(Base):
     url_documento = Column(String(500), nullable=False)
     fecha_subida = Column(DateTime(timezone=True), server_default=func.now())
     subido_por = Column(String(100))
+
+
+class FormatoNacionalCache(Base):
+    # Filas de los Formatos 3/4 de una quincena o mes completo ya cerrado (todos los estatales
+    # APROBADOS y el nacional firmado). Ver services/formatos_nacionales_service.py
+    __tablename__ = "formatos_nacionales_cache"
+
+    quincena = Column(String(20), primary_key=True) # AAAA-MM-Qn o AAAA-MM-Qcompleto
+    datos = Column(Text, nullable=False) # filas agrupadas y ordenadas por médico en JSON
+    generado_en = Column(DateTime(timezone=True), server_default=func.now())
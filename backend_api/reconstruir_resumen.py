@@ -0,0 +1,36 @@
+import sys
+import os
+import traceback
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from sqlalchemy import create_engine
+    from backend_api.database import SessionLocal, engine
+    from backend_api.models import DoctorResumen
+    from backend_api.services.resumen_service import reconstruir_resumen
+except ImportError as e:
+    print(f"Error importando módulos: {e}")
+    sys.exit(1)
+
+# Recalcula doctores_resumen desde doctores. Correr después de cargas masivas
+# o de cualquier cambio hecho directo en la BD. `url` apunta a otra BD que la de DATABASE_URL.
+def reconstruir(url: str = None):
+    print("Reconstruyendo doctores_resumen...")
+    destino = create_engine(url) if url else engine
+    DoctorResumen.__table__.create(bind=destino, checkfirst=True)
+    db = SessionLocal(bind=destino)
+
+    try:
+        reconstruir_resumen(db)
+        filas = db.query(DoctorResumen).count()
+        print(f"Listo, {filas} filas en el resumen")
+    except Exception as e:
+        print(f"Error: {e}")
+        traceback.print_exc()
+    finally:
+        db.close()
+        if destino is not engine:
+            destino.dispose()
+
+if __name__ == "__main__":
+    reconstruir()
@@ -11,6 +11,8 @@ from .. import models, schemas, security
 from ..database import get_db as get_db_session
 from ..config import USER_TIMEZONE, SUPER_ADMIN_PIN_HASH, Generic_pass, pwd_context
 from ..services.audit_service import log_action
+from ..cache import count_cache, tags_doctor
+from ..services import resumen_service, admision
 
 router = APIRouter()
 
@@ -226,6 +228,22 @@ async def leer_acciones_unicas_auditoria(
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+# ── CACHÉ ──
+
+@router.get("/api/admin/cache/stats", tags=["Admin - Caché"])
+async def leer_estadisticas_cache(
+    current_admin: models.User = Depends(security.get_current_admin_user)
+):
+    return count_cache.stats()
+
+
+@router.get("/api/admin/admision/stats", tags=["Admin - Caché"])
+async def leer_estadisticas_admision(
+    current_admin: models.User = Depends(security.get_current_admin_user)
+):
+    return admision.stats()
+
+
 # ── DOCTORES ELIMINADOS / RESTAURAR ──
 
 @router.get("/api/admin/doctores/eliminados", response_model=schemas.DoctoresPaginados, tags=["Admin - Auditoría"])
@@ -283,10 +301,14 @@ async def restaurar_doctor(
     try:
         db_doctor.is_deleted = False
         db_doctor.deleted_at = None
+        resumen_service.registrar_cambio(db, None, resumen_service.snapshot(db_doctor))
         log_action(db, current_admin, "Restaurar Registro", "Doctor", id_imss,
                    f"Registro restaurado: {db_doctor.nombre} (ID: {db_doctor.id_imss})")
         db.commit()
         db.refresh(db_doctor)
+        count_cache.invalidate_tag(
+            "padron", *tags_doctor(db_doctor.entidad, db_doctor.coordinacion, db_doctor.clues)
+        )
         return db_doctor
     except Exception as e:
         db.rollback()
@@ -1,16 +1,14 @@
 import traceback
-import urllib.parse
-from datetime import timedelta
 from typing import List
 
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-import firebase_admin
-from firebase_admin import storage
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models, schemas, security
-from ..database import get_db as get_db_session
-from ..services.firebase_service import upload_to_firebase, delete_from_firebase
+from ..database import get_db as get_db_session, get_async_db
+from ..services.archivos_service import subir_archivo, borrar_archivo, url_firmada, urls_firmadas
 
 router = APIRouter(tags=["Doctores - Archivos"])
 
@@ -27,7 +25,7 @@ async def subir_foto_perfil_doctor(
         raise HTTPException(status_code=404, detail="Doctor no encontrado")
 
     if db_doctor.foto_url:
-        await delete_from_firebase(db_doctor.foto_url)
+        await borrar_archivo(db_doctor.foto_url)
         db_doctor.foto_url = None
         try:
             db.commit()
@@ -35,7 +33,7 @@ async def subir_foto_perfil_doctor(
             db.rollback()
 
     destination_path = f"doctors/{id_imss}/profile_pictures"
-    file_url = await upload_to_firebase(file, destination_path, optimize_image=True)
+    file_url = await subir_archivo(file, destination_path, optimize_image=True)
 
     if not file_url:
         raise HTTPException(status_code=500, detail="Error al subir la foto de perfil.")
@@ -71,7 +69,7 @@ async def subir_expediente_doctor(
         raise HTTPException(status_code=404, detail="Doctor no encontrado.")
 
     destination_path = f"doctors/{id_imss}/attachments"
-    file_url = await upload_to_firebase(file, destination_path, optimize_image=False)
+    file_url = await subir_archivo(file, destination_path, optimize_image=False)
 
     if not file_url:
         raise HTTPException(status_code=500, detail="Error al subir el expediente.")
@@ -98,7 +96,7 @@ async def subir_expediente_doctor(
         db.rollback()
         traceback.print_exc()
         if file_url:
-            await delete_from_firebase(file_url)
+            await borrar_archivo(file_url)
         raise HTTPException(status_code=500, detail="Error al guardar el expediente en la BD.")
 
 
@@ -133,9 +131,9 @@ async def eliminar_expediente_doctor(
         raise HTTPException(status_code=404, detail="Expediente no encontrado.")
 
     file_url_to_delete = db_attachment.file_url
-    firebase_deleted = await delete_from_firebase(file_url_to_delete)
+    archivo_borrado = await borrar_archivo(file_url_to_delete)
 
-    if not firebase_deleted:
+    if not archivo_borrado:
         raise HTTPException(status_code=500, detail="Error al eliminar el archivo del almacenamiento.")
 
     try:
@@ -161,30 +159,37 @@ async def get_signed_url_for_attachment(
         raise HTTPException(status_code=404, detail="Archivo no encontrado.")
 
     try:
-        firebase_app = firebase_admin.get_app()
-        firebase_bucket = storage.bucket(app=firebase_app)
-        bucket_name = firebase_bucket.name
-        file_url = attachment.file_url
-
-        # Extraer ruta del objeto según el formato de URL
-        if '/o/' in file_url:
-            object_path = urllib.parse.unquote(file_url.split('/o/')[1].split('?')[0])
-        elif f'https://storage.googleapis.com/{bucket_name}/' in file_url:
-            object_path = file_url.split(f'https://storage.googleapis.com/{bucket_name}/', 1)[1]
-        elif file_url.startswith(f'gs://{bucket_name}/'):
-            object_path = file_url.replace(f'gs://{bucket_name}/', '', 1)
-        else:
-            object_path = file_url
-
-        blob = firebase_bucket.blob(object_path)
-        signed_url = blob.generate_signed_url(
-            expiration=timedelta(minutes=15),
-            method='GET',
-            version="v4"
-        )
+        # El backend resuelve la ruta del objeto aunque el registro guarde la URL completa
+        signed_url = await url_firmada(attachment.file_url)
         return {"signed_url": signed_url}
 
     except IndexError:
         raise HTTPException(status_code=500, detail="URL del archivo inválida.")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al generar URL firmada: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error al generar URL firmada: {str(e)}")
+
+
+@router.post("/api/attachments/signed-urls", response_model=schemas.SignedUrlsResponse)
+async def get_signed_urls_for_attachments(
+    req: schemas.SignedUrlsRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(security.get_current_user)
+):
+    # Todas las URL de una pantalla en una sola petición: una consulta (sesión asíncrona, no
+    # bloquea el event loop) y firmas en paralelo
+    query = select(models.DoctorAttachment.id, models.DoctorAttachment.file_url).where(
+        models.DoctorAttachment.id.in_(req.ids)
+    )
+    # Los expedientes de médicos fuera de la unidad o entidad del usuario regresan en null
+    rol_usuario = getattr(current_user, "rol", "")
+    if rol_usuario == "responsable_unidad":
+        query = query.join(models.Doctor, models.Doctor.id_imss == models.DoctorAttachment.doctor_id).where(
+            models.Doctor.clues == current_user.clues
+        )
+    elif rol_usuario == "coordinador_estatal":
+        query = query.join(models.Doctor, models.Doctor.id_imss == models.DoctorAttachment.doctor_id).where(
+            models.Doctor.entidad == current_user.entidad
+        )
+    archivos = dict((await db.execute(query)).all())
+    urls = await urls_firmadas(list(archivos.values()))
+    return {"signed_urls": {i: urls.get(archivos.get(i)) for i in req.ids}}
@@ -1,13 +1,17 @@
+import asyncio
 from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
-from sqlalchemy import distinct, func, or_, and_
+from sqlalchemy import distinct, func
 
 from .. import models, schemas, security
-from ..database import get_db as get_db_session
+from ..database import get_db as get_db_session, run_with_session
+from ..cache import count_cache, generate_cache_key, tag_nacional
+from ..services.resumen_service import resumen_disponible, activos_por_entidad
+from ..services import busqueda_service, admision
 
-router = APIRouter(tags=["Catálogos"])
+router = APIRouter(tags=["Catálogos"], dependencies=[Depends(admision.crud)])
 
 
 @router.get("/api/clues/{clues_code}", response_model=schemas.CluesData)
@@ -33,12 +37,16 @@ async def get_clues_data_with_capacity(clues_code: str, db: Session = Depends(ge
     if not cupo_info:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No hay datos de cupo para {entidad_de_clues}.")
 
-    conteo_actual = db.query(models.Doctor).filter(
-        models.Doctor.entidad == entidad_de_clues,
-        models.Doctor.is_deleted == False,
-        models.Doctor.estatus == '01 ACTIVO',
-        models.Doctor.coordinacion != '1'
-    ).count()
+    if resumen_disponible(db):
+        fila = activos_por_entidad(db, entidad_de_clues).first()
+        conteo_actual = fila.conteo if fila else 0
+    else:
+        conteo_actual = db.query(models.Doctor).filter(
+            models.Doctor.entidad == entidad_de_clues,
+            models.Doctor.is_deleted == False,
+            models.Doctor.estatus == '01 ACTIVO',
+            models.Doctor.coordinacion != '1'
+        ).count()
 
     return {
         "clues": clues_info.clues,
@@ -63,29 +71,30 @@ async def get_opciones_dinamicas(
     especialidad: Optional[str] = Query(None),
     nivel_atencion: Optional[str] = Query(None),
     estatus: Optional[str] = Query(None),
-    search: Optional[str] = Query(None),
-    db: Session = Depends(get_db_session)
+    search: Optional[str] = Query(None)
 ):
+    filtros = dict(
+        entidad=entidad, nombre_unidad=nombre_unidad, especialidad=especialidad,
+        nivel_atencion=nivel_atencion, estatus=estatus, search=search
+    )
+    cache_key = generate_cache_key("opciones_filtros", **filtros)
+    return await count_cache.get_or_compute(
+        cache_key,
+        lambda: asyncio.to_thread(run_with_session, _calcular_opciones_dinamicas, **filtros),
+        ttl=300, stale_ttl=120, tags=[tag_nacional('0')]
+    )
+
+
+def _calcular_opciones_dinamicas(db: Session, entidad, nombre_unidad, especialidad,
+                                 nivel_atencion, estatus, search):
     base_query = db.query(models.Doctor).filter(
         models.Doctor.is_deleted == False,
         models.Doctor.coordinacion == '0'
     )
 
-    if search and search.strip():
-        search_words = search.strip().split()
-        conditions = []
-        for word in search_words:
-            term = f"%{word}%"
-            conditions.append(
-                or_(
-                    models.Doctor.nombre.ilike(term),
-                    models.Doctor.apellido_paterno.ilike(term),
-                    models.Doctor.apellido_materno.ilike(term),
-                    models.Doctor.id_imss.ilike(term),
-                    models.Doctor.clues.ilike(term)
-                )
-            )
-        base_query = base_query.filter(and_(*conditions))
+    condicion = busqueda_service.condicion_busqueda(search, busqueda_service.CAMPOS_SIN_MATRIMONIO)
+    if condicion is not None:
+        base_query = base_query.filter(condicion)
 
     def get_distinct_values(field, exclude_filter=None):
         query = base_query
@@ -114,15 +123,26 @@ async def get_opciones_dinamicas(
 
 
 @router.get("/api/opciones/entidades-capacidad", response_model=List[schemas.EntidadCapacidad])
-async def get_entidades_con_capacidad(db: Session = Depends(get_db_session)):
-    conteo_actual_query = db.query(
-        models.Doctor.entidad,
-        func.count(models.Doctor.id_imss).label("conteo")
-    ).filter(
-        models.Doctor.is_deleted == False,
-        models.Doctor.estatus == '01 ACTIVO',
-        models.Doctor.coordinacion != '1'
-    ).group_by(models.Doctor.entidad).subquery()
+async def get_entidades_con_capacidad():
+    return await count_cache.get_or_compute(
+        "entidades_capacidad",
+        lambda: asyncio.to_thread(run_with_session, _calcular_entidades_con_capacidad),
+        ttl=60, stale_ttl=30, tags=[tag_nacional('0')]
+    )
+
+
+def _calcular_entidades_con_capacidad(db: Session):
+    if resumen_disponible(db):
+        conteo_actual_query = activos_por_entidad(db).subquery()
+    else:
+        conteo_actual_query = db.query(
+            models.Doctor.entidad,
+            func.count(models.Doctor.id_imss).label("conteo")
+        ).filter(
+            models.Doctor.is_deleted == False,
+            models.Doctor.estatus == '01 ACTIVO',
+            models.Doctor.coordinacion != '1'
+        ).group_by(models.Doctor.entidad).subquery()
 
     resultados = db.query(
         models.EntidadCupos.entidad,
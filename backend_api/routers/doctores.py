@@ -1,20 +1,50 @@
+import base64
+import binascii
 import calendar
+import json
 import traceback
 from datetime import date, datetime, timedelta, timezone
 from typing import List, Optional
 
 from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, or_, and_, select
 from sqlalchemy.exc import IntegrityError
 
 from .. import models, schemas, security
-from ..database import get_db as get_db_session
+from ..database import get_db as get_db_session, get_async_db
 from ..config import USER_TIMEZONE, MESES_ES
-from ..cache import count_cache, generate_cache_key
+from ..cache import count_cache, generate_cache_key, tag_nacional, tags_doctor
+from ..services import resumen_service, busqueda_service, admision
 from ..services.audit_service import log_action
 
-router = APIRouter(tags=["Doctores"])
+router = APIRouter(tags=["Doctores"], dependencies=[Depends(admision.crud)])
+
+
+# El cursor es opaco para el cliente: solo guarda el último id_imss de la página
+def _codificar_cursor(ultimo_id: str, relevancia: Optional[float] = None) -> str:
+    datos = {"id": ultimo_id}
+    if relevancia is not None:
+        datos["rel"] = relevancia
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode()
+
+
+def _decodificar_cursor(cursor: str, con_relevancia: bool = False):
+    """id_imss del último doctor, o (relevancia, id_imss) si la página venía de una búsqueda."""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        ultimo_id = datos["id"]
+        relevancia = datos["rel"] if con_relevancia else None
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+    if not isinstance(ultimo_id, str):
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+    if not con_relevancia:
+        return ultimo_id
+    if isinstance(relevancia, bool) or not isinstance(relevancia, (int, float)):
+        raise HTTPException(status_code=400, detail="Cursor inválido.")
+    return float(relevancia), ultimo_id
 
 
 @router.get("/api/doctores", response_model=schemas.DoctoresPaginados)
@@ -24,51 +54,49 @@ async def leer_doctores(
     search: Optional[str] = Query(None, min_length=1, max_length=100),
     estatus: Optional[str] = Query("01 ACTIVO", min_length=1, max_length=50),
     coordinacion: Optional[str] = Query("todos"),
-    db: Session = Depends(get_db_session),
+    cursor: Optional[str] = Query(None, max_length=512),
+    db: AsyncSession = Depends(get_async_db),
     current_user: models.User = Depends(security.get_current_user) # Exigimos usuario
 ):
-    query = db.query(models.Doctor).filter(models.Doctor.is_deleted == False)
+    # Cada página trae next_cursor desde la primera; `skip` queda solo para clientes viejos
+    if cursor and skip:
+        raise HTTPException(status_code=400, detail="Usar cursor o skip, no ambos.")
+
+    query = select(models.Doctor).where(models.Doctor.is_deleted == False)
     
     user_clues = "todas"
+    if coordinacion == "todos":
+        count_tags = [tag_nacional('0'), tag_nacional('1')]
+    else:
+        count_tags = [tag_nacional(coordinacion)]
     rol_usuario = getattr(current_user, "rol", "")
 
     if rol_usuario == "responsable_unidad":
         if not current_user.clues:
             raise HTTPException(status_code=403, detail="Tu usuario no tiene una CLUES asignada.")
         
-        query = query.filter(models.Doctor.clues == current_user.clues)
+        query = query.where(models.Doctor.clues == current_user.clues)
         user_clues = current_user.clues # Para el caché
+        count_tags = [f"clues:{current_user.clues}"]
 
     elif rol_usuario == "coordinador_estatal":
         if not current_user.entidad:
             raise HTTPException(status_code=403, detail="Tu usuario no tiene una Entidad asignada.")
         
-        query = query.filter(models.Doctor.entidad == current_user.entidad)
+        query = query.where(models.Doctor.entidad == current_user.entidad)
         user_clues = current_user.entidad # Para el caché
+        count_tags = [f"entidad:{current_user.entidad}"]
 
 
     if coordinacion != "todos":
-        query = query.filter(models.Doctor.coordinacion == coordinacion)
-
-    if search and search.strip():
-        search_words = search.strip().split()
-        for word in search_words:
-            term = f"%{word}%"
-            query = query.filter(
-                and_(
-                    or_(
-                        models.Doctor.nombre.ilike(term),
-                        models.Doctor.apellido_paterno.ilike(term),
-                        models.Doctor.apellido_materno.ilike(term),
-                        models.Doctor.id_imss.ilike(term),
-                        models.Doctor.matrimonio_id.ilike(term),
-                        models.Doctor.clues.ilike(term)
-                    )
-                )
-            )
+        query = query.where(models.Doctor.coordinacion == coordinacion)
+
+    condicion = busqueda_service.condicion_busqueda(search)
+    if condicion is not None:
+        query = query.where(condicion)
 
     if estatus and estatus.lower() != "todos":
-        query = query.filter(
+        query = query.where(
             func.upper(func.trim(models.Doctor.estatus)) == estatus.strip().upper()
         )
 
@@ -81,14 +109,50 @@ async def leer_doctores(
 
     if total_count is None:
         try:
-            total_count = query.count()
+            total_count = (await db.execute(
+                select(func.count()).select_from(query.subquery())
+            )).scalar_one()
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error al contar doctores: {str(e)}")
         if use_cache:
-            count_cache.set(count_key, total_count, ttl=300)
-
-    doctores = query.order_by(models.Doctor.id_imss).offset(skip).limit(limit).all()
-    return {"total_count": total_count, "doctores": doctores}
+            count_cache.set(count_key, total_count, ttl=300, tags=count_tags)
+
+    relevancias = None
+    if condicion is not None:
+        # Una búsqueda se ordena por (relevancia DESC, id_imss) y el cursor lleva ambos valores
+        relevancia = busqueda_service.relevancia(search)
+        query = query.add_columns(relevancia.label("relevancia"))
+        if cursor:
+            ultima_rel, ultimo_id = _decodificar_cursor(cursor, con_relevancia=True)
+            query = query.where(or_(
+                relevancia < ultima_rel,
+                and_(relevancia == ultima_rel, models.Doctor.id_imss > ultimo_id)
+            ))
+        else:
+            query = query.offset(skip)
+        query = query.order_by(relevancia.desc(), models.Doctor.id_imss)
+    elif cursor:
+        # Con cursor se busca directo en el índice de id_imss en vez de saltar `skip` filas
+        query = query.where(models.Doctor.id_imss > _decodificar_cursor(cursor)).order_by(models.Doctor.id_imss)
+    else:
+        query = query.order_by(models.Doctor.id_imss).offset(skip)
+
+    # Pedimos una fila de más para saber si hay otra página
+    result = await db.execute(query.limit(limit + 1))
+    if condicion is not None:
+        filas = result.all()
+        doctores = [f[0] for f in filas]
+        relevancias = [f.relevancia for f in filas]
+    else:
+        doctores = result.scalars().all()
+
+    next_cursor = None
+    if len(doctores) > limit:
+        doctores = doctores[:limit]
+        ultima_rel = float(relevancias[limit - 1]) if relevancias is not None else None
+        next_cursor = _codificar_cursor(doctores[-1].id_imss, ultima_rel)
+
+    return {"total_count": total_count, "doctores": doctores, "next_cursor": next_cursor}
 
 
 @router.get("/api/doctores/detalles_filtrados", response_model=List[schemas.DoctorDetalleItem])
@@ -119,21 +183,10 @@ async def obtener_detalles_doctores_filtrados(
     if estatus:
         query = query.filter(models.Doctor.estatus == estatus)
 
-    if search and search.strip():
-        search_words = search.strip().split()
-        for word in search_words:
-            term = f"%{word}%"
-            query = query.filter(
-                and_(
-                    or_(
-                        models.Doctor.clues.ilike(term),
-                        models.Doctor.id_imss.ilike(term),
-                        models.Doctor.nombre.ilike(term),
-                        models.Doctor.apellido_paterno.ilike(term),
-                        models.Doctor.apellido_materno.ilike(term)
-                    )
-                )
-            )
+    # La búsqueda solo filtra: este listado se sigue ordenando por nombre
+    condicion = busqueda_service.condicion_busqueda(search, busqueda_service.CAMPOS_SIN_MATRIMONIO)
+    if condicion is not None:
+        query = query.filter(condicion)
 
     doctores_filtrados = query.order_by(models.Doctor.nombre.asc()).all()
 
@@ -315,6 +368,7 @@ async def crear_doctor(
 
         db.add(nuevo_historial)
         db.flush()
+        resumen_service.registrar_cambio(db, None, resumen_service.snapshot(db_doctor))
 
         log_action(db, current_user, "Crear Registro", "Doctor", target_id_str=db_doctor.id_imss,
                    details=f"Doctor creado: {db_doctor.nombre}")
@@ -322,13 +376,9 @@ async def crear_doctor(
         db.refresh(db_doctor)
         db.refresh(nuevo_historial)
 
-        count_cache.invalidate("total_q")
-        count_cache.invalidate("universo_total")
-        count_cache.invalidate("doctores_count")
-        count_cache.invalidate("dashboard")
-        count_cache.invalidate("estadistica")
-        count_cache.invalidate("estadistica_count")
-        count_cache.invalidate("cedulas")
+        count_cache.invalidate_tag(
+            "padron", *tags_doctor(db_doctor.entidad, db_doctor.coordinacion, db_doctor.clues)
+        )
 
         doctor_completo = db.query(models.Doctor).options(
             selectinload(models.Doctor.historial)
@@ -395,6 +445,9 @@ async def actualizar_doctor_perfil_completo(
     original_estatus = db_doctor.estatus
     original_clues = db_doctor.clues
     original_turno = db_doctor.turno
+    # Se invalidan tanto las etiquetas de origen como las de destino
+    tags_originales = tags_doctor(db_doctor.entidad, db_doctor.coordinacion, db_doctor.clues)
+    resumen_antes = resumen_service.snapshot(db_doctor)
 
     update_data = doctor_update_data.model_dump(exclude_unset=True)
     changed_fields = []
@@ -487,18 +540,14 @@ async def actualizar_doctor_perfil_completo(
         details = f"Se actualizó: {db_doctor.nombre}: {', '.join(changed_fields)}." if changed_fields else "Sin cambios detectados."
         log_action(db=db, user=current_user, action_type="Actualizar Registro",
                    target_entity="Doctor", target_id_str=id_imss, details=details)
+        resumen_service.registrar_cambio(db, resumen_antes, resumen_service.snapshot(db_doctor))
 
         db.commit()
         db.refresh(db_doctor)
 
-        count_cache.invalidate("total_q")
-        count_cache.invalidate("doctores_count")
-        count_cache.invalidate("dashboard")
-        count_cache.invalidate("estadistica")
-        count_cache.invalidate("estadistica_count")
-        count_cache.invalidate("cedulas")
-        if cambio_estatus:
-            count_cache.invalidate("universo_total")
+        count_cache.invalidate_tag(
+            *set(tags_originales + tags_doctor(db_doctor.entidad, db_doctor.coordinacion, db_doctor.clues))
+        )
 
         return db_doctor
 
@@ -529,6 +578,7 @@ async def eliminar_doctor(
         raise HTTPException(status_code=404, detail="Doctor no encontrado o ya eliminado.")
 
     try:
+        resumen_service.registrar_cambio(db, resumen_service.snapshot(db_doctor), None)
         db_doctor.is_deleted = True
         db_doctor.deleted_at = datetime.now(timezone.utc)
         db_doctor.deleted_by_user_id = current_user.id
@@ -536,6 +586,9 @@ async def eliminar_doctor(
         log_action(db, current_user, "Eliminar Registro", "Doctor", target_id_str=id_imss,
                    details=f"Médico eliminado: {db_doctor.nombre} (ID: {db_doctor.id_imss})")
         db.commit()
+        count_cache.invalidate_tag(
+            "padron", *tags_doctor(db_doctor.entidad, db_doctor.coordinacion, db_doctor.clues)
+        )
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     except Exception as e:
         db.rollback()
@@ -662,7 +715,6 @@ async def crear_registro_historial(
     db.commit()
     db.refresh(nuevo_registro)
 
-    count_cache.invalidate("dashboard")
-    count_cache.invalidate("estadistica")
+    count_cache.invalidate_tag(*tags_doctor(db_doctor.entidad, db_doctor.coordinacion, db_doctor.clues))
 
     return nuevo_registro
\ No newline at end of file
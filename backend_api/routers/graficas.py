@@ -1,3 +1,4 @@
+import asyncio
 import traceback
 from typing import List, Optional
 
@@ -6,10 +7,12 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text, func
 
 from .. import models, schemas, security
-from ..database import get_db as get_db_session
-from ..cache import count_cache, generate_cache_key
+from ..database import get_db as get_db_session, AsyncSessionLocal, run_with_session
+from ..cache import count_cache, generate_cache_key, tag_nacional
+from ..services.dashboard_service import calcular_dashboard
+from ..services import admision
 
-router = APIRouter(tags=["Gráficas"])
+router = APIRouter(tags=["Gráficas"], dependencies=[Depends(admision.dashboard)])
 
 MESES_ES = {
     "Jan": "Ene", "Feb": "Feb", "Mar": "Mar", "Apr": "Abr",
@@ -20,152 +23,22 @@ MESES_ES = {
 
 @router.get("/api/dashboard/resumen_unificado")
 async def get_dashboard_unificado(
-    tipo: str = Query("medicos", enum=["medicos", "administrativos"]),
-    db: Session = Depends(get_db_session)
+    tipo: str = Query("medicos", enum=["medicos", "administrativos"])
 ):
     cache_key = generate_cache_key("dashboard_unificado", tipo=tipo)
-    cached_result = count_cache.get(cache_key)
-    if cached_result is not None:
-        return cached_result
-
-    filtro_coord = '1' if tipo == "administrativos" else '0'
-    condicion_sql = "coordinacion = '1'" if tipo == "administrativos" else "coordinacion != '1'"
-
-    # Conteo total
-    total_key = f"total_q:{tipo}"
-    total_q = count_cache.get(total_key)
-    if total_q is None:
-        total_q = db.query(func.count(models.Doctor.id_imss)).filter(
-            models.Doctor.is_deleted == False,
-            models.Doctor.coordinacion == filtro_coord,
-            models.Doctor.estatus != '06 BAJA'
-        ).scalar()
-        count_cache.set(total_key, total_q, ttl=600)
-
-    # Universo total
-    universo_key = "universo_total"
-    universo_total = count_cache.get(universo_key)
-    if universo_total is None:
-        universo_total = db.query(func.count(models.Doctor.id_imss)).filter(
-            models.Doctor.is_deleted == False
-        ).scalar()
-        count_cache.set(universo_key, universo_total, ttl=1800)
-
-    # Por estatus
-    estatus_map = {
-        '01': '01 ACTIVO', '02': '02 RETIRO TEMP. (CUBA)',
-        '03': '03 RETIRO TEMP. (MEXICO)', '04': '04 SOL. PERSONAL',
-        '05': '05 INCAPACIDAD', '06': '06 BAJA'
-    }
-    query_estatus = text(f"""
-        SELECT SUBSTRING(TRIM(UPPER(estatus)) FROM 1 FOR 2) as code, COUNT(*) as value
-        FROM doctores
-        WHERE estatus IS NOT NULL AND TRIM(estatus) != ''
-          AND {condicion_sql} AND is_deleted = false
-        GROUP BY code ORDER BY value DESC
-    """)
-    res_estatus = db.execute(query_estatus).all()
-    data_estatus = [
-        {"id": estatus_map.get(r.code, r.code), "label": estatus_map.get(r.code, r.code), "value": r.value}
-        for r in res_estatus
-    ]
-
-    # Nivel de atención
-    query_nivel = text(f"""
-        SELECT nivel_atencion as label, COUNT(*) as value
-        FROM doctores
-        WHERE nivel_atencion IS NOT NULL AND nivel_atencion != ''
-          AND estatus = '01 ACTIVO' AND {condicion_sql} AND is_deleted = false
-        GROUP BY nivel_atencion ORDER BY value DESC
-    """)
-    res_nivel = db.execute(query_nivel).all()
-    data_nivel = [{"label": r.label, "value": r.value} for r in res_nivel]
-
-    # Estados vs cupos
-    conteo_estados_sub = db.query(
-        models.Doctor.entidad,
-        func.count(models.Doctor.id_imss).label("conteo")
-    ).filter(
-        models.Doctor.is_deleted == False,
-        models.Doctor.estatus == '01 ACTIVO',
-        models.Doctor.coordinacion == filtro_coord
-    ).group_by(models.Doctor.entidad).subquery()
+    return await count_cache.get_or_compute(
+        cache_key, lambda: _dashboard_con_sesion(tipo), ttl=300, stale_ttl=120,
+        tags=["padron", _tag_tipo(tipo)]
+    )
 
-    res_estados = db.query(
-        models.EntidadCupos.entidad, models.EntidadCupos.minimo, models.EntidadCupos.maximo,
-        func.coalesce(conteo_estados_sub.c.conteo, 0).label("value")
-    ).outerjoin(conteo_estados_sub, models.EntidadCupos.entidad == conteo_estados_sub.c.entidad).all()
 
-    data_estados = [
-        {"label": r.entidad, "value": r.value, "minimo": r.minimo, "maximo": r.maximo}
-        for r in res_estados
-    ]
+def _tag_tipo(tipo: str) -> str:
+    return tag_nacional('1' if tipo == "administrativos" else '0')
 
-    # Cédulas licenciatura
-    cedulas_lic_key = f"cedulas_lic:{tipo}"
-    cedulas_licenciatura = count_cache.get(cedulas_lic_key)
-    if cedulas_licenciatura is None:
-        cedulas_licenciatura = db.query(func.count(models.Doctor.id_imss)).filter(
-            models.Doctor.is_deleted == False,
-            models.Doctor.coordinacion == filtro_coord,
-            models.Doctor.estatus != '06 BAJA',
-            models.Doctor.cedula_lic.isnot(None),
-            models.Doctor.cedula_lic != '',
-            models.Doctor.cedula_lic.not_ilike('%NULL%'),
-            models.Doctor.cedula_lic.not_ilike('%BAJA%'),
-            models.Doctor.cedula_lic.not_ilike('%TRAMITE%')
-        ).scalar()
-        count_cache.set(cedulas_lic_key, cedulas_licenciatura, ttl=600)
-
-    # Cédulas especialidad
-    cedulas_esp_key = f"cedulas_esp:{tipo}"
-    cedulas_especialidad = count_cache.get(cedulas_esp_key)
-    if cedulas_especialidad is None:
-        cedulas_especialidad = db.query(func.count(models.Doctor.id_imss)).filter(
-            models.Doctor.is_deleted == False,
-            models.Doctor.coordinacion == filtro_coord,
-            models.Doctor.estatus != '06 BAJA',
-            models.Doctor.cedula_esp.isnot(None),
-            models.Doctor.cedula_esp != '',
-            models.Doctor.cedula_esp.not_ilike('%NULL%'),
-            models.Doctor.cedula_esp.not_ilike('%BAJA%'),
-            models.Doctor.cedula_esp.not_ilike('%TRAMITE%')
-        ).scalar()
-        count_cache.set(cedulas_esp_key, cedulas_especialidad, ttl=600)
-
-    # Género
-    query_genero = text(f"""
-        SELECT sexo, COUNT(*) as total
-        FROM doctores
-        WHERE is_deleted = false AND {condicion_sql}
-          AND estatus != '06 BAJA' AND sexo IS NOT NULL
-        GROUP BY sexo
-    """)
-    res_genero = db.execute(query_genero).all()
-
-    total_mujeres = 0
-    total_hombres = 0
-    for r in res_genero:
-        valor = (r.sexo or '').strip().upper()
-        if valor in ('M', 'MUJER', 'FEMENINO', 'F'):
-            total_mujeres = r.total
-        elif valor in ('H', 'HOMBRE', 'MASCULINO', 'M'):
-            total_hombres = r.total
-
-    result = {
-        "total_general": total_q,
-        "universo_total": universo_total,
-        "data_estatus": data_estatus,
-        "data_nivel": data_nivel,
-        "data_estados": data_estados,
-        "cedulas_licenciatura": cedulas_licenciatura,
-        "cedulas_especialidad": cedulas_especialidad,
-        "total_mujeres": total_mujeres,
-        "total_hombres": total_hombres,
-    }
 
-    count_cache.set(cache_key, result, ttl=300)
-    return result
+async def _dashboard_con_sesion(tipo: str):
+    async with AsyncSessionLocal() as db:
+        return await calcular_dashboard(db, tipo)
 
 
 @router.get("/api/graficas/estadistica_doctores_agrupados", response_model=schemas.EstadisticaPaginada)
@@ -182,94 +55,101 @@ async def obtener_estadistica_doctores_agrupados(
     search: Optional[str] = None
 ):
     try:
-        filtro_coord = '1' if tipo == "administrativos" else '0'
-
-        use_cache = not search
-        cache_key = None
-        cached_result = None
-
-        if use_cache:
-            cache_key = generate_cache_key(
-                "estadistica", tipo=tipo, entidad=entidad, especialidad=especialidad,
-                nivel_atencion=nivel_atencion, nombre_unidad=nombre_unidad,
-                estatus=estatus, skip=skip, limit=limit
-            )
-            cached_result = count_cache.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-
-        base_query = db.query(models.Doctor).filter(
-            models.Doctor.is_deleted == False,
-            models.Doctor.coordinacion == filtro_coord
+        filtros = dict(
+            skip=skip, limit=limit, tipo=tipo, entidad=entidad, especialidad=especialidad,
+            nivel_atencion=nivel_atencion, nombre_unidad=nombre_unidad, estatus=estatus
         )
 
-        if entidad:
-            base_query = base_query.filter(models.Doctor.entidad == entidad)
-        if especialidad:
-            base_query = base_query.filter(models.Doctor.especialidad == especialidad)
-        if nivel_atencion:
-            base_query = base_query.filter(models.Doctor.nivel_atencion == nivel_atencion)
-        if nombre_unidad:
-            base_query = base_query.filter(models.Doctor.nombre_unidad == nombre_unidad)
-        if estatus:
-            base_query = base_query.filter(models.Doctor.estatus == estatus)
         if search:
-            base_query = base_query.filter(models.Doctor.clues.ilike(f"%{search}%"))
+            return _calcular_estadistica(db, search=search, **filtros)
 
-        total_personal = None
-        if use_cache:
-            count_key = generate_cache_key(
-                "estadistica_count", tipo=tipo, entidad=entidad, especialidad=especialidad,
-                nivel_atencion=nivel_atencion, nombre_unidad=nombre_unidad, estatus=estatus
-            )
-            total_personal = count_cache.get(count_key)
-
-        if total_personal is None:
-            total_personal = base_query.count()
-            if use_cache:
-                count_cache.set(count_key, total_personal, ttl=300)
-
-        columns_to_group = [
-            models.Doctor.entidad, models.Doctor.nombre_unidad, models.Doctor.clues,
-            models.Doctor.especialidad, models.Doctor.nivel_atencion
-        ]
-
-        total_grupos = db.query(func.count()).select_from(
-            base_query.with_entities(*columns_to_group).distinct().subquery()
-        ).scalar() or 0
-
-        query_result = base_query.with_entities(
-            *columns_to_group,
-            func.count(models.Doctor.id_imss).label("cantidad")
-        ).group_by(*columns_to_group).order_by(models.Doctor.entidad.asc()).offset(skip).limit(limit).all()
-
-        items_list = []
-        for row in query_result:
-            items_list.append({
-                "entidad": row.entidad or "N/A",
-                "nombre_unidad": row.nombre_unidad or "N/A",
-                "clues": row.clues or "N/A",
-                "especialidad": row.especialidad or "N/A",
-                "nivel_atencion": row.nivel_atencion or "N/A",
-                "cantidad": row.cantidad
-            })
-
-        result = {
-            "total_groups": total_grupos,
-            "total_doctors_in_groups": total_personal,
-            "items": items_list
-        }
-
-        if use_cache and cache_key:
-            count_cache.set(cache_key, result, ttl=300)
-
-        return result
+        cache_key = generate_cache_key("estadistica", **filtros)
+        return await count_cache.get_or_compute(
+            cache_key,
+            lambda: asyncio.to_thread(run_with_session, _calcular_estadistica, search=None, **filtros),
+            ttl=300, stale_ttl=60, tags=_tags_estadistica(tipo, entidad)
+        )
 
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Error interno en la consulta de estadísticas")
 
 
+# Con entidad filtrada basta la etiqueta de esa entidad; sin ella es un agregado nacional
+def _tags_estadistica(tipo: str, entidad: Optional[str]) -> list:
+    if entidad:
+        return [f"entidad:{entidad}"]
+    return [_tag_tipo(tipo)]
+
+
+def _calcular_estadistica(db: Session, skip, limit, tipo, entidad, especialidad,
+                          nivel_atencion, nombre_unidad, estatus, search):
+    filtro_coord = '1' if tipo == "administrativos" else '0'
+    use_cache = not search
+
+    base_query = db.query(models.Doctor).filter(
+        models.Doctor.is_deleted == False,
+        models.Doctor.coordinacion == filtro_coord
+    )
+
+    if entidad:
+        base_query = base_query.filter(models.Doctor.entidad == entidad)
+    if especialidad:
+        base_query = base_query.filter(models.Doctor.especialidad == especialidad)
+    if nivel_atencion:
+        base_query = base_query.filter(models.Doctor.nivel_atencion == nivel_atencion)
+    if nombre_unidad:
+        base_query = base_query.filter(models.Doctor.nombre_unidad == nombre_unidad)
+    if estatus:
+        base_query = base_query.filter(models.Doctor.estatus == estatus)
+    if search:
+        base_query = base_query.filter(models.Doctor.clues.ilike(f"%{search}%"))
+
+    total_personal = None
+    if use_cache:
+        count_key = generate_cache_key(
+            "estadistica_count", tipo=tipo, entidad=entidad, especialidad=especialidad,
+            nivel_atencion=nivel_atencion, nombre_unidad=nombre_unidad, estatus=estatus
+        )
+        total_personal = count_cache.get(count_key)
+
+    if total_personal is None:
+        total_personal = base_query.count()
+        if use_cache:
+            count_cache.set(count_key, total_personal, ttl=300, tags=_tags_estadistica(tipo, entidad))
+
+    columns_to_group = [
+        models.Doctor.entidad, models.Doctor.nombre_unidad, models.Doctor.clues,
+        models.Doctor.especialidad, models.Doctor.nivel_atencion
+    ]
+
+    total_grupos = db.query(func.count()).select_from(
+        base_query.with_entities(*columns_to_group).distinct().subquery()
+    ).scalar() or 0
+
+    query_result = base_query.with_entities(
+        *columns_to_group,
+        func.count(models.Doctor.id_imss).label("cantidad")
+    ).group_by(*columns_to_group).order_by(models.Doctor.entidad.asc()).offset(skip).limit(limit).all()
+
+    items_list = []
+    for row in query_result:
+        items_list.append({
+            "entidad": row.entidad or "N/A",
+            "nombre_unidad": row.nombre_unidad or "N/A",
+            "clues": row.clues or "N/A",
+            "especialidad": row.especialidad or "N/A",
+            "nivel_atencion": row.nivel_atencion or "N/A",
+            "cantidad": row.cantidad
+        })
+
+    return {
+        "total_groups": total_grupos,
+        "total_doctors_in_groups": total_personal,
+        "items": items_list
+    }
+
+
 @router.get("/api/graficas/especialidades_agrupadas", response_model=List[schemas.EspecialidadAgrupada])
 async def obtener_especialidades_agrupadas(
     db: Session = Depends(get_db_session),
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, model_validator, EmailStr
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 from datetime import date, datetime
 
 
@@ -237,6 +237,7 @@ class UserChangePassword(BaseModel):
 class DoctoresPaginados(BaseModel):
     total_count: int
     doctores: List[Doctor]
+    next_cursor: Optional[str] = None
 
 
 class DataGraficaItem(BaseModel):
@@ -383,6 +384,28 @@ class ReporteDinamicoRequest(BaseModel):
     estatus: Optional[str] = None
     columnas: List[str]
     mes_evaluacion: Optional[str] = None
+    formato: Optional[str] = "xlsx" # xlsx, csv o parquet
+
+
+class ExportJobCreate(BaseModel):
+    tipo: str = "dinamico" # general o dinamico
+    formato: str = "xlsx"
+    reporte: Optional[ReporteDinamicoRequest] = None # requerido si tipo es dinamico
+
+
+class ExportJobEstado(BaseModel):
+    id: str
+    tipo: str
+    formato: str
+    estado: str
+    filas_escritas: int
+    filas_totales: Optional[int] = None
+    porcentaje: Optional[float] = None
+    eta_segundos: Optional[float] = None
+    error: Optional[str] = None
+    creado_en: Optional[datetime] = None
+    terminado_en: Optional[datetime] = None
+    url_descarga: Optional[str] = None
 
 
 class OpcionesFiltro(BaseModel):
@@ -441,6 +464,15 @@ class SignedUrlResponse(BaseModel):
     signed_url: str
 
 
+class SignedUrlsRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=500)
+
+
+class SignedUrlsResponse(BaseModel):
+    # None si el expediente no existe o no se pudo firmar
+    signed_urls: Dict[int, Optional[str]]
+
+
 class RegistroAsistenciaPeas(BaseModel):
     id_imss: str
     tipo: str
@@ -6,11 +6,9 @@ from passlib.context import CryptContext
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
-from .database import get_db
+from sqlalchemy import or_, func, select
+from .database import AsyncSessionLocal
 from . import models
-from . import schemas
 
 load_dotenv()
 
@@ -40,10 +38,7 @@ def create_access_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
@@ -57,17 +52,25 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(models.User).filter(
-        func.lower(models.User.username) == func.lower(username)
-    ).first()
-
-    if user is None:
-        user = db.query(models.UsuarioAcceso).filter(
-            or_(
-                func.lower(models.UsuarioAcceso.correo) == func.lower(username),
-                func.lower(models.UsuarioAcceso.id_imss) == func.lower(username)
+    # Sesión propia y corta: la conexión vuelve al pool antes de que corra el handler
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(models.User).where(
+                func.lower(models.User.username) == func.lower(username)
+            ).limit(1)
+        )
+        user = result.scalars().first()
+
+        if user is None:
+            result = await db.execute(
+                select(models.UsuarioAcceso).where(
+                    or_(
+                        func.lower(models.UsuarioAcceso.correo) == func.lower(username),
+                        func.lower(models.UsuarioAcceso.id_imss) == func.lower(username)
+                    )
+                ).limit(1)
             )
-        ).first()
+            user = result.scalars().first()
 
     # Si no existe en ninguna de las dos tablas, bloqueamos
     if user is None:
@@ -0,0 +1,151 @@
+import os
+import math
+import time
+import asyncio
+from typing import AsyncIterator, Iterable
+
+from fastapi import HTTPException, status
+from starlette.concurrency import iterate_in_threadpool
+
+# Control de admisión por clase de endpoint. Cada clase tiene un semáforo (cuántas peticiones
+# corren a la vez) y una cola acotada; si la cola está llena, o la espera pasa del máximo,
+# se responde 429 con Retry-After. Así unas cuantas exportaciones pesadas no se acaban el
+# pool de conexiones (5+10 en database.py) ni la memoria del worker, y el tráfico
+# interactivo conserva su latencia porque tiene su propio cupo.
+
+
+class Limitador:
+    def __init__(self, nombre: str, concurrencia: int, cola: int, espera_max: float):
+        self.nombre = nombre
+        self.concurrencia = concurrencia
+        self.cola = cola
+        self.espera_max = espera_max
+        self._semaforo = asyncio.Semaphore(concurrencia)
+        self._esperando = 0
+        self._activos = 0
+        self._duracion_media = 1.0 # segundos, promedio móvil de cuánto se ocupa un lugar
+        self._rechazos = 0
+
+    def _retry_after(self) -> int:
+        turnos = (self._esperando + 1) / self.concurrencia
+        return max(1, math.ceil(self._duracion_media * turnos))
+
+    def _rechazar(self, detalle: str):
+        self._rechazos += 1
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detalle,
+            headers={"Retry-After": str(self._retry_after())},
+        )
+
+    async def entrar(self) -> "Permiso":
+        """Espera un lugar; el llamador debe liberar el permiso que se devuelve."""
+        if self._semaforo.locked() and self._esperando >= self.cola:
+            self._rechazar("El servidor está ocupado, intente de nuevo en unos momentos.")
+        self._esperando += 1
+        try:
+            adquirido = await self._adquirir()
+        finally:
+            self._esperando -= 1
+        if not adquirido:
+            self._rechazar("Se agotó el tiempo de espera en la cola, intente de nuevo.")
+        self._activos += 1
+        return Permiso(self)
+
+    async def _adquirir(self) -> bool:
+        """Espera un lugar hasta espera_max; True si lo obtuvo. Nunca deja un lugar tomado sin dueño."""
+        tarea = asyncio.ensure_future(self._semaforo.acquire())
+        try:
+            await asyncio.wait({tarea}, timeout=self.espera_max)
+        except BaseException:
+            # Cancelaron la petición mientras esperaba: si el lugar ya se concedió se devuelve
+            if await self._cancelar(tarea):
+                self._semaforo.release()
+            raise
+        # Si el lugar se concedió justo al vencer el plazo, se usa en vez de perderlo
+        return await self._cancelar(tarea)
+
+    @staticmethod
+    async def _cancelar(tarea) -> bool:
+        """Cancela la espera si sigue pendiente; True si el semáforo alcanzó a conceder el lugar."""
+        if not tarea.done():
+            tarea.cancel()
+        try:
+            await tarea
+            return True
+        except asyncio.CancelledError:
+            return False
+
+    def _salir(self, inicio: float):
+        self._activos -= 1
+        self._duracion_media = 0.8 * self._duracion_media + 0.2 * (time.monotonic() - inicio)
+        self._semaforo.release()
+
+    async def __call__(self):
+        # Dependencia de FastAPI: el lugar se libera cuando termina el endpoint
+        permiso = await self.entrar()
+        try:
+            yield
+        finally:
+            permiso.liberar()
+
+    def stats(self) -> dict:
+        return {
+            "concurrencia": self.concurrencia,
+            "cola": self.cola,
+            "activos": self._activos,
+            "esperando": self._esperando,
+            "rechazos": self._rechazos,
+            "duracion_media_s": round(self._duracion_media, 3),
+        }
+
+
+class Permiso:
+    """Lugar tomado en un Limitador; `liberar` se puede llamar más de una vez."""
+
+    def __init__(self, limitador: Limitador):
+        self._limitador = limitador
+        self._inicio = time.monotonic()
+        self._liberado = False
+
+    def liberar(self):
+        if not self._liberado:
+            self._liberado = True
+            self._limitador._salir(self._inicio)
+
+    async def aliberar(self):
+        self.liberar()
+
+    async def transmitir(self, trozos: Iterable[bytes]) -> AsyncIterator[bytes]:
+        """
+        Para StreamingResponse: el trabajo ocurre mientras se envía el cuerpo, después de que el
+        endpoint regresó, así que el lugar se libera al terminar o cortarse el envío.
+        """
+        try:
+            async for trozo in iterate_in_threadpool(iter(trozos)):
+                yield trozo
+        finally:
+            self.liberar()
+
+
+def _desde_env(clase: str, concurrencia: int, cola: int, espera_max: float) -> Limitador:
+    prefijo = f"ADMISION_{clase.upper()}"
+    return Limitador(
+        clase,
+        int(os.getenv(f"{prefijo}_CONCURRENCIA", concurrencia)),
+        int(os.getenv(f"{prefijo}_COLA", cola)),
+        float(os.getenv(f"{prefijo}_ESPERA", espera_max)),
+    )
+
+
+# Las exportaciones ocupan una conexión del pool síncrono durante todo el envío
+exportacion = _desde_env("export", concurrencia=2, cola=4, espera_max=60)
+# El dashboard usa el engine asíncrono, que tiene su propio pool
+dashboard = _desde_env("dashboard", concurrencia=10, cola=40, espera_max=10)
+crud = _desde_env("crud", concurrencia=10, cola=50, espera_max=10)
+
+LIMITADORES = (exportacion, dashboard, crud)
+
+
+def stats() -> dict:
+    return {l.nombre: l.stats() for l in LIMITADORES}
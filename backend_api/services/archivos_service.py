@@ -0,0 +1,89 @@
+import os
+import re
+import uuid
+import asyncio
+import gc
+from io import BytesIO
+from typing import Dict, List, Optional
+
+from fastapi import UploadFile
+from PIL import Image
+
+from . import storage
+
+# Fotos y expedientes de doctores. El destino lo decide storage.expedientes
+# (Firebase en producción, local o memoria para pruebas).
+
+
+async def subir_archivo(file: UploadFile, destination_path: str, optimize_image: bool = False) -> Optional[str]:
+    try:
+        filename_base, file_extension = os.path.splitext(file.filename)
+        safe_filename_base = re.sub(r"[^a-zA-Z0-9_\-]", "_", filename_base)
+        unique_filename = f"{uuid.uuid4()}_{safe_filename_base}{file_extension}"
+        blob_path = f"{destination_path.strip('/')}/{unique_filename}"
+
+        if not (optimize_image and file.content_type and 'image' in file.content_type):
+            return await storage.expedientes.put(blob_path, file.file, file.content_type)
+
+        return await _optimizar_y_subir_imagen(file, blob_path)
+
+    except Exception as e:
+        print(f"ERROR: {e}")
+        return None
+
+
+async def _optimizar_y_subir_imagen(file: UploadFile, blob_path: str) -> Optional[str]:
+    MAX_MEMORIA = 20 * 1024 * 1024
+    chunks = []
+    total = 0
+    while True:
+        chunk = await file.read(1024 * 1024)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > MAX_MEMORIA:
+            file.file.seek(0)
+            return await storage.expedientes.put(blob_path, file.file, file.content_type)
+        chunks.append(chunk)
+
+    image_data = b''.join(chunks)
+    del chunks
+
+    try:
+        output = await asyncio.to_thread(_reducir_imagen, image_data)
+    except Exception:
+        file.file.seek(0)
+        return await storage.expedientes.put(blob_path, file.file, file.content_type)
+    finally:
+        del image_data
+
+    try:
+        return await storage.expedientes.put(blob_path, output, "image/jpeg")
+    finally:
+        output.close()
+        gc.collect()
+
+
+def _reducir_imagen(image_data: bytes) -> BytesIO:
+    img = Image.open(BytesIO(image_data))
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    img.thumbnail((800, 800))
+
+    output = BytesIO()
+    img.save(output, format="JPEG", quality=70, optimize=True)
+    img.close()
+    output.seek(0)
+    return output
+
+
+async def borrar_archivo(file_path_in_storage: str) -> bool:
+    return await storage.expedientes.try_delete(file_path_in_storage)
+
+
+async def url_firmada(file_url: str, expira: int = 15 * 60) -> str:
+    return await storage.expedientes.presign(file_url, expira)
+
+
+async def urls_firmadas(file_urls: List[str], expira: int = 15 * 60) -> Dict[str, Optional[str]]:
+    return await storage.expedientes.presign_muchos(file_urls, expira)
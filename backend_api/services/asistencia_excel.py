@@ -0,0 +1,126 @@
+from calendar import monthrange
+from collections import namedtuple
+from datetime import date
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+# Lectura del Excel de asistencia PEAS (plantilla formato_asistencias.xlsx), compartida por la
+# previsualización y la carga. Todo se hace por columna: fechas, validación del periodo y
+# conversión de horas locales a UTC, sin recorrer el DataFrame fila por fila.
+
+COL_FECHA = 'FECHA (DD/MM/AAAA)'
+COL_TURNO = 'TIPO_TURNO'
+COL_ENTRADA = 'HORA_ENTRADA (HH:MM)'
+COL_SALIDA = 'HORA_SALIDA (HH:MM)'
+COL_OBSERVACIONES = 'OBSERVACIONES'
+
+SIN_HORA = "--:--"
+ZONA_LOCAL = 'America/Mexico_City'
+
+# Columnas alineadas (un elemento por fila con fecha); entrada_utc/salida_utc son datetimes
+# naive en UTC, NaT si no hay hora
+AsistenciaExcel = namedtuple("AsistenciaExcel", [
+    "fechas", "turnos", "entradas", "salidas", "observaciones",
+    "entrada_utc", "salida_utc", "dias_validos",
+])
+
+
+class ErrorExcel(ValueError):
+    """Filas que no pasan la validación; el mensaje ya trae todas para mostrarlas de una vez."""
+
+
+def periodo(anio: int, mes: int, quincena: int):
+    fecha_ini = date(anio, mes, 1) if quincena == 1 else date(anio, mes, 16)
+    fecha_fin = date(anio, mes, 15) if quincena == 1 else date(anio, mes, monthrange(anio, mes)[1])
+    return fecha_ini, fecha_fin
+
+
+def _columna(df: pd.DataFrame, nombre: str) -> pd.Series:
+    return df[nombre] if nombre in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+def _texto(columna: pd.Series, vacio: str) -> pd.Series:
+    texto = columna.astype(object).where(columna.notna(), "").astype(str).str.strip()
+    return texto.mask(texto == "", vacio)
+
+
+def _a_utc(fechas: pd.Series, horas: pd.Series):
+    """Combina fecha y HH:MM (hora local) y devuelve (datetimes UTC naive, máscara de horas inválidas)."""
+    con_hora = horas != SIN_HORA
+    texto = fechas.dt.strftime('%Y-%m-%d') + " " + horas.str[:5]
+    local = pd.to_datetime(texto.where(con_hora), format='%Y-%m-%d %H:%M', errors='coerce')
+    invalidas = con_hora & local.isna()
+    # Mismo criterio que pytz.localize (is_dst=False): las horas ambiguas y las que no existen
+    # (salto de 1 h al entrar el horario de verano) se toman con el desfase de horario estándar
+    utc = (local.dt.tz_localize(ZONA_LOCAL, ambiguous=np.zeros(len(local), dtype=bool), nonexistent=pd.Timedelta(hours=1))
+           .dt.tz_convert('UTC').dt.tz_localize(None))
+    return utc, invalidas
+
+
+def _filas(mascara: pd.Series) -> list:
+    # +2: encabezado y filas de Excel numeradas desde 1
+    return [int(i) + 2 for i in mascara[mascara].index]
+
+
+def leer_asistencia(contenido: bytes, anio: int, mes: int, quincena: int) -> AsistenciaExcel:
+    fecha_ini, fecha_fin = periodo(anio, mes, quincena)
+
+    df = pd.read_excel(BytesIO(contenido))
+    df = df.dropna(how='all')
+    df = df[_columna(df, COL_FECHA).notna()]
+
+    fechas = pd.to_datetime(df[COL_FECHA] if COL_FECHA in df.columns else pd.Series(dtype=object),
+                            dayfirst=True, format='mixed', errors='coerce').dt.normalize()
+    entradas = _texto(_columna(df, COL_ENTRADA), SIN_HORA)
+    salidas = _texto(_columna(df, COL_SALIDA), SIN_HORA)
+
+    errores = []
+    sin_fecha = fechas.isna()
+    if sin_fecha.any():
+        errores.append(f"Fecha inválida en fila(s) {', '.join(map(str, _filas(sin_fecha)))}.")
+    fuera = ~sin_fecha & ((fechas < pd.Timestamp(fecha_ini)) | (fechas > pd.Timestamp(fecha_fin)))
+    if fuera.any():
+        detalle = ", ".join(f"{fila} ({f:%d/%m/%Y})" for fila, f in zip(_filas(fuera), fechas[fuera]))
+        errores.append(
+            f"Las fechas de las filas {detalle} no pertenecen a la Quincena {quincena} del mes {mes}/{anio}."
+        )
+
+    entrada_utc, entrada_invalida = _a_utc(fechas, entradas)
+    salida_utc, salida_invalida = _a_utc(fechas, salidas)
+    hora_invalida = ~sin_fecha & (entrada_invalida | salida_invalida)
+    if hora_invalida.any():
+        errores.append(f"Hora con formato distinto de HH:MM en fila(s) {', '.join(map(str, _filas(hora_invalida)))}.")
+
+    if errores:
+        raise ErrorExcel("Error en el Excel: " + " ".join(errores) + " Por favor, corrige el Excel.")
+
+    return AsistenciaExcel(
+        fechas=fechas.dt.strftime('%Y-%m-%d').to_numpy(),
+        turnos=_texto(_columna(df, COL_TURNO), 'No especificado').to_numpy(),
+        entradas=entradas.to_numpy(),
+        salidas=salidas.to_numpy(),
+        observaciones=_texto(_columna(df, COL_OBSERVACIONES), "").to_numpy(),
+        entrada_utc=entrada_utc.to_numpy(),
+        salida_utc=salida_utc.to_numpy(),
+        dias_validos=int(((entradas != SIN_HORA) | (salidas != SIN_HORA)).sum()),
+    )
+
+
+def detalle(asistencia: AsistenciaExcel) -> list:
+    """Filas para la previsualización, con el mismo formato que se mostraba antes."""
+    return [
+        {"fecha": f, "turno": t, "entrada": e, "salida": s, "observaciones": o}
+        for f, t, e, s, o in zip(asistencia.fechas, asistencia.turnos, asistencia.entradas,
+                                 asistencia.salidas, asistencia.observaciones)
+    ]
+
+
+def marcajes(asistencia: AsistenciaExcel) -> list:
+    """[(tipo, fecha_hora UTC)] de las entradas y salidas registradas."""
+    resultado = []
+    for tipo, columna in (("Entrada", asistencia.entrada_utc), ("Salida", asistencia.salida_utc)):
+        validos = columna[~pd.isna(columna)]
+        resultado.extend((tipo, ts) for ts in pd.to_datetime(validos).to_pydatetime())
+    return resultado
@@ -0,0 +1,66 @@
+import csv
+import io
+from datetime import date, datetime, time, timedelta
+from typing import Iterable
+
+import pytz
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from .. import models
+from .asistencia_excel import ZONA_LOCAL
+
+# Escritura de marcajes PEAS: borrado del periodo por rango (usa ix_peas_asistencia_doctor_fecha)
+# e inserción con un solo COPY, ambos dentro de la transacción de la sesión.
+
+_COPY_SQL = "COPY peas_asistencia (id_imss, tipo, fecha_hora) FROM STDIN WITH (FORMAT csv)"
+
+
+def limites_utc(fecha_ini: date, fecha_fin: date):
+    """[inicio, fin) del periodo en UTC, tomando los días en hora local como los captura el Excel."""
+    zona = pytz.timezone(ZONA_LOCAL)
+    inicio = zona.localize(datetime.combine(fecha_ini, time.min)).astimezone(pytz.utc)
+    fin = zona.localize(datetime.combine(fecha_fin + timedelta(days=1), time.min)).astimezone(pytz.utc)
+    return inicio, fin
+
+
+def borrar_periodo(db: Session, id_imss: str, fecha_ini: date, fecha_fin: date) -> int:
+    # Rango sobre la columna sin funciones para que el índice (id_imss, fecha_hora) aplique
+    inicio, fin = limites_utc(fecha_ini, fecha_fin)
+    resultado = db.execute(
+        delete(models.PeasAsistencia).where(
+            models.PeasAsistencia.id_imss == id_imss,
+            models.PeasAsistencia.fecha_hora >= inicio,
+            models.PeasAsistencia.fecha_hora < fin,
+        ).execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount
+
+
+def guardar_marcajes(db: Session, id_imss: str, marcajes: Iterable) -> int:
+    """Inserta [(tipo, fecha_hora UTC naive)] con COPY; no hace commit."""
+    marcajes = list(marcajes)
+    if not marcajes:
+        return 0
+
+    conexion = db.connection()
+    if conexion.dialect.driver != "psycopg2":
+        db.execute(insert(models.PeasAsistencia), [
+            {"id_imss": id_imss, "tipo": tipo, "fecha_hora": fecha_hora.replace(tzinfo=pytz.utc)}
+            for tipo, fecha_hora in marcajes
+        ])
+        return len(marcajes)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for tipo, fecha_hora in marcajes:
+        writer.writerow((id_imss, tipo, f"{fecha_hora.isoformat(sep=' ')}+00"))
+    buffer.seek(0)
+
+    # El cursor crudo comparte la transacción de la sesión: si algo falla después, el rollback lo deshace
+    cursor = conexion.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(_COPY_SQL, buffer)
+    finally:
+        cursor.close()
+    return len(marcajes)
@@ -0,0 +1,33 @@
+import os
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+# Configuración de Backblaze B2 (API compatible con S3) para storage.S3Backend, que corre
+# cada llamada en su pool de hilos acotado para no bloquear el event loop.
+
+MB = 1024 * 1024
+
+BUCKET = os.getenv('B2_BUCKET_NAME')
+
+# Escaneos grandes se suben en multipart (B2 pide partes de al menos 5 MB)
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=int(os.getenv("B2_MULTIPART_MB", "16")) * MB,
+    multipart_chunksize=int(os.getenv("B2_PARTE_MB", "16")) * MB,
+    max_concurrency=int(os.getenv("B2_HILOS_POR_ARCHIVO", "4")),
+    use_threads=True,
+)
+
+s3_client = boto3.client(
+    's3',
+    endpoint_url=os.getenv('B2_ENDPOINT'),
+    aws_access_key_id=os.getenv('B2_KEY_ID'),
+    aws_secret_access_key=os.getenv('B2_APPLICATION_KEY'),
+    config=Config(
+        signature_version='s3v4',
+        s3={'addressing_style': 'virtual'},
+        # Una conexión por hilo del pool de storage más las partes en paralelo de cada archivo
+        max_pool_connections=int(os.getenv("STORAGE_WORKERS", "8")) * TRANSFER_CONFIG.max_concurrency,
+    )
+)
@@ -0,0 +1,45 @@
+from typing import Optional, Sequence
+
+from sqlalchemy import and_, or_, func
+
+from .. import models
+
+# Columnas con índice trigram (migración 0001_busqueda_trigram)
+CAMPOS_BUSQUEDA = (
+    models.Doctor.nombre,
+    models.Doctor.apellido_paterno,
+    models.Doctor.apellido_materno,
+    models.Doctor.id_imss,
+    models.Doctor.matrimonio_id,
+    models.Doctor.clues,
+)
+
+CAMPOS_SIN_MATRIMONIO = tuple(c for c in CAMPOS_BUSQUEDA if c is not models.Doctor.matrimonio_id)
+
+
+def palabras(search: Optional[str]) -> list:
+    return search.strip().split() if search and search.strip() else []
+
+
+def condicion_busqueda(search: Optional[str], campos: Sequence = CAMPOS_BUSQUEDA):
+    """
+    Cada palabra debe aparecer (ILIKE '%palabra%') en alguno de los campos.
+    Devuelve None si no hay nada que buscar.
+    """
+    terminos = palabras(search)
+    if not terminos:
+        return None
+    return and_(*[
+        or_(*[campo.ilike(f"%{palabra}%") for campo in campos])
+        for palabra in terminos
+    ])
+
+
+def relevancia(search: str, campos: Sequence = CAMPOS_BUSQUEDA):
+    """Mayor similitud trigram entre el texto buscado y cualquiera de los campos (pg_trgm)."""
+    texto = " ".join(palabras(search))
+    nombre_completo = func.concat_ws(
+        " ", models.Doctor.nombre, models.Doctor.apellido_paterno, models.Doctor.apellido_materno
+    )
+    candidatos = [nombre_completo, *campos]
+    return func.greatest(*[func.coalesce(func.similarity(c, texto), 0.0) for c in candidatos])
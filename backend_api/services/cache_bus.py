@@ -0,0 +1,115 @@
+import os
+import json
+import uuid
+import asyncio
+from typing import Optional
+
+from ..cache import count_cache
+from ..database import connect_asyncpg
+
+# Canal de PostgreSQL por el que viajan las invalidaciones de count_cache entre procesos
+CANAL = os.getenv("CACHE_BUS_CANAL", "count_cache_invalidaciones")
+REINTENTO_MAX = 30
+
+
+class CacheBus:
+    """
+    Propaga las invalidaciones de la caché local al resto de los workers con NOTIFY
+    y aplica las que llegan de ellos con LISTEN.
+    """
+
+    def __init__(self, cache):
+        self._cache = cache
+        self._origen = uuid.uuid4().hex
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cola: Optional[asyncio.Queue] = None
+        self._tareas = []
+
+    async def iniciar(self):
+        self._loop = asyncio.get_running_loop()
+        self._cola = asyncio.Queue()
+        self._cache.set_publisher(self.publicar)
+        self._tareas = [
+            asyncio.create_task(self._escuchar()),
+            asyncio.create_task(self._enviar()),
+        ]
+
+    async def detener(self):
+        self._cache.set_publisher(None)
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+
+    # Puede llamarse desde cualquier hilo (p. ej. cálculos en asyncio.to_thread)
+    def publicar(self, mensaje: dict):
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._cola.put_nowait, mensaje)
+
+    async def _enviar(self):
+        espera = 1
+        while True:
+            conn = None
+            try:
+                conn = await connect_asyncpg()
+                espera = 1
+                while True:
+                    mensaje = await self._cola.get()
+                    payload = json.dumps({"origen": self._origen, **mensaje})
+                    try:
+                        await conn.execute("SELECT pg_notify($1, $2)", CANAL, payload)
+                    except Exception:
+                        # Lo devolvemos a la cola para reenviarlo tras reconectar
+                        self._cola.put_nowait(mensaje)
+                        raise
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR_CACHE_BUS_NOTIFY: {e}")
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, REINTENTO_MAX)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+    async def _escuchar(self):
+        espera = 1
+        primera = True
+        while True:
+            conn = None
+            try:
+                conn = await connect_asyncpg()
+                cerrada = asyncio.Event()
+                conn.add_termination_listener(lambda _conn: cerrada.set())
+                await conn.add_listener(CANAL, self._recibir)
+                # Mientras estuvimos desconectados pudimos perder avisos
+                if not primera:
+                    self._cache.invalidate(propagar=False)
+                primera = False
+                espera = 1
+                await cerrada.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"ERROR_CACHE_BUS_LISTEN: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, REINTENTO_MAX)
+
+    def _recibir(self, _conn, _pid, _canal, payload: str):
+        try:
+            mensaje = json.loads(payload)
+        except ValueError:
+            return
+        if mensaje.get("origen") == self._origen:
+            return
+        if "tags" in mensaje:
+            self._cache.invalidate_tag(*mensaje["tags"], propagar=False)
+        elif "pattern" in mensaje:
+            self._cache.invalidate(mensaje["pattern"], propagar=False)
+
+
+cache_bus = CacheBus(count_cache)
@@ -0,0 +1,155 @@
+from sqlalchemy import text, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from .resumen_service import COORDINACION_NULA
+
+ESTATUS_MAP = {
+    '01': '01 ACTIVO', '02': '02 RETIRO TEMP. (CUBA)',
+    '03': '03 RETIRO TEMP. (MEXICO)', '04': '04 SOL. PERSONAL',
+    '05': '05 INCAPACIDAD', '06': '06 BAJA'
+}
+
+# Misma regla de cédula válida que usaba cada conteo por separado
+_CEDULA_VALIDA = """
+    {col} IS NOT NULL AND {col} != ''
+    AND {col} NOT ILIKE '%NULL%' AND {col} NOT ILIKE '%BAJA%' AND {col} NOT ILIKE '%TRAMITE%'
+"""
+
+
+def _query_dashboard(tipo: str):
+    # Ojo: algunas métricas usan coordinacion = '0' y otras coordinacion != '1'; se respetan tal cual
+    filtro_coord = '1' if tipo == "administrativos" else '0'
+    coord_eq = f"coordinacion = '{filtro_coord}'"
+    condicion_sql = "coordinacion = '1'" if tipo == "administrativos" else "coordinacion != '1'"
+
+    return text(f"""
+        SELECT
+            GROUPING(code) AS g_code, GROUPING(nivel_atencion) AS g_nivel,
+            GROUPING(entidad) AS g_entidad, GROUPING(sexo) AS g_sexo,
+            code, nivel_atencion, entidad, sexo,
+            COUNT(*) AS universo,
+            COUNT(*) FILTER (WHERE {coord_eq} AND estatus != '06 BAJA') AS total,
+            COUNT(*) FILTER (
+                WHERE {coord_eq} AND estatus != '06 BAJA' AND {_CEDULA_VALIDA.format(col='cedula_lic')}
+            ) AS cedulas_lic,
+            COUNT(*) FILTER (
+                WHERE {coord_eq} AND estatus != '06 BAJA' AND {_CEDULA_VALIDA.format(col='cedula_esp')}
+            ) AS cedulas_esp,
+            COUNT(*) FILTER (
+                WHERE {condicion_sql} AND estatus IS NOT NULL AND TRIM(estatus) != ''
+            ) AS por_estatus,
+            COUNT(*) FILTER (
+                WHERE {condicion_sql} AND estatus = '01 ACTIVO'
+                  AND nivel_atencion IS NOT NULL AND nivel_atencion != ''
+            ) AS por_nivel,
+            COUNT(*) FILTER (WHERE {coord_eq} AND estatus = '01 ACTIVO') AS por_entidad,
+            COUNT(*) FILTER (
+                WHERE {condicion_sql} AND estatus != '06 BAJA' AND sexo IS NOT NULL
+            ) AS por_sexo
+        FROM (
+            SELECT SUBSTRING(TRIM(UPPER(estatus)) FROM 1 FOR 2) AS code,
+                   estatus, coordinacion, nivel_atencion, entidad, sexo, cedula_lic, cedula_esp
+            FROM doctores
+            WHERE is_deleted = false
+        ) d
+        GROUP BY GROUPING SETS ((), (code), (nivel_atencion), (entidad), (sexo))
+    """)
+
+
+def _query_dashboard_resumen(tipo: str):
+    # Las mismas métricas que _query_dashboard, sumando los conteos de doctores_resumen.
+    # Ahí una coordinacion NULL quedó como COORDINACION_NULA, y NULL != '1' no se cumple en la versión original
+    filtro_coord = '1' if tipo == "administrativos" else '0'
+    coord_eq = f"coordinacion = '{filtro_coord}'"
+    condicion_sql = (
+        "coordinacion = '1'" if tipo == "administrativos"
+        else f"coordinacion NOT IN ('1', '{COORDINACION_NULA}')"
+    )
+
+    return text(f"""
+        SELECT
+            GROUPING(estatus_code) AS g_code, GROUPING(nivel_atencion) AS g_nivel,
+            GROUPING(entidad) AS g_entidad, GROUPING(sexo) AS g_sexo,
+            estatus_code AS code, nivel_atencion, entidad, sexo,
+            COALESCE(SUM(total), 0) AS universo,
+            COALESCE(SUM(no_baja) FILTER (WHERE {coord_eq}), 0) AS total,
+            COALESCE(SUM(cedulas_lic) FILTER (WHERE {coord_eq}), 0) AS cedulas_lic,
+            COALESCE(SUM(cedulas_esp) FILTER (WHERE {coord_eq}), 0) AS cedulas_esp,
+            COALESCE(SUM(total) FILTER (WHERE {condicion_sql} AND estatus_code != ''), 0) AS por_estatus,
+            COALESCE(SUM(activos) FILTER (WHERE {condicion_sql} AND nivel_atencion != ''), 0) AS por_nivel,
+            COALESCE(SUM(activos) FILTER (WHERE {coord_eq}), 0) AS por_entidad,
+            COALESCE(SUM(no_baja) FILTER (WHERE {condicion_sql}), 0) AS por_sexo
+        FROM doctores_resumen
+        GROUP BY GROUPING SETS ((), (estatus_code), (nivel_atencion), (entidad), (sexo))
+    """)
+
+
+async def calcular_dashboard(db: AsyncSession, tipo: str) -> dict:
+    """
+    Arma el resumen del dashboard desde doctores_resumen; si aún no se ha
+    construido, con un solo recorrido de `doctores`.
+    """
+    hay_resumen = (await db.execute(select(models.DoctorResumen.entidad).limit(1))).first() is not None
+    query = _query_dashboard_resumen(tipo) if hay_resumen else _query_dashboard(tipo)
+    filas = (await db.execute(query)).all()
+
+    general = None
+    por_estatus, por_nivel, por_sexo = [], [], []
+    por_entidad = {}
+
+    # Cada fila pertenece a un solo grouping set; los grupos con conteo 0 no
+    # habrían aparecido en las consultas originales, así que se descartan
+    for r in filas:
+        if r.g_code and r.g_nivel and r.g_entidad and r.g_sexo:
+            general = r
+        elif not r.g_code:
+            if r.por_estatus:
+                por_estatus.append((r.code, r.por_estatus))
+        elif not r.g_nivel:
+            if r.por_nivel:
+                por_nivel.append((r.nivel_atencion, r.por_nivel))
+        elif not r.g_entidad:
+            if r.por_entidad and r.entidad is not None:
+                por_entidad[r.entidad] = r.por_entidad
+        elif not r.g_sexo:
+            if r.por_sexo:
+                por_sexo.append((r.sexo, r.por_sexo))
+
+    por_estatus.sort(key=lambda x: x[1], reverse=True)
+    por_nivel.sort(key=lambda x: x[1], reverse=True)
+
+    data_estatus = [
+        {"id": ESTATUS_MAP.get(code, code), "label": ESTATUS_MAP.get(code, code), "value": value}
+        for code, value in por_estatus
+    ]
+    data_nivel = [{"label": label, "value": value} for label, value in por_nivel]
+
+    cupos = (await db.execute(select(
+        models.EntidadCupos.entidad, models.EntidadCupos.minimo, models.EntidadCupos.maximo
+    ))).all()
+    data_estados = [
+        {"label": c.entidad, "value": por_entidad.get(c.entidad, 0), "minimo": c.minimo, "maximo": c.maximo}
+        for c in cupos
+    ]
+
+    total_mujeres = 0
+    total_hombres = 0
+    for sexo, total in por_sexo:
+        valor = (sexo or '').strip().upper()
+        if valor in ('M', 'MUJER', 'FEMENINO', 'F'):
+            total_mujeres = total
+        elif valor in ('H', 'HOMBRE', 'MASCULINO', 'M'):
+            total_hombres = total
+
+    return {
+        "total_general": general.total if general else 0,
+        "universo_total": general.universo if general else 0,
+        "data_estatus": data_estatus,
+        "data_nivel": data_nivel,
+        "data_estados": data_estados,
+        "cedulas_licenciatura": general.cedulas_lic if general else 0,
+        "cedulas_especialidad": general.cedulas_esp if general else 0,
+        "total_mujeres": total_mujeres,
+        "total_hombres": total_hombres,
+    }
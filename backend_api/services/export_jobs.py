@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import uuid
+import socket
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.orm import Session
+
+from .. import models, schemas
+from ..database import SessionLocal
+from . import reportes_service
+from .xlsx_stream import generar_xlsx
+
+# Cola de exportaciones: el POST solo registra el job en la tabla export_jobs y un pool de
+# hilos genera el archivo en disco. Como el estado vive en la base, si el proceso se reinicia
+# otro worker (o el mismo al arrancar) retoma los jobs pendientes o abandonados.
+# Con varios hosts EXPORT_DIR debe ser un volumen compartido.
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "exportaciones"))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+RETENCION = timedelta(hours=int(os.getenv("EXPORT_RETENCION_HORAS", "24")))
+# Un job en_proceso sin latido en este tiempo se da por abandonado y vuelve a la cola
+LATIDO_VENCIDO = timedelta(seconds=int(os.getenv("EXPORT_LATIDO_SEGUNDOS", "120")))
+INTERVALO_LATIDO = 5 # segundos entre escrituras de progreso
+INTERVALO_VIGILANTE = 60
+
+FORMATOS = ("xlsx", "csv", "parquet")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export-job")
+# Jobs ya enviados al pool de este proceso, para que el vigilante no los encole dos veces
+_encolados = set()
+_lock = threading.Lock()
+_vigilante = None
+_detener = threading.Event()
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def crear_job(db: Session, tipo: str, formato: str, parametros: Optional[dict], creado_por: str) -> models.ExportJob:
+    job = models.ExportJob(
+        id=str(uuid.uuid4()),
+        tipo=tipo,
+        formato=formato,
+        parametros=json.dumps(parametros) if parametros is not None else None,
+        estado="pendiente",
+        filas_escritas=0,
+        creado_por=creado_por,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _encolar(job.id)
+    return job
+
+
+def _encolar(job_id: str):
+    with _lock:
+        if job_id in _encolados:
+            return
+        _encolados.add(job_id)
+    _executor.submit(_ejecutar, job_id)
+
+
+def _proyeccion(job: models.ExportJob):
+    if job.tipo == "general":
+        return reportes_service.proyeccion_general(), "reporte_doctores", "Doctores"
+    request_data = schemas.ReporteDinamicoRequest(**json.loads(job.parametros or "{}"))
+    return reportes_service.proyeccion_dinamica(request_data), "reporte_personal", "Registros Filtrados"
+
+
+def _tomar(db: Session, job_id: str) -> bool:
+    # Solo un worker gana el UPDATE; los demás ven 0 filas y se retiran
+    ahora = _ahora()
+    tomado = db.execute(
+        update(models.ExportJob)
+        .where(models.ExportJob.id == job_id, models.ExportJob.estado == "pendiente")
+        .values(estado="en_proceso", worker=WORKER_ID, filas_escritas=0, error=None,
+                iniciado_en=ahora, actualizado_en=ahora)
+        .returning(models.ExportJob.id)
+    ).first()
+    db.commit()
+    return tomado is not None
+
+
+class _Progreso:
+    """Cuenta filas y las guarda en el job como máximo cada INTERVALO_LATIDO segundos (sirve de latido)."""
+
+    def __init__(self, db: Session, job_id: str):
+        self.db = db
+        self.job_id = job_id
+        self.filas = 0
+        self._ultimo = 0.0
+
+    def __call__(self, n: int):
+        self.filas += n
+        if time.monotonic() - self._ultimo >= INTERVALO_LATIDO:
+            self.guardar()
+
+    def guardar(self, **valores):
+        self.db.execute(
+            update(models.ExportJob)
+            .where(models.ExportJob.id == self.job_id, models.ExportJob.worker == WORKER_ID)
+            .values(filas_escritas=self.filas, actualizado_en=_ahora(), **valores)
+        )
+        self.db.commit()
+        self._ultimo = time.monotonic()
+
+
+def _escribir(formato: str, proy, hoja: str, ruta: str, progreso: _Progreso):
+    if formato == "parquet":
+        reportes_service.escribir_parquet(proy, ruta, progreso)
+        return
+    if formato == "csv":
+        trozos = reportes_service.generar_csv(proy, progreso)
+    else:
+        trozos = generar_xlsx(proy.encabezados, reportes_service.filas(proy, sin_tz=True, progreso=progreso), hoja=hoja)
+    with open(ruta, "wb") as f:
+        for trozo in trozos:
+            f.write(trozo)
+
+
+def _ejecutar(job_id: str):
+    db = SessionLocal()
+    ruta_parcial = None
+    progreso = _Progreso(db, job_id)
+    try:
+        if not _tomar(db, job_id):
+            return
+        job = db.get(models.ExportJob, job_id)
+        proy, nombre, hoja = _proyeccion(job)
+
+        progreso.guardar(filas_totales=reportes_service.contar(db, proy))
+        db.rollback() # no dejar la transacción abierta mientras se genera el archivo
+
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        ruta = os.path.join(EXPORT_DIR, f"{job_id}.{job.formato}")
+        # Nombre único: si el job se reencoló, otro worker puede estar escribiendo el suyo
+        ruta_parcial = f"{ruta}.{uuid.uuid4().hex}.part"
+        _escribir(job.formato, proy, hoja, ruta_parcial, progreso)
+        os.replace(ruta_parcial, ruta)
+        ruta_parcial = None
+
+        progreso.guardar(estado="terminado", ruta_archivo=ruta,
+                         nombre_archivo=f"{nombre}.{job.formato}", terminado_en=_ahora())
+    except Exception as e:
+        traceback.print_exc()
+        db.rollback()
+        try:
+            progreso.guardar(estado="error", error=str(e), terminado_en=_ahora())
+        except Exception:
+            traceback.print_exc()
+    finally:
+        if ruta_parcial and os.path.exists(ruta_parcial):
+            os.remove(ruta_parcial)
+        db.close()
+        with _lock:
+            _encolados.discard(job_id)
+
+
+def obtener_job(db: Session, job_id: str) -> Optional[models.ExportJob]:
+    return db.get(models.ExportJob, job_id)
+
+
+def eta_segundos(job: models.ExportJob) -> Optional[float]:
+    """Estimación lineal con el ritmo de filas desde que empezó el job."""
+    if job.estado != "en_proceso" or not job.iniciado_en or not job.filas_totales or not job.filas_escritas:
+        return None
+    transcurrido = ((job.actualizado_en or _ahora()) - job.iniciado_en).total_seconds()
+    if transcurrido <= 0:
+        return None
+    ritmo = job.filas_escritas / transcurrido
+    return round(max(job.filas_totales - job.filas_escritas, 0) / ritmo, 1)
+
+
+def recuperar_jobs(db: Session) -> int:
+    """
+    Devuelve a la cola los jobs cuyo worker dejó de dar latido, encola los pendientes
+    y borra archivos y registros vencidos. Devuelve cuántos jobs se encolaron.
+    """
+    ahora = _ahora()
+    db.execute(
+        update(models.ExportJob)
+        .where(models.ExportJob.estado == "en_proceso", models.ExportJob.actualizado_en < ahora - LATIDO_VENCIDO)
+        .values(estado="pendiente", worker=None)
+    )
+
+    vencidos = db.execute(
+        select(models.ExportJob.id, models.ExportJob.ruta_archivo)
+        .where(models.ExportJob.estado.in_(("terminado", "error")), models.ExportJob.terminado_en < ahora - RETENCION)
+    ).all()
+    for _, ruta in vencidos:
+        if ruta and os.path.exists(ruta):
+            os.remove(ruta)
+    if vencidos:
+        db.execute(delete(models.ExportJob).where(models.ExportJob.id.in_([v.id for v in vencidos])))
+    db.commit()
+
+    pendientes = db.execute(
+        select(models.ExportJob.id).where(models.ExportJob.estado == "pendiente").order_by(models.ExportJob.creado_en)
+    ).scalars().all()
+    for job_id in pendientes:
+        _encolar(job_id)
+    return len(pendientes)
+
+
+def _vigilar():
+    while not _detener.wait(INTERVALO_VIGILANTE):
+        db = SessionLocal()
+        try:
+            recuperar_jobs(db)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            db.close()
+
+
+def iniciar():
+    global _vigilante
+    db = SessionLocal()
+    try:
+        recuperar_jobs(db)
+    finally:
+        db.close()
+    if _vigilante is None:
+        _detener.clear()
+        _vigilante = threading.Thread(target=_vigilar, name="export-jobs-vigilante", daemon=True)
+        _vigilante.start()
+
+
+def detener():
+    _detener.set()
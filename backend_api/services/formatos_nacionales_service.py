@@ -0,0 +1,237 @@
+import asyncio
+import calendar
+import json
+from datetime import date, datetime
+
+import pytz
+from sqlalchemy import and_, delete, select, func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..cache import count_cache, generate_cache_key
+from ..database import run_with_session
+
+# Datos de los Formatos 3 (detalle por médico) y 4 (resumen por entidad) nacionales. Los dos
+# salen de una sola consulta: la bitácora validada unida a los formatos estatales APROBADOS
+# por (entidad, quincena), agrupada y ordenada por médico; el Formato 4 se suma a partir de esas filas.
+# Un periodo finalizado ya no cambia: sus filas se guardan en formatos_nacionales_cache y solo
+# se borran al rechazar, revocar o volver a aprobar algo de ese periodo (invalidar).
+
+MESES = ["", "ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", "JULIO", "AGOSTO",
+         "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE"]
+
+CACHE_TTL = 3600
+# Primera llave de los advisory locks por quincena (la segunda es hashtext de la quincena)
+LOCK_FORMATOS = 727101
+ZONA_LOCAL = pytz.timezone('America/Mexico_City')
+
+
+class SinAprobados(Exception):
+    """Ninguna entidad tiene su formato estatal APROBADO en el periodo."""
+
+
+def periodos_de(anio: int, mes: int, quincena: str):
+    """(quincenas 'AAAA-MM-Qn' que abarca la consulta, texto del periodo para el título del Excel)."""
+    nombre_mes = MESES[mes]
+    ultimo_dia = calendar.monthrange(anio, mes)[1] # Detecta automáticamente si el mes trae 28, 30 o 31 días
+    if quincena == "completo":
+        return [f"{anio}-{mes:02d}-Q1", f"{anio}-{mes:02d}-Q2"], f"1 AL {ultimo_dia} DE {nombre_mes} DE {anio}"
+    if quincena == "1":
+        return [f"{anio}-{mes:02d}-Q1"], f"1 AL 15 DE {nombre_mes} DE {anio}"
+    if quincena == "2":
+        return [f"{anio}-{mes:02d}-Q2"], f"16 AL {ultimo_dia} DE {nombre_mes} DE {anio}"
+    raise ValueError("Quincena inválida")
+
+
+def tag_periodo(periodo: str) -> str:
+    return f"peas:{periodo}"
+
+
+def _fin_periodo(periodo: str) -> date:
+    anio, mes, q = periodo.split("-")
+    anio, mes = int(anio), int(mes)
+    return date(anio, mes, 15) if q == "Q1" else date(anio, mes, calendar.monthrange(anio, mes)[1])
+
+
+def periodo_cerrado(periodos: list) -> bool:
+    # Mientras la quincena sigue en curso siguen llegando validaciones; no vale la pena cachearla
+    hoy = datetime.now(ZONA_LOCAL).date()
+    return all(_fin_periodo(p) < hoy for p in periodos)
+
+
+def _mes_completo(periodo: str) -> str:
+    return periodo.rsplit("-", 1)[0] + "-Qcompleto"
+
+
+def clave_persistida(periodos: list) -> str:
+    """Llave en formatos_nacionales_cache: la quincena, o 'AAAA-MM-Qcompleto' para el mes completo."""
+    return periodos[0] if len(periodos) == 1 else _mes_completo(periodos[0])
+
+
+def _consulta(periodos: list):
+    bitacora = models.BitacoraEstatalValidada
+    formato = models.FormatoEstatalFirmado
+    # (entidad, quincena) aprobadas sin repetir: si una entidad tiene dos formatos APROBADOS en la
+    # misma quincena, unir contra la tabla duplicaría las filas de la bitácora y sus días
+    aprobados = select(formato.entidad, formato.quincena).where(
+        formato.quincena.in_(periodos),
+        formato.estado == models.EstadoReporte.APROBADO,
+    ).distinct().subquery()
+    # LEFT JOIN desde los aprobados: así una sola consulta dice también si hay aprobados
+    # (una fila con entidad NULL es un formato aprobado sin médicos validados). Con el mes
+    # completo las dos quincenas se suman aquí mismo y el orden sale de la collation de la BD
+    return select(
+        bitacora.entidad,
+        bitacora.unidad_medica,
+        bitacora.clues_ib,
+        bitacora.especialidad,
+        bitacora.turno,
+        bitacora.profesional_salud,
+        func.sum(bitacora.dias_participacion).label("dias_totales"),
+    ).select_from(aprobados).outerjoin(
+        bitacora,
+        and_(bitacora.entidad == aprobados.c.entidad, bitacora.quincena_validada == aprobados.c.quincena)
+    ).group_by(
+        bitacora.entidad,
+        bitacora.unidad_medica,
+        bitacora.clues_ib,
+        bitacora.especialidad,
+        bitacora.turno,
+        bitacora.profesional_salud,
+    ).order_by(
+        bitacora.entidad,
+        bitacora.unidad_medica,
+        bitacora.profesional_salud,
+    )
+
+
+def _consultar(db: Session, periodos: list):
+    """Filas por médico ya ordenadas, o None si ninguna quincena tiene un formato estatal aprobado."""
+    filas = []
+    hay_aprobados = False
+    for reg in db.execute(_consulta(periodos)):
+        hay_aprobados = True
+        if reg.entidad is not None:
+            filas.append([reg.entidad, reg.unidad_medica, reg.clues_ib, reg.especialidad,
+                          reg.turno, reg.profesional_salud, reg.dias_totales])
+    return filas if hay_aprobados else None
+
+
+def _finalizados(db: Session, periodos: list) -> set:
+    # Finalizada: el nacional está firmado (por quincena o por el mes completo) y ningún
+    # formato estatal de la quincena quedó pendiente o rechazado
+    estatal = models.FormatoEstatalFirmado
+    nacional = models.FormatoNacionalFirmado
+    completos = {p: _mes_completo(p) for p in periodos}
+
+    firmados = {q for (q,) in db.execute(
+        select(nacional.quincena).where(nacional.quincena.in_(set(periodos) | set(completos.values())))
+    )}
+    abiertos = {q for (q,) in db.execute(
+        select(estatal.quincena).distinct().where(
+            estatal.quincena.in_(periodos),
+            estatal.estado != models.EstadoReporte.APROBADO,
+        )
+    )}
+    return {p for p in periodos if (p in firmados or completos[p] in firmados) and p not in abiertos}
+
+
+def _bloquear(db: Session, periodos, compartido: bool):
+    """
+    Lock por quincena hasta el fin de la transacción. calcular toma el compartido desde que lee
+    hasta que guarda; invalidar el exclusivo. Así un rechazo o revocación que llega a media
+    lectura espera a que se guarde el resultado y luego lo borra, en vez de borrar antes y dejar
+    guardado un resultado viejo para siempre. Siempre en el mismo orden para no trabarse.
+    """
+    funcion = "pg_advisory_xact_lock_shared" if compartido else "pg_advisory_xact_lock"
+    for periodo in sorted(set(periodos)):
+        db.execute(text(f"SELECT {funcion}(:llave, hashtext(:periodo))"), {"llave": LOCK_FORMATOS, "periodo": periodo})
+
+
+def _leer_persistido(db: Session, clave: str):
+    datos = db.execute(
+        select(models.FormatoNacionalCache.datos).where(models.FormatoNacionalCache.quincena == clave)
+    ).scalar()
+    return json.loads(datos) if datos is not None else None
+
+
+def _persistir(db: Session, clave: str, filas: list):
+    try:
+        db.add(models.FormatoNacionalCache(quincena=clave, datos=json.dumps(filas)))
+        db.commit()
+    except IntegrityError:
+        # Otro worker la guardó primero; el contenido es el mismo
+        db.rollback()
+
+
+def _armar(filas: list) -> dict:
+    medicos = []
+    por_entidad = {}
+    for entidad, unidad, clues, especialidad, turno, medico, dias in filas:
+        medicos.append({
+            "no": len(medicos) + 1,
+            "unidad": unidad or "SIN UNIDAD",
+            "entidad": entidad,
+            "clues": clues,
+            "especialidad": especialidad,
+            "turno": turno,
+            "medico": medico,
+            "dias": dias,
+        })
+        # Formato 4: médicos sin repetir (por nombre, como el COUNT DISTINCT de antes) y días por
+        # entidad, en el mismo orden de entidades que trae la consulta
+        resumen = por_entidad.setdefault(entidad, {"nombres": set(), "dias": 0})
+        if medico is not None:
+            resumen["nombres"].add(medico)
+        resumen["dias"] += dias or 0
+
+    resumen = [
+        {"entidad": e, "medicos": len(v["nombres"]), "dias": v["dias"]}
+        for e, v in por_entidad.items()
+    ]
+    return {"medicos": medicos, "resumen": resumen}
+
+
+def calcular(db: Session, periodos: list) -> dict:
+    # Un periodo finalizado (quincena o mes completo) se lee de formatos_nacionales_cache ya
+    # sumado y ordenado, sin tocar la bitácora
+    clave = clave_persistida(periodos)
+    filas = _leer_persistido(db, clave)
+    if filas is None:
+        _bloquear(db, periodos, compartido=True)
+        filas = _consultar(db, periodos)
+        if filas is None:
+            raise SinAprobados()
+        if _finalizados(db, periodos) == set(periodos):
+            _persistir(db, clave, filas)
+    return _armar(filas)
+
+
+async def obtener(anio: int, mes: int, quincena: str) -> dict:
+    """Datos de ambos formatos más el texto del periodo; los periodos cerrados se sirven de caché."""
+    periodos, texto = periodos_de(anio, mes, quincena)
+    calcular_en_hilo = lambda: asyncio.to_thread(run_with_session, calcular, periodos)
+
+    if periodo_cerrado(periodos):
+        datos = await count_cache.get_or_compute(
+            generate_cache_key("peas_formatos_nacionales", periodos=",".join(periodos)),
+            calcular_en_hilo,
+            ttl=CACHE_TTL, tags=[tag_periodo(p) for p in periodos]
+        )
+    else:
+        datos = await calcular_en_hilo()
+    return {**datos, "periodo_texto": texto}
+
+
+def invalidar(db: Session, *periodos: str):
+    """Borra el resultado persistido y el de memoria; llamar después del commit que cambia el periodo."""
+    periodos = [p for p in periodos if p]
+    if not periodos:
+        return
+    _bloquear(db, periodos, compartido=False)
+    # También el mes completo que incluye a cada quincena
+    claves = set(periodos) | {_mes_completo(p) for p in periodos}
+    db.execute(delete(models.FormatoNacionalCache).where(models.FormatoNacionalCache.quincena.in_(claves)))
+    db.commit()
+    count_cache.invalidate_tag(*[tag_periodo(p) for p in periodos])
@@ -0,0 +1,61 @@
+from datetime import date
+from typing import Iterable
+
+from sqlalchemy import text, bindparam, Date
+from sqlalchemy.orm import Session
+
+# Días en '01 ACTIVO' por doctor dentro de [primer_dia, limite_superior], con las mismas reglas
+# que el cálculo en Python que se usaba en los reportes:
+#  - un tramo termina en su fecha_fin; si no tiene, en el inicio del siguiente registro;
+#    si no hay siguiente, sigue abierto hasta limite_superior
+#  - un tramo abierto cuenta el día final; uno cortado no, salvo que el corte caiga después del límite
+# La ventana se calcula sobre todo el historial del doctor (el siguiente registro puede ser de
+# cualquier estatus o de otro mes) y después se filtran los tramos activos.
+_SQL_DIAS_ACTIVOS = text("""
+    WITH h AS (
+        SELECT
+            id_imss, estatus, fecha_inicio, fecha_fin,
+            LEAD(fecha_inicio) OVER w AS siguiente_inicio,
+            LEAD(id) OVER w AS siguiente_id
+        FROM estatus_historico
+        WHERE id_imss IN :ids
+        WINDOW w AS (PARTITION BY id_imss ORDER BY fecha_inicio, id)
+    ),
+    tramos AS (
+        SELECT
+            id_imss,
+            GREATEST(:primer_dia, fecha_inicio) AS inicio_real,
+            CASE
+                WHEN fecha_fin IS NOT NULL THEN fecha_fin
+                WHEN siguiente_id IS NOT NULL THEN siguiente_inicio
+                ELSE :limite_superior
+            END AS fin_calculado,
+            (fecha_fin IS NOT NULL OR siguiente_id IS NOT NULL) AS fue_cortado
+        FROM h
+        WHERE estatus = '01 ACTIVO'
+    )
+    SELECT
+        id_imss,
+        SUM(
+            (LEAST(:limite_superior, fin_calculado) - inicio_real)
+            + CASE WHEN NOT fue_cortado OR fin_calculado > :limite_superior THEN 1 ELSE 0 END
+        ) AS dias
+    FROM tramos
+    WHERE inicio_real <= LEAST(:limite_superior, fin_calculado)
+    GROUP BY id_imss
+""").bindparams(
+    bindparam("ids", expanding=True),
+    bindparam("primer_dia", type_=Date),
+    bindparam("limite_superior", type_=Date),
+)
+
+
+def dias_activos(db: Session, ids: Iterable[str], primer_dia: date, limite_superior: date) -> dict:
+    """{id_imss: días activos en el periodo} con una sola consulta; los doctores sin días no aparecen."""
+    ids = list(ids)
+    if not ids:
+        return {}
+    filas = db.execute(_SQL_DIAS_ACTIVOS, {
+        "ids": ids, "primer_dia": primer_dia, "limite_superior": limite_superior
+    })
+    return {f.id_imss: int(f.dias) for f in filas}
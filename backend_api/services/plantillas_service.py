@@ -0,0 +1,114 @@
+import os
+import asyncio
+import calendar
+import hashlib
+import threading
+from io import BytesIO
+
+import openpyxl
+
+from ..cache import CountCache
+
+# Plantillas Excel de asistencia PEAS con las fechas de la quincena ya escritas. Cada plantilla
+# se lee de disco una sola vez y cada variante (plantilla, año, mes, quincena) se genera una vez:
+# al cierre de quincena miles de unidades descargan los mismos archivos.
+
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+MESES = ["", "Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto",
+         "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+
+CACHE_TTL = 24 * 3600
+
+# Caché propia para que los archivos no desplacen los conteos de count_cache
+_cache = CountCache(
+    max_entries=int(os.getenv("PLANTILLAS_CACHE_ENTRADAS", 96)),
+    max_bytes=int(os.getenv("PLANTILLAS_CACHE_MB", 16)) * 1024 * 1024
+)
+
+_originales = {}
+_lock = threading.Lock()
+
+
+class PlantillaNoEncontrada(Exception):
+    pass
+
+
+def rango_dias(anio: int, mes: int, quincena: int) -> range:
+    if quincena == 1:
+        return range(1, 16)
+    return range(16, calendar.monthrange(anio, mes)[1] + 1)
+
+
+def _escribir_fechas(ws, fila_inicio: int, columna: int, anio: int, mes: int, quincena: int):
+    dias = rango_dias(anio, mes, quincena)
+    for i in range(16): # 16 es el máximo de filas necesarias (ej. meses con 31 días en Q2)
+        celda = ws.cell(row=fila_inicio + i, column=columna)
+        # Formato estricto DD/MM/AAAA; si sobran filas (la primera quincena solo usa 15) van en blanco
+        celda.value = f"{dias[i]:02d}/{mes:02d}/{anio}" if i < len(dias) else ""
+
+
+def _llenar_firma_manual(ws, anio: int, mes: int, quincena: int):
+    dias = rango_dias(anio, mes, quincena)
+    ws['I4'] = f"{dias[0]} al {dias[-1]} de {MESES[mes]} de {anio}"
+    _escribir_fechas(ws, 8, 2, anio, mes, quincena)
+
+
+def _llenar_asistencias(ws, anio: int, mes: int, quincena: int):
+    _escribir_fechas(ws, 2, 1, anio, mes, quincena)
+
+
+PLANTILLAS = {
+    "firma_manual": ("plantilla_firma_manual.xlsx", _llenar_firma_manual),
+    "asistencias": ("formato_asistencias.xlsx", _llenar_asistencias),
+}
+
+
+def _original(nombre: str):
+    """(bytes de la plantilla, huella corta de su contenido)."""
+    with _lock:
+        if nombre not in _originales:
+            ruta = os.path.join(DIRECTORIO, PLANTILLAS[nombre][0])
+            if not os.path.exists(ruta):
+                raise PlantillaNoEncontrada(ruta)
+            with open(ruta, "rb") as f:
+                contenido = f.read()
+            _originales[nombre] = (contenido, hashlib.sha1(contenido).hexdigest()[:12])
+        return _originales[nombre]
+
+
+def cargar():
+    for nombre in PLANTILLAS:
+        try:
+            _original(nombre)
+        except PlantillaNoEncontrada as e:
+            print(f"ERROR_PLANTILLAS: no existe {e}")
+
+
+def etag(nombre: str, anio: int, mes: int, quincena: int) -> str:
+    # Depende solo de la plantilla y del periodo, no de los bytes generados (openpyxl escribe la
+    # hora de guardado), así sigue valiendo aunque la variante haya salido de la caché
+    return f'"{nombre}-{_original(nombre)[1]}-{anio}{mes:02d}q{quincena}"'
+
+
+def coincide(if_none_match: str, valor: str) -> bool:
+    if not if_none_match:
+        return False
+    etiquetas = [e.strip() for e in if_none_match.split(",")]
+    return "*" in etiquetas or any(e.removeprefix("W/") == valor for e in etiquetas)
+
+
+def _generar(nombre: str, anio: int, mes: int, quincena: int) -> bytes:
+    wb = openpyxl.load_workbook(BytesIO(_original(nombre)[0]))
+    PLANTILLAS[nombre][1](wb.active, anio, mes, quincena)
+    salida = BytesIO()
+    wb.save(salida)
+    return salida.getvalue()
+
+
+async def obtener(nombre: str, anio: int, mes: int, quincena: int) -> bytes:
+    return await _cache.get_or_compute(
+        f"plantilla:{nombre}:{anio}:{mes}:{quincena}",
+        lambda: asyncio.to_thread(_generar, nombre, anio, mes, quincena),
+        ttl=CACHE_TTL
+    )
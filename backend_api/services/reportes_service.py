@@ -0,0 +1,248 @@
+import csv
+import io
+import calendar
+import traceback
+from collections import namedtuple
+from datetime import date
+from typing import Iterator
+
+from sqlalchemy import select, null, func, Boolean, Date, DateTime, Integer
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..database import SessionLocal
+from . import historial_service
+
+# Proyección de columnas compartida por los reportes XLSX, CSV y Parquet: solo se leen
+# las columnas pedidas (nunca objetos Doctor completos) con un cursor del lado del servidor.
+
+STREAM_BATCH = 1000
+COLUMNA_VIRTUAL = "dias_activos_mes_actual"
+
+COLUMNAS_REPORTE_GENERAL = [
+    "ID_IMSS", "NOMBRE", "APELLIDO_PATERNO", "APELLIDO_MATERNO", "ESTATUS",
+    "MATRIMONIO_ID", "CURP", "CEDULA_ESP", "CEDULA_LIC", "ESPECIALIDAD",
+    "ENTIDAD", "CLUES", "FORMA_NOTIFICACION", "MOTIVO_BAJA",
+    "FECHA_EXTRACCION", "FECHA_NOTIFICACION", "SEXO", "TURNO",
+    "NOMBRE_UNIDAD", "MUNICIPIO", "NIVEL_ATENCION",
+    "FECHA_ESTATUS", "DESPLIEGUE", "FECHA_VUELO", "ESTRATO", "ACUERDO",
+    "CORREO", "ENTIDAD_NACIMIENTO", "TELEFONO",
+    "COMENTARIOS_ESTATUS", "FECHA_NACIMIENTO", "PASAPORTE",
+    "FECHA_EMISION", "FECHA_EXPIRACION", "DOMICILIO",
+    "LICENCIATURA", "INSTITUCION_LIC", "INSTITUCION_ESP",
+    "FECHA_EGRESO_LIC", "FECHA_EGRESO_ESP",
+    "TIPO_ESTABLECIMIENTO", "SUBTIPO_ESTABLECIMIENTO",
+    "DIRECCION_UNIDAD", "REGION",
+    "FECHA_INICIO", "FECHA_FIN", "MOTIVO", "TIPO_INCAPACIDAD"
+]
+
+# encabezados: títulos de la hoja; query: select de columnas (la última es id_imss si hace
+# falta para días activos y no se pidió); dias: (primer_dia, limite_superior) o None
+Proyeccion = namedtuple("Proyeccion", ["encabezados", "query", "dias", "id_extra"])
+
+
+def _columna(nombre: str):
+    columnas = models.Doctor.__table__.columns
+    # Columnas que ya no existen en el modelo salen vacías
+    return columnas[nombre] if nombre in columnas else null()
+
+
+def proyeccion_general() -> Proyeccion:
+    query = select(*[_columna(c.lower()) for c in COLUMNAS_REPORTE_GENERAL]).where(
+        models.Doctor.is_deleted == False
+    ).order_by(models.Doctor.id_imss)
+    return Proyeccion(COLUMNAS_REPORTE_GENERAL, query, None, False)
+
+
+def filtros_dinamicos(request_data) -> list:
+    filtro_coord = '1' if request_data.tipo == "administrativos" else '0'
+    filtros = [models.Doctor.is_deleted == False, models.Doctor.coordinacion == filtro_coord]
+
+    if request_data.entidad:
+        filtros.append(models.Doctor.entidad == request_data.entidad)
+    if request_data.especialidad:
+        filtros.append(models.Doctor.especialidad == request_data.especialidad)
+    if request_data.nivel_atencion:
+        filtros.append(models.Doctor.nivel_atencion == request_data.nivel_atencion)
+    if request_data.nombre_unidad:
+        filtros.append(models.Doctor.nombre_unidad == request_data.nombre_unidad)
+    if request_data.estatus:
+        filtros.append(models.Doctor.estatus == request_data.estatus)
+    if request_data.search and request_data.search.strip():
+        filtros.append(models.Doctor.clues.ilike(f"%{request_data.search.strip()}%"))
+
+    return filtros
+
+
+def proyeccion_dinamica(request_data) -> Proyeccion:
+    columnas_solicitadas = request_data.columnas if request_data.columnas else []
+
+    if not columnas_solicitadas:
+        columnas_validas = ["id_imss", "nombre", "apellido_paterno", "entidad", "estatus", COLUMNA_VIRTUAL]
+    else:
+        columnas_disponibles = [col.key for col in models.Doctor.__table__.columns]
+        columnas_validas = [c for c in columnas_solicitadas if c in columnas_disponibles or c == COLUMNA_VIRTUAL]
+        if not columnas_validas:
+            columnas_validas = ["id_imss", "nombre", "apellido_paterno", "entidad", "estatus"]
+
+    hoy = date.today()
+
+    if request_data.mes_evaluacion:
+        anio_eval, mes_eval = map(int, request_data.mes_evaluacion.split("-"))
+        primer_dia_mes_evaluado = date(anio_eval, mes_eval, 1)
+        dias_del_mes = calendar.monthrange(anio_eval, mes_eval)[1]
+        limite_superior = date(anio_eval, mes_eval, dias_del_mes)
+        if anio_eval == hoy.year and mes_eval == hoy.month:
+            limite_superior = hoy
+        columna_header_title = f"DÍAS ACTIVOS ({request_data.mes_evaluacion})"
+    else:
+        primer_dia_mes_evaluado = date(hoy.year, hoy.month, 1)
+        limite_superior = hoy
+        columna_header_title = "DÍAS ACTIVOS (MES ACTUAL)"
+
+    if "id_imss" in columnas_validas:
+        columnas_validas.remove("id_imss")
+        columnas_validas.insert(0, "id_imss")
+
+    dias = None
+    if COLUMNA_VIRTUAL in columnas_validas:
+        columnas_validas.remove(COLUMNA_VIRTUAL)
+        dias = (primer_dia_mes_evaluado, limite_superior)
+
+    seleccion = [_columna(c) for c in columnas_validas]
+    encabezados = [c.upper() for c in columnas_validas]
+    id_extra = False
+    if dias is not None:
+        encabezados.append(columna_header_title)
+        if "id_imss" not in columnas_validas:
+            seleccion.append(models.Doctor.id_imss)
+            id_extra = True
+
+    query = select(*seleccion).where(*filtros_dinamicos(request_data)).order_by(models.Doctor.id_imss)
+    return Proyeccion(encabezados, query, dias, id_extra)
+
+
+def contar(db: Session, proy: Proyeccion) -> int:
+    return db.execute(select(func.count()).select_from(proy.query.order_by(None).subquery())).scalar_one()
+
+
+def hay_registros(db: Session, request_data) -> bool:
+    return db.execute(
+        select(models.Doctor.id_imss).where(*filtros_dinamicos(request_data)).limit(1)
+    ).first() is not None
+
+
+def _agregar_dias(db: Session, proy: Proyeccion, lote: list) -> list:
+    ids = [fila[-1] if proy.id_extra else fila[0] for fila in lote]
+    primer_dia, limite_superior = proy.dias
+    dias = historial_service.dias_activos(db, ids, primer_dia, limite_superior)
+
+    resultado = []
+    for fila, id_imss in zip(lote, ids):
+        valores = tuple(fila[:-1]) if proy.id_extra else tuple(fila)
+        resultado.append(valores + (dias.get(id_imss, 0),))
+    return resultado
+
+
+def lotes(proy: Proyeccion, tamano: int = STREAM_BATCH, progreso=None) -> Iterator[list]:
+    """
+    Lotes de tuplas en el orden de `proy.encabezados`. Abre su propia sesión porque
+    se consume mientras se envía la respuesta, cuando la sesión de la petición ya se cerró.
+    `progreso(n)` se llama con el tamaño de cada lote entregado.
+    """
+    db = SessionLocal()
+    try:
+        resultado = db.execute(proy.query.execution_options(stream_results=True, yield_per=tamano))
+        for particion in resultado.partitions(tamano):
+            lote = [tuple(f) for f in particion]
+            if proy.dias is not None:
+                lote = _agregar_dias(db, proy, lote)
+            yield lote
+            if progreso is not None:
+                progreso(len(lote))
+    except Exception:
+        traceback.print_exc()
+        raise
+    finally:
+        db.close()
+
+
+def _columnas_con_tz(proy: Proyeccion) -> list:
+    columnas = list(proy.query.selected_columns)
+    return [i for i, col in enumerate(columnas)
+            if isinstance(col.type, DateTime) and col.type.timezone and not (proy.id_extra and i == len(columnas) - 1)]
+
+
+def _quitar_tz(lote: list, indices: list) -> list:
+    # Se transforma columna por columna sobre todo el lote, no celda por celda en cada fila
+    columnas = list(zip(*lote))
+    for i in indices:
+        columnas[i] = tuple(v.replace(tzinfo=None) if v is not None and v.tzinfo is not None else v
+                            for v in columnas[i])
+    return list(zip(*columnas))
+
+
+def filas(proy: Proyeccion, sin_tz: bool = False, progreso=None) -> Iterator[tuple]:
+    """Filas una por una; con `sin_tz` los datetimes con zona se vuelven naive (Excel no guarda zona)."""
+    indices = _columnas_con_tz(proy) if sin_tz else []
+    for lote in lotes(proy, progreso=progreso):
+        if indices and lote:
+            lote = _quitar_tz(lote, indices)
+        yield from lote
+
+
+def generar_csv(proy: Proyeccion, progreso=None) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(proy.encabezados)
+    for lote in lotes(proy, progreso=progreso):
+        writer.writerows(lote)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def _esquema_arrow(proy: Proyeccion):
+    import pyarrow as pa
+
+    campos = []
+    columnas = list(proy.query.selected_columns)
+    if proy.id_extra:
+        columnas = columnas[:-1]
+    for nombre, col in zip(proy.encabezados, columnas):
+        if isinstance(col.type, DateTime):
+            tipo = pa.timestamp("us", tz="UTC" if col.type.timezone else None)
+        elif isinstance(col.type, Date):
+            tipo = pa.date32()
+        elif isinstance(col.type, Boolean):
+            tipo = pa.bool_()
+        elif isinstance(col.type, Integer):
+            tipo = pa.int64()
+        else:
+            tipo = pa.string()
+        campos.append(pa.field(nombre, tipo))
+    if proy.dias is not None:
+        campos.append(pa.field(proy.encabezados[-1], pa.int64()))
+    return pa.schema(campos)
+
+
+def escribir_parquet(proy: Proyeccion, destino, progreso=None) -> int:
+    """Escribe el reporte en `destino` (ruta o archivo) con un row group por lote. Devuelve filas escritas."""
+    # pyarrow solo se carga si alguien pide Parquet
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = _esquema_arrow(proy)
+    total = 0
+    with pq.ParquetWriter(destino, esquema, compression="snappy") as writer:
+        for lote in lotes(proy, progreso=progreso):
+            columnas = list(zip(*lote))
+            tabla = pa.Table.from_arrays(
+                [pa.array(columnas[i], type=campo.type) for i, campo in enumerate(esquema)],
+                schema=esquema
+            )
+            writer.write_table(tabla)
+            total += len(lote)
+    return total
@@ -0,0 +1,153 @@
+from typing import Optional
+
+from sqlalchemy import text, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+
+from .. import models
+
+MEDIDAS = ("total", "activos", "no_baja", "cedulas_lic", "cedulas_esp")
+
+# coordinacion NULL no se puede guardar como '' porque '' es un valor real que
+# coordinacion != '1' sí cuenta (y NULL no); se guarda con este marcador
+COORDINACION_NULA = '<NULL>'
+
+
+def _cedula_valida(valor) -> bool:
+    if not valor:
+        return False
+    valor = valor.upper()
+    return not any(marca in valor for marca in ("NULL", "BAJA", "TRAMITE"))
+
+
+def snapshot(doctor: models.Doctor) -> Optional[tuple]:
+    """
+    Llave y medidas con las que `doctor` cuenta en doctores_resumen, o None si no cuenta.
+    Debe tomarse antes de modificarlo y volver a tomarse después.
+    """
+    if doctor is None or doctor.is_deleted:
+        return None
+
+    estatus = doctor.estatus
+    no_baja = estatus is not None and estatus != '06 BAJA'
+    llave = (
+        doctor.entidad or '',
+        doctor.coordinacion if doctor.coordinacion is not None else COORDINACION_NULA,
+        (estatus or '').strip(' ').upper()[:2],
+        doctor.nivel_atencion or '',
+        doctor.sexo or '',
+    )
+    medidas = (
+        1,
+        1 if estatus == '01 ACTIVO' else 0,
+        1 if no_baja else 0,
+        1 if no_baja and _cedula_valida(doctor.cedula_lic) else 0,
+        1 if no_baja and _cedula_valida(doctor.cedula_esp) else 0,
+    )
+    return llave, medidas
+
+
+def registrar_cambio(db: Session, antes: Optional[tuple], despues: Optional[tuple]):
+    """Aplica a doctores_resumen la diferencia entre dos snapshots, dentro de la transacción de `db`."""
+    if antes == despues:
+        return
+
+    deltas = {}
+    for snap, signo in ((antes, -1), (despues, 1)):
+        if snap is None:
+            continue
+        llave, medidas = snap
+        actual = deltas.get(llave, (0,) * len(MEDIDAS))
+        deltas[llave] = tuple(a + signo * m for a, m in zip(actual, medidas))
+
+    for llave, delta in deltas.items():
+        if not any(delta):
+            continue
+        valores = dict(zip(("entidad", "coordinacion", "estatus_code", "nivel_atencion", "sexo"), llave))
+        valores.update(zip(MEDIDAS, delta))
+        stmt = insert(models.DoctorResumen).values(**valores)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["entidad", "coordinacion", "estatus_code", "nivel_atencion", "sexo"],
+            set_={m: getattr(models.DoctorResumen, m) + getattr(stmt.excluded, m) for m in MEDIDAS}
+        )
+        db.execute(stmt)
+
+
+# Mismas reglas que snapshot(), en SQL
+_SQL_RECONSTRUIR = """
+    INSERT INTO doctores_resumen
+        (entidad, coordinacion, estatus_code, nivel_atencion, sexo,
+         total, activos, no_baja, cedulas_lic, cedulas_esp)
+    SELECT
+        COALESCE(entidad, ''), COALESCE(coordinacion, '{coord_nula}'),
+        COALESCE(SUBSTRING(TRIM(UPPER(estatus)) FROM 1 FOR 2), ''),
+        COALESCE(nivel_atencion, ''), COALESCE(sexo, ''),
+        COUNT(*),
+        COUNT(*) FILTER (WHERE estatus = '01 ACTIVO'),
+        COUNT(*) FILTER (WHERE estatus != '06 BAJA'),
+        COUNT(*) FILTER (WHERE estatus != '06 BAJA' AND {lic}),
+        COUNT(*) FILTER (WHERE estatus != '06 BAJA' AND {esp})
+    FROM doctores
+    WHERE is_deleted = false
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+_CEDULA_SQL = """
+    {col} IS NOT NULL AND {col} != ''
+    AND {col} NOT ILIKE '%NULL%' AND {col} NOT ILIKE '%BAJA%' AND {col} NOT ILIKE '%TRAMITE%'
+"""
+
+
+def reconstruir_resumen(db: Session, solo_si_vacio: bool = False) -> bool:
+    """
+    Recalcula doctores_resumen desde cero. Bloquea las escrituras en doctores
+    mientras tanto para que ningún cambio quede fuera ni se cuente dos veces.
+    Con `solo_si_vacio` no hace nada si otra instancia ya lo llenó.
+    """
+    if solo_si_vacio and resumen_disponible(db):
+        return False
+
+    try:
+        db.execute(text("LOCK TABLE doctores_resumen IN EXCLUSIVE MODE"))
+        db.execute(text("LOCK TABLE doctores IN SHARE MODE"))
+
+        if solo_si_vacio and resumen_disponible(db):
+            db.rollback()
+            return False
+
+        db.execute(text("DELETE FROM doctores_resumen"))
+        db.execute(text(_SQL_RECONSTRUIR.format(
+            coord_nula=COORDINACION_NULA,
+            lic=_CEDULA_SQL.format(col='cedula_lic'),
+            esp=_CEDULA_SQL.format(col='cedula_esp'),
+        )))
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        raise
+
+
+def asegurar_resumen(db: Session) -> bool:
+    """Crea la tabla si falta y la llena si está vacía. Se llama al arrancar."""
+    models.DoctorResumen.__table__.create(bind=db.get_bind(), checkfirst=True)
+    return reconstruir_resumen(db, solo_si_vacio=True)
+
+
+def resumen_disponible(db: Session) -> bool:
+    return db.execute(select(models.DoctorResumen.entidad).limit(1)).first() is not None
+
+
+def activos_por_entidad(db: Session, entidad: Optional[str] = None):
+    """Médicos activos (coordinacion != '1') por entidad, leídos del resumen."""
+    # Mismo filtro que sobre doctores: en SQL NULL != '1' no se cumple, '' sí
+    query = db.query(
+        models.DoctorResumen.entidad,
+        func.sum(models.DoctorResumen.activos).label("conteo")
+    ).filter(
+        models.DoctorResumen.coordinacion != '1',
+        models.DoctorResumen.coordinacion != COORDINACION_NULA
+    )
+    if entidad is not None:
+        query = query.filter(models.DoctorResumen.entidad == entidad)
+    return query.group_by(models.DoctorResumen.entidad)
@@ -0,0 +1,268 @@
+import os
+import asyncio
+import tempfile
+import urllib.parse
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from io import BytesIO
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Dict, Iterable, Optional
+
+from ..cache import CountCache
+
+# Almacenamiento de archivos detrás de una interfaz común (put, get, delete, presign, stream).
+# Cada uso elige su backend por configuración:
+#   STORAGE_BACKEND_PEAS         reportes y formatos PEAS          (s3 por defecto: Backblaze B2)
+#   STORAGE_BACKEND_EXPEDIENTES  fotos y expedientes de doctores   (firebase por defecto)
+# Con "local" o "memoria" las cargas se pueden probar y medir sin red.
+# Los SDK son síncronos: todas las operaciones corren en un pool de hilos acotado.
+
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "8"))
+CHUNK_BYTES = 1024 * 1024
+
+# Las URL firmadas se reutilizan hasta poco antes de que venzan
+URL_MARGEN = int(os.getenv("STORAGE_URL_MARGEN", "120"))
+
+_executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix="storage")
+
+_urls = CountCache(
+    max_entries=int(os.getenv("STORAGE_URL_CACHE", "4096")),
+    max_bytes=4 * 1024 * 1024
+)
+
+
+async def _en_pool(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+
+class StorageBackend(ABC):
+    """Interfaz; las subclases implementan las versiones síncronas (_put, _abrir, _delete, _presign)."""
+
+    nombre = "base"
+
+    async def put(self, key: str, fileobj: BinaryIO, content_type: Optional[str] = None) -> str:
+        await _en_pool(self._put, key, fileobj, content_type)
+        return key
+
+    async def get(self, key: str) -> bytes:
+        return await _en_pool(self._get, key)
+
+    async def delete(self, key: str):
+        # Las URL ya firmadas de ese objeto (con cualquier vigencia) dejan de servirse
+        _urls.invalidate_tag(self._tag_url(key), propagar=False)
+        await _en_pool(self._delete, key)
+
+    async def try_delete(self, key: str) -> bool:
+        """delete que no propaga errores (p. ej. el objeto ya no existía)."""
+        try:
+            await self.delete(key)
+            return True
+        except Exception as e:
+            print(f"ERROR_DELETE ({self.nombre}): {e}")
+            return False
+
+    async def presign(self, key: str, expira: int = 3600) -> str:
+        # Vigencia en caché: la de la URL menos el margen (sin margen suficiente no se guarda)
+        vigencia = expira - URL_MARGEN
+        if vigencia <= 0:
+            return await _en_pool(self._presign, key, expira)
+        return await _urls.get_or_compute(
+            self._llave_url(key, expira),
+            lambda: _en_pool(self._presign, key, expira),
+            ttl=vigencia, tags=[self._tag_url(key)]
+        )
+
+    async def presign_muchos(self, keys: Iterable[str], expira: int = 3600) -> Dict[str, Optional[str]]:
+        """{key: url} de todas las llaves a la vez; None en las que no se pudieron firmar."""
+        keys = list(dict.fromkeys(k for k in keys if k))
+        resultados = await asyncio.gather(*(self.presign(k, expira) for k in keys), return_exceptions=True)
+        urls = {}
+        for key, resultado in zip(keys, resultados):
+            if isinstance(resultado, Exception):
+                print(f"ERROR_PRESIGN ({self.nombre}) {key}: {resultado}")
+                resultado = None
+            urls[key] = resultado
+        return urls
+
+    def _llave_url(self, key: str, expira: int) -> str:
+        return f"{self.nombre}:{id(self)}:{expira}:{key}"
+
+    def _tag_url(self, key: str) -> str:
+        return f"url:{self.nombre}:{id(self)}:{key}"
+
+    async def stream(self, key: str, chunk: int = CHUNK_BYTES) -> AsyncIterator[bytes]:
+        origen = await _en_pool(self._abrir, key)
+        try:
+            while True:
+                trozo = await _en_pool(origen.read, chunk)
+                if not trozo:
+                    break
+                yield trozo
+        finally:
+            await _en_pool(origen.close)
+
+    def _get(self, key: str) -> bytes:
+        origen = self._abrir(key)
+        try:
+            return origen.read()
+        finally:
+            origen.close()
+
+    @abstractmethod
+    def _put(self, key, fileobj, content_type):
+        ...
+
+    @abstractmethod
+    def _abrir(self, key: str):
+        ...
+
+    @abstractmethod
+    def _delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def _presign(self, key: str, expira: int) -> str:
+        ...
+
+
+class S3Backend(StorageBackend):
+    """S3 o compatible; con la configuración de services/b2_service.py apunta a Backblaze B2."""
+
+    nombre = "s3"
+
+    def __init__(self):
+        from . import b2_service
+        self._client = b2_service.s3_client
+        self._bucket = b2_service.BUCKET
+        self._config = b2_service.TRANSFER_CONFIG
+
+    def _put(self, key, fileobj, content_type):
+        extra = {"ContentType": content_type} if content_type else {}
+        self._client.upload_fileobj(fileobj, self._bucket, key, ExtraArgs=extra, Config=self._config)
+
+    def _abrir(self, key):
+        return self._client.get_object(Bucket=self._bucket, Key=key)["Body"]
+
+    def _delete(self, key):
+        self._client.delete_object(Bucket=self._bucket, Key=key)
+
+    def _presign(self, key, expira):
+        return self._client.generate_presigned_url(
+            ClientMethod='get_object', Params={'Bucket': self._bucket, 'Key': key}, ExpiresIn=expira
+        )
+
+
+class FirebaseBackend(StorageBackend):
+    nombre = "firebase"
+
+    def _bucket(self):
+        import firebase_admin
+        from firebase_admin import storage
+        app_instance = firebase_admin.get_app()
+        return storage.bucket(app_instance.options.get('storageBucket'), app=app_instance)
+
+    def _blob(self, key: str):
+        bucket = self._bucket()
+        return bucket.blob(self._ruta_objeto(key, bucket.name), chunk_size=256 * 1024)
+
+    @staticmethod
+    def _ruta_objeto(key: str, bucket_name: str) -> str:
+        # Registros viejos guardan la URL completa en lugar de la ruta del objeto
+        if '/o/' in key:
+            return urllib.parse.unquote(key.split('/o/')[1].split('?')[0])
+        if f'https://storage.googleapis.com/{bucket_name}/' in key:
+            return key.split(f'https://storage.googleapis.com/{bucket_name}/', 1)[1]
+        if key.startswith(f'gs://{bucket_name}/'):
+            return key.replace(f'gs://{bucket_name}/', '', 1)
+        return key
+
+    def _put(self, key, fileobj, content_type):
+        self._blob(key).upload_from_file(fileobj, content_type=content_type)
+
+    def _abrir(self, key):
+        return self._blob(key).open("rb")
+
+    def _delete(self, key):
+        self._blob(key).delete()
+
+    def _presign(self, key, expira):
+        return self._blob(key).generate_signed_url(expiration=timedelta(seconds=expira), method='GET', version="v4")
+
+
+class LocalBackend(StorageBackend):
+    nombre = "local"
+
+    def __init__(self, raiz: str, url_base: Optional[str] = None):
+        self.raiz = Path(raiz).resolve()
+        self.url_base = url_base.rstrip("/") if url_base else None
+
+    def _ruta(self, key: str) -> Path:
+        ruta = (self.raiz / key.lstrip("/")).resolve()
+        if self.raiz not in ruta.parents:
+            raise ValueError(f"Ruta fuera del almacenamiento: {key}")
+        return ruta
+
+    def _put(self, key, fileobj, content_type):
+        ruta = self._ruta(key)
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        parcial = ruta.with_name(ruta.name + ".part")
+        with open(parcial, "wb") as destino:
+            while True:
+                trozo = fileobj.read(CHUNK_BYTES)
+                if not trozo:
+                    break
+                destino.write(trozo)
+        os.replace(parcial, ruta)
+
+    def _abrir(self, key):
+        return open(self._ruta(key), "rb")
+
+    def _delete(self, key):
+        self._ruta(key).unlink()
+
+    def _presign(self, key, expira):
+        if self.url_base:
+            return f"{self.url_base}/{urllib.parse.quote(key.lstrip('/'))}"
+        return self._ruta(key).as_uri()
+
+
+class MemoryBackend(StorageBackend):
+    nombre = "memoria"
+
+    def __init__(self):
+        self._objetos = {}
+
+    def _put(self, key, fileobj, content_type):
+        self._objetos[key] = fileobj.read()
+
+    def _abrir(self, key):
+        return BytesIO(self._objetos[key])
+
+    def _delete(self, key):
+        del self._objetos[key]
+
+    def _presign(self, key, expira):
+        if key not in self._objetos:
+            raise KeyError(key)
+        return f"memory://{urllib.parse.quote(key)}"
+
+
+def crear_backend(uso: str, por_defecto: str) -> StorageBackend:
+    tipo = os.getenv(f"STORAGE_BACKEND_{uso.upper()}", por_defecto).lower()
+    if tipo == "s3":
+        return S3Backend()
+    if tipo == "firebase":
+        return FirebaseBackend()
+    if tipo == "local":
+        raiz = os.getenv("STORAGE_LOCAL_DIR", os.path.join(tempfile.gettempdir(), "storage"))
+        return LocalBackend(os.path.join(raiz, uso.lower()), os.getenv("STORAGE_LOCAL_URL"))
+    if tipo == "memoria":
+        return MemoryBackend()
+    raise ValueError(f"Backend de almacenamiento desconocido para {uso}: {tipo}")
+
+
+peas = crear_backend("peas", "s3")
+expedientes = crear_backend("expedientes", "firebase")
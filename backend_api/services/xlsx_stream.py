@@ -0,0 +1,161 @@
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, Iterator, Sequence
+from xml.sax.saxutils import escape
+
+# Generador de XLSX por streaming: escribe el SpreadsheetML a mano dentro de un zip
+# que se va vaciando conforme se produce, así la memoria no crece con el número de filas.
+
+MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+CHUNK_BYTES = 64 * 1024
+MAX_CHARS_CELDA = 32767
+EPOCH_EXCEL = datetime(1899, 12, 30)
+
+# Caracteres de control que Excel no acepta dentro del XML
+_ILEGALES = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# Índices de estilo en styles.xml
+ESTILO_FECHA = 1
+ESTILO_FECHA_HORA = 2
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{hoja}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<numFmts count="2"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/><numFmt numFmtId="165" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="3">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+_SHEET_INICIO = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>"""
+
+_SHEET_FIN = "</sheetData></worksheet>"
+
+
+class _BufferSalida:
+    """Destino del zip sin seek(): zipfile escribe descriptores de datos y nosotros vaciamos los bytes."""
+
+    def __init__(self):
+        self._partes = []
+        self.tamano = 0
+
+    def write(self, data) -> int:
+        self._partes.append(bytes(data))
+        self.tamano += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        data = b"".join(self._partes)
+        self._partes = []
+        self.tamano = 0
+        return data
+
+
+def _columna(indice: int) -> str:
+    letras = ""
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _texto(valor: str) -> str:
+    valor = _ILEGALES.sub("", valor)[:MAX_CHARS_CELDA]
+    return escape(valor)
+
+
+def _serial(valor) -> float:
+    if isinstance(valor, datetime):
+        if valor.tzinfo is not None:
+            valor = valor.replace(tzinfo=None)
+        delta = valor - EPOCH_EXCEL
+        return delta.days + delta.seconds / 86400 + delta.microseconds / 86400e6
+    return float((valor - EPOCH_EXCEL.date()).days)
+
+
+def _celda(ref: str, valor) -> str:
+    if valor is None:
+        return ""
+    if isinstance(valor, bool):
+        return f'<c r="{ref}" t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c r="{ref}"><v>{valor}</v></c>'
+    if isinstance(valor, datetime):
+        return f'<c r="{ref}" s="{ESTILO_FECHA_HORA}"><v>{_serial(valor)}</v></c>'
+    if isinstance(valor, date):
+        return f'<c r="{ref}" s="{ESTILO_FECHA}"><v>{_serial(valor):.0f}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{_texto(str(valor))}</t></is></c>'
+
+
+def generar_xlsx(encabezados: Sequence[str], filas: Iterable[Sequence], hoja: str = "Hoja1") -> Iterator[bytes]:
+    """
+    Genera un XLSX de una hoja como trozos de bytes conforme se consumen `filas`.
+    Las celdas None quedan vacías; fechas y datetimes llevan formato de fecha.
+    """
+    letras = [_columna(i) for i in range(1, len(encabezados) + 1)]
+    salida = _BufferSalida()
+
+    with zipfile.ZipFile(salida, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=5) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _RELS)
+        zf.writestr("xl/workbook.xml", _WORKBOOK.format(hoja=escape(hoja[:31], {'"': "&quot;"})))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        zf.writestr("xl/styles.xml", _STYLES)
+
+        with zf.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as sheet:
+            sheet.write(_SHEET_INICIO.encode())
+            num_fila = 1
+            for fila in _con_encabezado(encabezados, filas):
+                celdas = "".join(
+                    _celda(f"{letras[i]}{num_fila}", valor) for i, valor in enumerate(fila)
+                )
+                sheet.write(f'<row r="{num_fila}">{celdas}</row>'.encode())
+                num_fila += 1
+                if salida.tamano >= CHUNK_BYTES:
+                    yield salida.vaciar()
+            sheet.write(_SHEET_FIN.encode())
+
+    yield salida.vaciar()
+
+
+def _con_encabezado(encabezados, filas):
+    yield encabezados
+    yield from filas
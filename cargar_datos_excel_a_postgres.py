@@ -200,6 +200,15 @@ try:
     conn.commit() # Guardar todas las inserciones exitosas
     print(f"Inserción/actualización completada. Se procesaron {count} registros.")
 
+    # --- 5. Recalcular doctores_resumen ---
+    # Esta carga escribe directo en doctores sin pasar por resumen_service; sin recalcular,
+    # el dashboard y la capacidad por entidad seguirían mostrando los conteos anteriores
+    if count:
+        url_bd = f"postgresql://{db_user}:{db_password}@{db_host}:{db_port.strip()}/{db_name}"
+        os.environ.setdefault("DATABASE_URL", url_bd) # backend_api.database la exige al importarse
+        from backend_api.reconstruir_resumen import reconstruir
+        reconstruir(url_bd)
+
 except FileNotFoundError:
     print(f"Error: No se encontró el archivo Excel '{nombre_archivo_excel}'.")
 except psycopg2.Error as db_error:
@@ -212,7 +221,7 @@ except Exception as e:
         conn.rollback() # Revertir transacción en caso de otros errores
 
 finally:
-    # --- 5. Cerrar Conexión ---
+    # --- 6. Cerrar Conexión ---
     if cursor:
         cursor.close()
         print("Cursor cerrado.")
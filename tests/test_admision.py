@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from backend_api.services.admision import Limitador
+
+
+async def _ceder(veces: int = 3):
+    for _ in range(veces):
+        await asyncio.sleep(0)
+
+
+def test_cola_llena_responde_429_con_retry_after():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=1, cola=1, espera_max=5)
+        permiso = await limitador.entrar()
+        en_cola = asyncio.ensure_future(limitador.entrar())
+        await _ceder()
+
+        with pytest.raises(HTTPException) as error:
+            await limitador.entrar()
+
+        permiso.liberar()
+        (await en_cola).liberar()
+        return error.value, limitador.stats()
+
+    error, stats = asyncio.run(escenario())
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) >= 1
+    assert stats["rechazos"] == 1
+    assert stats["activos"] == 0 and stats["esperando"] == 0
+
+
+def test_espera_vencida_responde_429():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=1, cola=5, espera_max=0.05)
+        permiso = await limitador.entrar()
+        with pytest.raises(HTTPException) as error:
+            await limitador.entrar()
+        permiso.liberar()
+        # El lugar que quedó libre se puede volver a tomar
+        (await limitador.entrar()).liberar()
+        return error.value, limitador.stats()
+
+    error, stats = asyncio.run(escenario())
+    assert error.status_code == 429
+    assert "tiempo de espera" in error.detail
+    assert stats["esperando"] == 0 and stats["activos"] == 0
+
+
+def test_cancelar_en_cola_no_pierde_lugares():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=1, cola=5, espera_max=5)
+        permiso = await limitador.entrar()
+        en_cola = asyncio.ensure_future(limitador.entrar())
+        await _ceder()
+        en_cola.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await en_cola
+        permiso.liberar()
+        return await asyncio.wait_for(limitador.entrar(), 1), limitador
+
+    permiso, limitador = asyncio.run(escenario())
+    assert limitador.stats()["activos"] == 1
+    permiso.liberar()
+
+
+def test_cancelar_justo_cuando_se_concede_devuelve_el_lugar():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=1, cola=5, espera_max=5)
+        permiso = await limitador.entrar()
+        en_cola = asyncio.ensure_future(limitador.entrar())
+        await _ceder()
+        # El semáforo le concede el lugar y la petición se cancela antes de enterarse
+        permiso.liberar()
+        en_cola.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await en_cola
+        siguiente = await asyncio.wait_for(limitador.entrar(), 1)
+        siguiente.liberar()
+        return limitador
+
+    limitador = asyncio.run(escenario())
+    assert limitador.stats()["activos"] == 0
+    assert not limitador._semaforo.locked()
+
+
+def test_liberar_dos_veces_no_suelta_lugar_ajeno():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=2, cola=0, espera_max=1)
+        primero = await limitador.entrar()
+        segundo = await limitador.entrar()
+        primero.liberar()
+        primero.liberar()
+        await primero.aliberar()
+        return limitador, segundo
+
+    limitador, segundo = asyncio.run(escenario())
+    assert limitador.stats()["activos"] == 1
+    assert limitador._semaforo._value == 1
+    segundo.liberar()
+    assert limitador._semaforo._value == 2
+
+
+def test_transmitir_libera_al_cortarse_el_envio():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=1, cola=0, espera_max=1)
+        permiso = await limitador.entrar()
+        cuerpo = permiso.transmitir(iter([b"a", b"b", b"c"]))
+        primero = await cuerpo.__anext__()
+        activos_durante = limitador.stats()["activos"]
+        await cuerpo.aclose()
+        return primero, activos_durante, limitador.stats()["activos"]
+
+    assert asyncio.run(escenario()) == (b"a", 1, 0)
+
+
+def test_dependencia_libera_al_terminar_el_endpoint():
+    async def escenario():
+        limitador = Limitador("prueba", concurrencia=1, cola=0, espera_max=1)
+        dependencia = limitador()
+        await dependencia.__anext__()
+        activos_durante = limitador.stats()["activos"]
+        with pytest.raises(StopAsyncIteration):
+            await dependencia.__anext__()
+        return activos_durante, limitador.stats()["activos"]
+
+    assert asyncio.run(escenario()) == (1, 0)
@@ -0,0 +1,83 @@
+from datetime import datetime, time
+from io import BytesIO
+
+import pandas as pd
+import pytest
+import pytz
+
+from backend_api.services import asistencia_excel as ax
+
+
+def _excel(filas: list) -> bytes:
+    columnas = [ax.COL_FECHA, ax.COL_TURNO, ax.COL_ENTRADA, ax.COL_SALIDA, ax.COL_OBSERVACIONES]
+    buffer = BytesIO()
+    pd.DataFrame(filas, columns=columnas).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def _utc_pytz(fecha: str, hora: str) -> datetime:
+    # Conversión fila por fila que se hacía antes, como referencia
+    local = pytz.timezone(ax.ZONA_LOCAL).localize(datetime.strptime(f"{fecha} {hora}", "%Y-%m-%d %H:%M"))
+    return local.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def test_lee_columnas_y_convierte_a_utc():
+    contenido = _excel([
+        ["03/03/2025", "Matutino", "08:00", "15:30", "ok"],
+        ["04/03/2025", None, time(9, 15), None, None],
+        [None, None, None, None, None],
+        ["05/03/2025", "Matutino", None, None, "falta"],
+    ])
+
+    asistencia = ax.leer_asistencia(contenido, 2025, 3, 1)
+
+    assert list(asistencia.fechas) == ["2025-03-03", "2025-03-04", "2025-03-05"]
+    assert list(asistencia.turnos) == ["Matutino", "No especificado", "Matutino"]
+    assert list(asistencia.entradas) == ["08:00", "09:15:00", ax.SIN_HORA]
+    assert list(asistencia.salidas) == ["15:30", ax.SIN_HORA, ax.SIN_HORA]
+    assert list(asistencia.observaciones) == ["ok", "", "falta"]
+    assert asistencia.dias_validos == 2
+    assert ax.marcajes(asistencia) == [
+        ("Entrada", datetime(2025, 3, 3, 14, 0)),
+        ("Entrada", datetime(2025, 3, 4, 15, 15)),
+        ("Salida", datetime(2025, 3, 3, 21, 30)),
+    ]
+    assert ax.detalle(asistencia)[1] == {
+        "fecha": "2025-03-04", "turno": "No especificado", "entrada": "09:15:00",
+        "salida": ax.SIN_HORA, "observaciones": "",
+    }
+
+
+@pytest.mark.parametrize("fecha, hora", [
+    ("2021-10-31", "01:30"),  # hora ambigua al terminar el horario de verano
+    ("2021-04-04", "02:30"),  # hora que no existe al empezar el horario de verano
+    ("2021-07-15", "23:45"),  # horario de verano
+    ("2023-07-15", "23:45"),  # sin horario de verano desde 2022
+])
+def test_utc_igual_que_pytz(fecha, hora):
+    fechas = pd.Series(pd.to_datetime([fecha]))
+    utc, invalidas = ax._a_utc(fechas, pd.Series([hora]))
+
+    assert not invalidas.any()
+    assert utc.iloc[0].to_pydatetime() == _utc_pytz(fecha, hora)
+
+
+def test_errores_juntan_todas_las_filas():
+    contenido = _excel([
+        ["01/03/2025", "Matutino", "08:00", "15:00", None],
+        ["no es fecha", "Matutino", "08:00", "15:00", None],
+        ["20/03/2025", "Matutino", "08:00", "15:00", None],
+        ["02/03/2025", "Matutino", "8 en punto", "15:00", None],
+    ])
+
+    with pytest.raises(ax.ErrorExcel) as error:
+        ax.leer_asistencia(contenido, 2025, 3, 1)
+
+    mensaje = str(error.value)
+    assert "Fecha inválida en fila(s) 3." in mensaje
+    assert "filas 4 (20/03/2025) no pertenecen a la Quincena 1 del mes 3/2025" in mensaje
+    assert "HH:MM en fila(s) 5." in mensaje
+
+
+def test_periodo_segunda_quincena_hasta_fin_de_mes():
+    assert ax.periodo(2024, 2, 2) == (datetime(2024, 2, 16).date(), datetime(2024, 2, 29).date())
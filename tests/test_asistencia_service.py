@@ -0,0 +1,72 @@
+from datetime import date, datetime, timezone
+
+from sqlalchemy import select
+
+from backend_api import models
+from backend_api.services import asistencia_service
+
+
+def _marcajes(db, id_imss: str) -> list:
+    return db.execute(
+        select(models.PeasAsistencia.tipo, models.PeasAsistencia.fecha_hora)
+        .where(models.PeasAsistencia.id_imss == id_imss)
+        .order_by(models.PeasAsistencia.fecha_hora, models.PeasAsistencia.tipo)
+    ).all()
+
+
+def _doctor(db, id_imss: str = "A1"):
+    db.add(models.Doctor(id_imss=id_imss, is_deleted=False))
+    db.flush()
+
+
+def test_copy_guarda_instantes_utc(db):
+    _doctor(db)
+    nuevos = [
+        ("Entrada", datetime(2025, 3, 3, 14, 0)),
+        ("Salida", datetime(2025, 3, 3, 21, 30, 15)),
+        ("Entrada", datetime(2025, 3, 4, 15, 15)),
+    ]
+
+    assert db.connection().dialect.driver == "psycopg2"
+    assert asistencia_service.guardar_marcajes(db, "A1", nuevos) == 3
+
+    assert _marcajes(db, "A1") == [
+        (tipo, fecha.replace(tzinfo=timezone.utc)) for tipo, fecha in nuevos
+    ]
+
+
+def test_copy_se_deshace_con_la_transaccion(db):
+    _doctor(db)
+    guardado = db.begin_nested()
+    asistencia_service.guardar_marcajes(db, "A1", [("Entrada", datetime(2025, 3, 3, 14, 0))])
+    assert len(_marcajes(db, "A1")) == 1
+
+    guardado.rollback()
+
+    assert _marcajes(db, "A1") == []
+
+
+def test_sin_marcajes_no_ejecuta_nada(db, contar_consultas):
+    assert asistencia_service.guardar_marcajes(db, "A1", []) == 0
+    assert contar_consultas == []
+
+
+def test_borrar_periodo_usa_dias_locales(db):
+    _doctor(db)
+    _doctor(db, "B2")
+    asistencia_service.guardar_marcajes(db, "A1", [
+        ("Entrada", datetime(2025, 3, 1, 5, 59)),   # 28/02 23:59 hora local
+        ("Entrada", datetime(2025, 3, 1, 6, 0)),    # 01/03 00:00 hora local
+        ("Salida", datetime(2025, 3, 16, 5, 59)),   # 15/03 23:59 hora local
+        ("Entrada", datetime(2025, 3, 16, 6, 0)),   # 16/03 00:00 hora local
+    ])
+    asistencia_service.guardar_marcajes(db, "B2", [("Entrada", datetime(2025, 3, 5, 14, 0))])
+
+    borrados = asistencia_service.borrar_periodo(db, "A1", date(2025, 3, 1), date(2025, 3, 15))
+
+    assert borrados == 2
+    assert _marcajes(db, "A1") == [
+        ("Entrada", datetime(2025, 3, 1, 5, 59, tzinfo=timezone.utc)),
+        ("Entrada", datetime(2025, 3, 16, 6, 0, tzinfo=timezone.utc)),
+    ]
+    assert len(_marcajes(db, "B2")) == 1
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend_api import cache as cache_modulo
+from backend_api.cache import CountCache, tag_nacional, tags_doctor
+
+
+def test_escribir_un_doctor_no_invalida_los_agregados_nacionales():
+    cache = CountCache()
+    cache.set("nacional", 100, ttl=60, tags=[tag_nacional("0")])
+    cache.set("oaxaca", 10, ttl=60, tags=["entidad:OAXACA"])
+    cache.set("jalisco", 20, ttl=60, tags=["entidad:JALISCO"])
+
+    cache.invalidate_tag(*tags_doctor("OAXACA", "0", "OCIMS001"), propagar=False)
+
+    assert cache.get("nacional") == 100
+    assert cache.get("oaxaca") is None
+    assert cache.get("jalisco") == 20
+
+
+def test_doctor_sin_entidad_invalida_lo_nacional():
+    assert tags_doctor(None, "1", "CL1") == [tag_nacional("1"), "clues:CL1"]
+    assert tag_nacional(None) == tag_nacional("0") != tag_nacional("1")
+
+
+class Reloj:
+    """Sustituye al módulo time dentro de cache.py para mover el tiempo a mano."""
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def monotonic(self):
+        return self.ahora
+
+    def sleep(self, segundos):
+        # El hilo que barre la caché duerme de verdad y no mueve el reloj
+        time.sleep(segundos)
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cache_modulo, "time", reloj)
+    return reloj
+
+
+def test_lru_desaloja_la_entrada_menos_usada():
+    cache = CountCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" pasa a ser la más reciente
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_limite_por_bytes():
+    cache = CountCache(max_bytes=1000)
+    cache.set("grande", b"x" * 600)
+    cache.set("otra", b"y" * 600)
+
+    assert cache.get("grande") is None
+    assert cache.get("otra") == b"y" * 600
+    assert cache.stats()["bytes"] <= 1000
+
+
+def test_un_valor_mayor_al_limite_no_se_guarda():
+    cache = CountCache(max_bytes=100)
+    cache.set("enorme", b"x" * 500)
+
+    assert cache.get("enorme") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_ttl_y_ventana_stale(reloj):
+    cache = CountCache()
+    cache.set("k", 1, ttl=10, stale_ttl=5)
+
+    reloj.ahora += 9
+    assert cache.get("k") == 1
+    reloj.ahora += 2
+    assert cache.get("k") is None  # vencida: get no devuelve valores stale
+    assert cache.stats()["entries"] == 1
+    reloj.ahora += 5
+    assert cache.sweep() == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_escrituras_concurrentes_no_descuadran_los_bytes():
+    cache = CountCache(max_entries=50)
+
+    def escribir(hilo):
+        for n in range(500):
+            cache.set(f"{hilo}:{n % 80}", "v" * (n % 7), ttl=60)
+            cache.get(f"{(hilo + 1) % 8}:{n % 80}")
+
+    hilos = [threading.Thread(target=escribir, args=(h,)) for h in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    stats = cache.stats()
+    assert stats["entries"] <= 50
+    assert stats["bytes"] == sum(e["size"] for e in cache._cache.values())
+
+
+def test_single_flight_calcula_una_sola_vez():
+    cache = CountCache()
+    llamadas = []
+
+    async def calcular():
+        llamadas.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    async def principal():
+        return await asyncio.gather(*(cache.get_or_compute("k", calcular, ttl=60) for _ in range(20)))
+
+    assert asyncio.run(principal()) == [42] * 20
+    assert len(llamadas) == 1
+    assert cache.get("k") == 42
+
+
+def test_valor_stale_se_sirve_y_se_refresca_una_vez(reloj):
+    cache = CountCache()
+    cache.set("k", "viejo", ttl=10, stale_ttl=30)
+    reloj.ahora += 15
+    llamadas = []
+
+    async def calcular():
+        llamadas.append(1)
+        await asyncio.sleep(0.01)
+        return "nuevo"
+
+    async def principal():
+        respuestas = [await cache.get_or_compute("k", calcular, ttl=10, stale_ttl=30) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        return respuestas
+
+    assert asyncio.run(principal()) == ["viejo"] * 5
+    assert len(llamadas) == 1
+    assert cache.get("k") == "nuevo"
+
+
+def test_invalidacion_durante_el_calculo_no_guarda_el_resultado():
+    cache = CountCache()
+
+    async def calcular():
+        await asyncio.sleep(0.01)
+        return 1
+
+    async def principal():
+        tarea = asyncio.ensure_future(cache.get_or_compute("k", calcular, ttl=60, tags=["entidad:X"]))
+        await asyncio.sleep(0)
+        cache.invalidate_tag("entidad:X", propagar=False)
+        return await tarea
+
+    assert asyncio.run(principal()) == 1
+    assert cache.get("k") is None
+
+
+def test_un_error_no_queda_en_cache():
+    cache = CountCache()
+    intentos = []
+
+    def calcular():
+        intentos.append(1)
+        if len(intentos) == 1:
+            raise RuntimeError("falla")
+        return "ok"
+
+    async def principal():
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("k", calcular, ttl=60)
+        return await cache.get_or_compute("k", calcular, ttl=60)
+
+    assert asyncio.run(principal()) == "ok"
+    assert len(intentos) == 2
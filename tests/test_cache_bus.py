@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+from backend_api.cache import CountCache
+from backend_api.services.cache_bus import CacheBus
+
+
+def _bus():
+    cache = CountCache()
+    publicados = []
+    cache.set_publisher(publicados.append)
+    return CacheBus(cache), cache, publicados
+
+
+def _aviso(origen: str, **mensaje) -> str:
+    return json.dumps({"origen": origen, **mensaje})
+
+
+def test_aplica_invalidaciones_de_otro_proceso_sin_reenviarlas():
+    bus, cache, publicados = _bus()
+    cache.set("oaxaca", 1, ttl=60, tags=["entidad:OAXACA"])
+    cache.set("jalisco", 2, ttl=60, tags=["entidad:JALISCO"])
+
+    bus._recibir(None, 1, "canal", _aviso("otro-worker", tags=["entidad:OAXACA"]))
+
+    assert cache.get("oaxaca") is None
+    assert cache.get("jalisco") == 2
+    assert publicados == []
+
+
+def test_ignora_sus_propios_avisos():
+    bus, cache, _ = _bus()
+    cache.set("oaxaca", 1, ttl=60, tags=["entidad:OAXACA"])
+
+    bus._recibir(None, 1, "canal", _aviso(bus._origen, tags=["entidad:OAXACA"]))
+
+    assert cache.get("oaxaca") == 1
+
+
+def test_invalidacion_por_patron_y_avisos_malformados():
+    bus, cache, _ = _bus()
+    cache.set("dashboard:1", 1)
+    cache.set("otra", 2)
+
+    bus._recibir(None, 1, "canal", "no es json")
+    assert cache.get("dashboard:1") == 1
+
+    bus._recibir(None, 1, "canal", _aviso("otro-worker", pattern="dashboard"))
+    assert cache.get("dashboard:1") is None
+    assert cache.get("otra") == 2
+
+
+def test_publicar_encola_con_el_loop_del_bus():
+    bus = CacheBus(CountCache())
+    bus.publicar({"tags": ["x"]})  # antes de iniciar no hace nada
+
+    async def principal():
+        bus._loop = asyncio.get_running_loop()
+        bus._cola = asyncio.Queue()
+        await asyncio.to_thread(bus.publicar, {"tags": ["entidad:OAXACA"]})
+        return await asyncio.wait_for(bus._cola.get(), 1)
+
+    assert asyncio.run(principal()) == {"tags": ["entidad:OAXACA"]}
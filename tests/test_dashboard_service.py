@@ -0,0 +1,109 @@
+import asyncio
+import random
+
+import pytest
+from sqlalchemy import text
+
+from backend_api import models
+from backend_api.services import dashboard_service, resumen_service
+
+# El dashboard de una sola consulta (y su versión sobre doctores_resumen) contra las consultas
+# por métrica que había antes en routers/graficas.py
+
+ESTATUS_MAP = dashboard_service.ESTATUS_MAP
+CEDULA = """
+    {col} IS NOT NULL AND {col} != ''
+    AND {col} NOT ILIKE '%NULL%' AND {col} NOT ILIKE '%BAJA%' AND {col} NOT ILIKE '%TRAMITE%'
+"""
+
+
+def dashboard_original(db, tipo: str) -> dict:
+    filtro = '1' if tipo == "administrativos" else '0'
+    condicion = "coordinacion = '1'" if tipo == "administrativos" else "coordinacion != '1'"
+    escalar = lambda sql: db.execute(text(sql), {"f": filtro}).scalar()
+
+    estatus = db.execute(text(f"""
+        SELECT SUBSTRING(TRIM(UPPER(estatus)) FROM 1 FOR 2) as code, COUNT(*) as value
+        FROM doctores
+        WHERE estatus IS NOT NULL AND TRIM(estatus) != '' AND {condicion} AND is_deleted = false
+        GROUP BY code
+    """)).all()
+    nivel = db.execute(text(f"""
+        SELECT nivel_atencion as label, COUNT(*) as value FROM doctores
+        WHERE nivel_atencion IS NOT NULL AND nivel_atencion != ''
+          AND estatus = '01 ACTIVO' AND {condicion} AND is_deleted = false
+        GROUP BY nivel_atencion
+    """)).all()
+    estados = db.execute(text("""
+        SELECT c.entidad, c.minimo, c.maximo, COALESCE(d.conteo, 0) AS value
+        FROM entidad_cupos c LEFT JOIN (
+            SELECT entidad, COUNT(*) AS conteo FROM doctores
+            WHERE is_deleted = false AND estatus = '01 ACTIVO' AND coordinacion = :f
+            GROUP BY entidad
+        ) d ON d.entidad = c.entidad
+    """), {"f": filtro}).all()
+    genero = dict(db.execute(text(f"""
+        SELECT sexo, COUNT(*) FROM doctores
+        WHERE is_deleted = false AND {condicion} AND estatus != '06 BAJA' AND sexo IS NOT NULL
+        GROUP BY sexo
+    """)).all())
+    base = "FROM doctores WHERE is_deleted = false AND coordinacion = :f AND estatus != '06 BAJA'"
+    return {
+        "total_general": escalar(f"SELECT COUNT(*) {base}"),
+        "universo_total": escalar("SELECT COUNT(*) FROM doctores WHERE is_deleted = false"),
+        "data_estatus": sorted(
+            ({"id": ESTATUS_MAP.get(r.code, r.code), "label": ESTATUS_MAP.get(r.code, r.code), "value": r.value}
+             for r in estatus), key=lambda x: (x["value"], x["id"])),
+        "data_nivel": sorted(({"label": r.label, "value": r.value} for r in nivel),
+                             key=lambda x: (x["value"], x["label"])),
+        "data_estados": sorted(
+            ({"label": r.entidad, "value": r.value, "minimo": r.minimo, "maximo": r.maximo} for r in estados),
+            key=lambda x: x["label"]),
+        "cedulas_licenciatura": escalar(f"SELECT COUNT(*) {base} AND {CEDULA.format(col='cedula_lic')}"),
+        "cedulas_especialidad": escalar(f"SELECT COUNT(*) {base} AND {CEDULA.format(col='cedula_esp')}"),
+        "total_mujeres": genero.get("F", 0),
+        "total_hombres": genero.get("H", 0),
+    }
+
+
+def _normalizar(datos: dict) -> dict:
+    # El orden entre empates no está definido en ninguna de las dos versiones
+    return {
+        **datos,
+        "data_estatus": sorted(datos["data_estatus"], key=lambda x: (x["value"], x["id"])),
+        "data_nivel": sorted(datos["data_nivel"], key=lambda x: (x["value"], x["label"])),
+        "data_estados": sorted(datos["data_estados"], key=lambda x: x["label"]),
+    }
+
+
+def _cargar(db, semilla: int):
+    azar = random.Random(semilla)
+    for entidad in ("JALISCO", "SONORA", "OAXACA"):
+        db.add(models.EntidadCupos(entidad=entidad, minimo=1, maximo=50))
+    for n in range(400):
+        db.add(models.Doctor(
+            id_imss=f"T{n:04d}",
+            entidad=azar.choice(["JALISCO", "SONORA", "YUCATAN", "", None]),
+            coordinacion=azar.choice(["0", "1", "", None]),
+            estatus=azar.choice(["01 ACTIVO", "06 BAJA", "05 INCAPACIDAD", " 02 retiro", "", None]),
+            nivel_atencion=azar.choice(["PRIMER NIVEL", "SEGUNDO NIVEL", "", None]),
+            sexo=azar.choice(["F", "H", "X", None]),
+            cedula_lic=azar.choice(["123", "EN TRAMITE", "baja", "", None]),
+            cedula_esp=azar.choice(["456", "NULL", "", None]),
+            is_deleted=azar.random() < 0.1,
+        ))
+    db.flush()
+
+
+@pytest.mark.parametrize("semilla", [1, 2, 3])
+@pytest.mark.parametrize("tipo", ["medicos", "administrativos"])
+def test_dashboard_coincide_con_las_consultas_originales(db, db_async, semilla, tipo):
+    _cargar(db, semilla)
+    esperado = dashboard_original(db, tipo)
+
+    sin_resumen = asyncio.run(dashboard_service.calcular_dashboard(db_async, tipo))
+    resumen_service.reconstruir_resumen(db)
+    con_resumen = asyncio.run(dashboard_service.calcular_dashboard(db_async, tipo))
+
+    assert _normalizar(sin_resumen) == esperado
+    assert _normalizar(con_resumen) == esperado
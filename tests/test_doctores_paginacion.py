@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from backend_api import models
+from backend_api.routers.doctores import leer_doctores
+
+
+def _pagina(db_async, **kwargs):
+    parametros = dict(skip=0, limit=3, search=None, estatus="todos", coordinacion="todos", cursor=None)
+    parametros.update(kwargs)
+    return asyncio.run(leer_doctores(db=db_async, current_user=models.User(role="admin"), **parametros))
+
+
+def test_el_cursor_recorre_todas_las_paginas_desde_la_primera(db, db_async):
+    ids = [f"P{n:03d}" for n in range(8)]
+    for id_imss in ids:
+        db.add(models.Doctor(id_imss=id_imss, estatus="01 ACTIVO", coordinacion="0"))
+    db.flush()
+
+    vistos = []
+    pagina = _pagina(db_async)
+    while True:
+        vistos += [d.id_imss for d in pagina["doctores"]]
+        if not pagina["next_cursor"]:
+            break
+        pagina = _pagina(db_async, cursor=pagina["next_cursor"])
+
+    assert [v for v in vistos if v.startswith("P")] == ids
+
+
+def test_cursor_y_skip_juntos_se_rechazan(db_async):
+    with pytest.raises(HTTPException) as error:
+        _pagina(db_async, skip=3, cursor="eyJpZCI6ICJQMDAyIn0=")
+    assert error.value.status_code == 400
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from backend_api import api_peas, models, security
+from backend_api.api_peas import _rutas_visibles
+from backend_api.routers import archivos
+from backend_api.services import storage
+
+PERIODO = "2025-03-Q1"
+
+
+def _cargar(db):
+    for id_imss, entidad, clues in [("D1", "JALISCO", "JCIMS001"), ("D2", "JALISCO", "JCIMS002"), ("D3", "SONORA", "SRIMS001")]:
+        db.add(models.Doctor(id_imss=id_imss, entidad=entidad, clues=clues))
+    db.flush()
+    for id_imss in ("D1", "D2", "D3"):
+        db.add(models.ReporteQuincenal(
+            id_imss=id_imss, quincena=PERIODO,
+            url_documento=f"reportes/{id_imss}.pdf", url_excel=f"reportes/{id_imss}.xlsx"
+        ))
+    db.add(models.FormatoEstatalFirmado(entidad="JALISCO", quincena=PERIODO, url_documento="estatales/JALISCO.pdf"))
+    db.add(models.FormatoEstatalFirmado(entidad="SONORA", quincena=PERIODO, url_documento="estatales/SONORA.pdf"))
+    db.add(models.FormatoNacionalFirmado(quincena=PERIODO, url_documento="nacionales/2025-03-Q1.pdf"))
+    db.flush()
+
+
+RUTAS = [
+    "reportes/D1.pdf", "reportes/D1.xlsx", "reportes/D2.pdf", "reportes/D3.pdf",
+    "estatales/JALISCO.pdf", "estatales/SONORA.pdf", "nacionales/2025-03-Q1.pdf",
+    "otra/ruta/cualquiera.pdf",
+]
+
+
+def _visibles(db_async, usuario):
+    return asyncio.run(_rutas_visibles(db_async, RUTAS, usuario))
+
+
+def test_responsable_unidad_solo_ve_reportes_de_su_clues(db, db_async):
+    _cargar(db)
+    usuario = models.UsuarioAcceso(rol="responsable_unidad", clues="JCIMS001")
+
+    assert _visibles(db_async, usuario) == {"reportes/D1.pdf", "reportes/D1.xlsx"}
+
+
+def test_coordinador_estatal_ve_su_entidad(db, db_async):
+    _cargar(db)
+    usuario = models.UsuarioAcceso(rol="coordinador_estatal", entidad="JALISCO")
+
+    assert _visibles(db_async, usuario) == {
+        "reportes/D1.pdf", "reportes/D1.xlsx", "reportes/D2.pdf", "estatales/JALISCO.pdf"
+    }
+
+
+def test_admin_ve_todo_lo_registrado(db, db_async):
+    _cargar(db)
+    usuario = models.User(role="admin")
+
+    assert _visibles(db_async, usuario) == set(RUTAS) - {"otra/ruta/cualquiera.pdf"}
+
+
+def test_sin_clues_asignada_se_rechaza(db, db_async):
+    _cargar(db)
+    with pytest.raises(HTTPException) as error:
+        _visibles(db_async, models.UsuarioAcceso(rol="responsable_unidad"))
+    assert error.value.status_code == 403
+
+
+def _cliente(db_async, usuario, router) -> TestClient:
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[api_peas.get_async_db] = lambda: db_async
+    app.dependency_overrides[security.get_current_user] = lambda: usuario
+    return TestClient(app)
+
+
+def test_ver_documento_solo_firma_rutas_visibles(db, db_async, monkeypatch):
+    _cargar(db)
+    backend = storage.MemoryBackend()
+    backend._objetos.update({"reportes/D1.pdf": b"1", "reportes/D2.pdf": b"2"})
+    monkeypatch.setattr(storage, "peas", backend)
+    cliente = _cliente(db_async, models.UsuarioAcceso(rol="responsable_unidad", clues="JCIMS001"), api_peas.router)
+    url = "/api/peas/reporte-quincenal/ver-documento"
+
+    assert cliente.get(url, params={"ruta": "reportes/D1.pdf"}).json() == {"url": "memory://reportes/D1.pdf"}
+    assert cliente.get(url, params={"ruta": "reportes/D2.pdf"}).status_code == 404
+    assert cliente.get(url, params={"ruta": "otra/ruta/cualquiera.pdf"}).status_code == 404
+
+
+def test_ver_documento_exige_sesion():
+    app = FastAPI()
+    app.include_router(api_peas.router)
+
+    respuesta = TestClient(app).get("/api/peas/reporte-quincenal/ver-documento", params={"ruta": "reportes/D1.pdf"})
+
+    assert respuesta.status_code == 401
+
+
+def test_signed_urls_de_expedientes_con_sesion_asincrona(db, db_async, monkeypatch):
+    _cargar(db)
+    adjuntos = [
+        models.DoctorAttachment(doctor_id=id_imss, file_name="a.pdf", file_url=f"doctors/{id_imss}/a.pdf",
+                                documento_tipo="cedula")
+        for id_imss in ("D1", "D3")
+    ]
+    db.add_all(adjuntos)
+    db.flush()
+    backend = storage.MemoryBackend()
+    backend._objetos.update({a.file_url: b"1" for a in adjuntos})
+    monkeypatch.setattr(storage, "expedientes", backend)
+    cliente = _cliente(db_async, models.UsuarioAcceso(rol="coordinador_estatal", entidad="JALISCO"), archivos.router)
+
+    respuesta = cliente.post("/api/attachments/signed-urls", json={"ids": [adjuntos[0].id, adjuntos[1].id, 0]})
+
+    assert respuesta.json()["signed_urls"] == {
+        str(adjuntos[0].id): "memory://doctors/D1/a.pdf", str(adjuntos[1].id): None, "0": None,
+    }
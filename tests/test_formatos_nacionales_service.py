@@ -0,0 +1,129 @@
+from sqlalchemy import text
+
+from backend_api import models
+from backend_api.services import formatos_nacionales_service as servicio
+
+PERIODO = "2025-03-Q1"
+
+
+def _formato(db, entidad: str, estado=models.EstadoReporte.APROBADO, periodo: str = PERIODO):
+    db.add(models.FormatoEstatalFirmado(entidad=entidad, quincena=periodo, url_documento=f"{entidad}.pdf", estado=estado))
+
+
+def _validado(db, entidad: str, medico: str, dias: int, unidad: str = "HGZ 1", periodo: str = PERIODO):
+    db.add(models.BitacoraEstatalValidada(
+        id_imss=medico, quincena_validada=periodo, profesional_salud=medico,
+        entidad=entidad, unidad_medica=unidad, dias_participacion=dias
+    ))
+
+
+def test_formatos_aprobados_repetidos_no_duplican_dias(db):
+    _formato(db, "JALISCO")
+    _formato(db, "JALISCO")
+    _validado(db, "JALISCO", "PEREZ", 10)
+    _validado(db, "JALISCO", "LOPEZ", 5)
+    db.flush()
+
+    datos = servicio.calcular(db, [PERIODO])
+
+    assert sorted(m["dias"] for m in datos["medicos"]) == [5, 10]
+    assert datos["resumen"] == [{"entidad": "JALISCO", "medicos": 2, "dias": 15}]
+
+
+def test_formato_no_aprobado_no_cuenta(db):
+    _formato(db, "JALISCO")
+    _formato(db, "SONORA", estado=models.EstadoReporte.RECHAZADO)
+    _validado(db, "JALISCO", "PEREZ", 10)
+    _validado(db, "SONORA", "LOPEZ", 5)
+    db.flush()
+
+    datos = servicio.calcular(db, [PERIODO])
+
+    assert [m["entidad"] for m in datos["medicos"]] == ["JALISCO"]
+
+
+def test_orden_de_la_base_de_datos(db):
+    nombres = ["ÁLVAREZ", "ZAMORA", "álvarez", "Ñuño", "NAVA", "ortiz"]
+    _formato(db, "JALISCO")
+    _formato(db, "CAMPECHE")
+    for nombre in nombres:
+        _validado(db, "JALISCO", nombre, 1)
+    _validado(db, "CAMPECHE", "SOLIS", 1)
+    db.flush()
+
+    datos = servicio.calcular(db, [PERIODO])
+
+    # El orden esperado es el de la collation de la BD, no el de Python
+    esperado = [nombre for (nombre,) in db.execute(
+        text("SELECT n FROM unnest(CAST(:n AS varchar[])) AS n ORDER BY n"), {"n": nombres}
+    )]
+    assert [m["entidad"] for m in datos["medicos"]] == ["CAMPECHE"] + ["JALISCO"] * len(nombres)
+    assert [m["medico"] for m in datos["medicos"][1:]] == esperado
+    assert [r["entidad"] for r in datos["resumen"]] == ["CAMPECHE", "JALISCO"]
+
+
+def test_mes_completo_suma_las_dos_quincenas(db):
+    q2 = "2025-03-Q2"
+    _formato(db, "JALISCO")
+    _formato(db, "JALISCO", periodo=q2)
+    _validado(db, "JALISCO", "PEREZ", 10)
+    _validado(db, "JALISCO", "PEREZ", 12, periodo=q2)
+    db.flush()
+
+    datos = servicio.calcular(db, [PERIODO, q2])
+
+    assert [(m["medico"], m["dias"]) for m in datos["medicos"]] == [("PEREZ", 22)]
+    assert datos["resumen"] == [{"entidad": "JALISCO", "medicos": 1, "dias": 22}]
+
+
+def _cerrar(db, periodo: str):
+    db.add(models.FormatoNacionalFirmado(quincena=periodo, url_documento=f"nacionales/{periodo}.pdf"))
+
+
+def test_periodo_finalizado_se_sirve_con_una_sola_consulta(db, contar_consultas):
+    _formato(db, "JALISCO")
+    _validado(db, "JALISCO", "PEREZ", 10)
+    _cerrar(db, PERIODO)
+    db.flush()
+    primero = servicio.calcular(db, [PERIODO])
+    contar_consultas.clear()
+
+    segundo = servicio.calcular(db, [PERIODO])
+
+    assert segundo == primero
+    # El SAVEPOINT lo abre la sesión de pruebas tras el commit de _persistir
+    consultas = [c for c in contar_consultas if not c.startswith("SAVEPOINT")]
+    assert len(consultas) == 1
+    assert "formatos_nacionales_cache" in consultas[0]
+
+
+def test_mes_completo_persistido_se_invalida_con_cualquier_quincena(db):
+    q2 = "2025-03-Q2"
+    _formato(db, "JALISCO")
+    _formato(db, "JALISCO", periodo=q2)
+    _validado(db, "JALISCO", "PEREZ", 10)
+    _validado(db, "JALISCO", "PEREZ", 12, periodo=q2)
+    _cerrar(db, "2025-03-Qcompleto")
+    db.flush()
+    servicio.calcular(db, [PERIODO, q2])
+    assert db.get(models.FormatoNacionalCache, "2025-03-Qcompleto") is not None
+
+    servicio.invalidar(db, q2)
+
+    assert db.get(models.FormatoNacionalCache, "2025-03-Qcompleto") is None
+
+
+def test_invalidar_espera_a_que_calcular_termine(db, engine):
+    _formato(db, "JALISCO")
+    _validado(db, "JALISCO", "PEREZ", 10)
+    db.flush()
+    servicio.calcular(db, [PERIODO])
+
+    # La transacción de calcular sigue abierta: invalidar (lock exclusivo) tendría que esperar
+    with engine.connect() as otra:
+        libre = otra.execute(
+            text("SELECT pg_try_advisory_xact_lock(:llave, hashtext(:periodo))"),
+            {"llave": servicio.LOCK_FORMATOS, "periodo": PERIODO}
+        ).scalar()
+        otra.rollback()
+    assert libre is False
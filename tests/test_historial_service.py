@@ -0,0 +1,126 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from backend_api import models
+from backend_api.services.historial_service import dias_activos
+
+PRIMER_DIA = date(2025, 3, 1)
+LIMITE = date(2025, 3, 20)
+
+
+def dias_activos_python(historial_doc: list, primer_dia: date, limite_superior: date) -> int:
+    # Cálculo original de reportes_service (antes de pasarlo a SQL), como referencia
+    dias = 0
+    for idx, reg in enumerate(historial_doc):
+        if reg.estatus == "01 ACTIVO":
+            inicio_real = max(primer_dia, reg.fecha_inicio)
+            fin_calculado = reg.fecha_fin
+            fue_cortado = False
+
+            if not fin_calculado:
+                if idx + 1 < len(historial_doc):
+                    fin_calculado = historial_doc[idx + 1].fecha_inicio
+                    fue_cortado = True
+                else:
+                    fin_calculado = limite_superior
+            else:
+                fue_cortado = True
+
+            fin_real = min(limite_superior, fin_calculado)
+
+            if inicio_real <= fin_real:
+                dias_tramo = (fin_real - inicio_real).days
+                if not fue_cortado or fin_calculado > limite_superior:
+                    dias_tramo += 1
+                dias += dias_tramo
+    return dias
+
+
+def _cargar(db, historiales: dict):
+    for id_imss, eventos in historiales.items():
+        db.add(models.Doctor(id_imss=id_imss, is_deleted=False))
+        db.flush()
+        for estatus, inicio, fin in eventos:
+            db.add(models.EstatusHistorico(
+                id_imss=id_imss, tipo_cambio="prueba", estatus=estatus, fecha_inicio=inicio, fecha_fin=fin
+            ))
+    db.flush()
+
+
+def _comparar(db, historiales: dict, primer_dia=PRIMER_DIA, limite=LIMITE):
+    _cargar(db, historiales)
+    sql = dias_activos(db, historiales.keys(), primer_dia, limite)
+
+    por_doctor = {}
+    for reg in db.query(models.EstatusHistorico).order_by(
+        models.EstatusHistorico.id_imss, models.EstatusHistorico.fecha_inicio, models.EstatusHistorico.id
+    ):
+        por_doctor.setdefault(reg.id_imss, []).append(reg)
+
+    esperado = {i: dias_activos_python(por_doctor.get(i, []), primer_dia, limite) for i in historiales}
+    assert {i: sql.get(i, 0) for i in historiales} == esperado
+    return esperado
+
+
+def test_sin_ids(db):
+    assert dias_activos(db, [], PRIMER_DIA, LIMITE) == {}
+
+
+def test_historial_vacio(db):
+    assert _comparar(db, {"D1": []}) == {"D1": 0}
+
+
+def test_un_solo_evento_abierto(db):
+    esperado = _comparar(db, {"D1": [("01 ACTIVO", date(2025, 2, 10), None)]})
+    assert esperado == {"D1": 20}
+
+
+def test_un_solo_evento_con_fecha_fin(db):
+    esperado = _comparar(db, {
+        "D1": [("01 ACTIVO", date(2025, 3, 5), date(2025, 3, 10))],
+        "D2": [("01 ACTIVO", date(2025, 3, 5), date(2025, 3, 25))],
+        "D3": [("02 LICENCIA", date(2025, 3, 5), None)],
+    })
+    assert esperado == {"D1": 5, "D2": 16, "D3": 0}
+
+
+def test_baja_y_reactivacion(db):
+    esperado = _comparar(db, {"D1": [
+        ("01 ACTIVO", date(2025, 1, 1), None),
+        ("06 BAJA", date(2025, 3, 5), None),
+        ("01 ACTIVO", date(2025, 3, 12), None),
+    ]})
+    assert esperado == {"D1": 4 + 9}
+
+
+def test_ultimo_periodo_abierto_mas_alla_del_limite(db):
+    _comparar(db, {
+        "D1": [("03 VACACIONES", date(2025, 2, 1), date(2025, 3, 3)), ("01 ACTIVO", date(2025, 3, 3), None)],
+        "D2": [("01 ACTIVO", date(2025, 3, 1), None), ("02 LICENCIA", date(2025, 3, 28), None)],
+        "D3": [("01 ACTIVO", date(2025, 3, 25), None)],
+    })
+
+
+def test_mismo_dia_se_ordena_por_id(db):
+    _comparar(db, {"D1": [
+        ("01 ACTIVO", date(2025, 3, 4), None),
+        ("06 BAJA", date(2025, 3, 4), None),
+        ("01 ACTIVO", date(2025, 3, 9), date(2025, 3, 15)),
+    ]})
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_historiales_aleatorios(db, semilla):
+    azar = random.Random(semilla)
+    estatus = ["01 ACTIVO", "01 ACTIVO", "02 LICENCIA", "06 BAJA"]
+    historiales = {}
+    for n in range(40):
+        eventos, dia = [], date(2025, 2, 1) + timedelta(days=azar.randint(0, 20))
+        for _ in range(azar.randint(0, 5)):
+            fin = dia + timedelta(days=azar.randint(0, 15)) if azar.random() < 0.4 else None
+            eventos.append((azar.choice(estatus), dia, fin))
+            dia += timedelta(days=azar.randint(0, 12))
+        historiales[f"D{n}"] = eventos
+    _comparar(db, historiales)
@@ -0,0 +1,80 @@
+import asyncio
+from io import BytesIO
+
+import openpyxl
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend_api import api_peas
+from backend_api.services import plantillas_service
+
+
+@pytest.fixture
+def cliente():
+    app = FastAPI()
+    app.include_router(api_peas.router)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("encabezado, esperado", [
+    (None, False),
+    ("", False),
+    ('"a-1"', True),
+    ('W/"a-1"', True),
+    ('"b-2", "a-1"', True),
+    ('"b-2",W/"a-1"', True),
+    ("*", True),
+    ('"a-10"', False),
+    ("a-1", False),
+])
+def test_coincide(encabezado, esperado):
+    assert plantillas_service.coincide(encabezado, '"a-1"') is esperado
+
+
+def test_etag_cambia_con_plantilla_y_periodo():
+    base = plantillas_service.etag("asistencias", 2025, 3, 1)
+
+    assert base == plantillas_service.etag("asistencias", 2025, 3, 1)
+    assert base.startswith('"asistencias-') and base.endswith('-202503q1"')
+    assert base != plantillas_service.etag("asistencias", 2025, 3, 2)
+    assert base != plantillas_service.etag("firma_manual", 2025, 3, 1)
+
+
+def test_variante_lleva_las_fechas_de_la_quincena():
+    contenido = asyncio.run(plantillas_service.obtener("asistencias", 2024, 2, 2))
+
+    ws = openpyxl.load_workbook(BytesIO(contenido)).active
+    fechas = [ws.cell(row=2 + i, column=1).value for i in range(16)]
+    assert fechas[:14] == [f"{d}/02/2024" for d in range(16, 30)]
+    assert all(not f for f in fechas[14:])
+
+
+def test_descarga_y_304_sin_generar(cliente, monkeypatch):
+    url = "/api/peas/reporte-quincenal/descargar-plantilla-dinamica?anio=2025&mes=4&quincena=1"
+    respuesta = cliente.get(url)
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"] == plantillas_service.MEDIA_TYPE
+    etag = respuesta.headers["etag"]
+
+    async def no_generar(*args):
+        raise AssertionError("con If-None-Match vigente no se debe generar la plantilla")
+
+    monkeypatch.setattr(plantillas_service, "obtener", no_generar)
+    repetida = cliente.get(url, headers={"If-None-Match": etag})
+
+    assert repetida.status_code == 304
+    assert repetida.content == b""
+    assert repetida.headers["etag"] == etag
+
+
+def test_otro_periodo_no_coincide(cliente):
+    primera = cliente.get("/api/peas/reporte-quincenal/descargar-formato-impresion?anio=2025&mes=4&quincena=1")
+    otra = cliente.get(
+        "/api/peas/reporte-quincenal/descargar-formato-impresion?anio=2025&mes=4&quincena=2",
+        headers={"If-None-Match": primera.headers["etag"]},
+    )
+
+    assert otra.status_code == 200
+    assert otra.headers["etag"] != primera.headers["etag"]
+    assert "Registro_Firmas_Abril_Q2.xlsx" in otra.headers["content-disposition"]
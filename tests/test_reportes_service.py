@@ -0,0 +1,165 @@
+import csv
+import io
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from backend_api import models
+from backend_api.services import reportes_service
+
+
+def _solicitud(columnas, **filtros):
+    datos = dict(tipo="medicos", entidad=None, especialidad=None, nivel_atencion=None,
+                 nombre_unidad=None, estatus=None, search=None, mes_evaluacion=None)
+    datos.update(filtros)
+    return SimpleNamespace(columnas=columnas, **datos)
+
+
+def _con_lotes(monkeypatch, lotes_fijos):
+    # Los escritores solo consumen `lotes`; se reemplaza para no depender de la BD
+    def falsos(proy, tamano=reportes_service.STREAM_BATCH, progreso=None):
+        for lote in lotes_fijos:
+            yield list(lote)
+            if progreso is not None:
+                progreso(len(lote))
+    monkeypatch.setattr(reportes_service, "lotes", falsos)
+
+
+def test_csv_un_trozo_por_lote_con_encabezado(monkeypatch):
+    proy = reportes_service.proyeccion_dinamica(_solicitud(["id_imss", "nombre"]))
+    _con_lotes(monkeypatch, [[("1", "Ana"), ("2", "Luis, Jr.")], [("3", 'Con "comillas"')]])
+    avance = []
+
+    trozos = list(reportes_service.generar_csv(proy, progreso=avance.append))
+
+    assert len(trozos) == 2
+    filas = list(csv.reader(io.StringIO(b"".join(trozos).decode("utf-8"))))
+    assert filas == [["ID_IMSS", "NOMBRE"], ["1", "Ana"], ["2", "Luis, Jr."], ["3", 'Con "comillas"']]
+    assert avance == [2, 1]
+
+
+def test_csv_sin_filas_solo_encabezado(monkeypatch):
+    proy = reportes_service.proyeccion_dinamica(_solicitud(["id_imss", "entidad"]))
+    _con_lotes(monkeypatch, [])
+
+    assert b"".join(reportes_service.generar_csv(proy)) == b"ID_IMSS,ENTIDAD\r\n"
+
+
+def test_parquet_respeta_esquema_y_row_groups(monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    proy = reportes_service.proyeccion_dinamica(
+        _solicitud(["id_imss", "fecha_estatus", "is_deleted", "deleted_at", "deleted_by_user_id"])
+    )
+    momento = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+    _con_lotes(monkeypatch, [
+        [("1", date(2025, 1, 2), False, None, 7), ("2", None, True, momento, None)],
+        [("3", date(2025, 2, 3), False, momento, 9)],
+    ])
+    destino = io.BytesIO()
+
+    assert reportes_service.escribir_parquet(proy, destino) == 3
+
+    destino.seek(0)
+    archivo = pq.ParquetFile(destino)
+    assert archivo.metadata.num_row_groups == 2
+    assert archivo.schema_arrow == pa.schema([
+        pa.field("ID_IMSS", pa.string()),
+        pa.field("FECHA_ESTATUS", pa.date32()),
+        pa.field("IS_DELETED", pa.bool_()),
+        pa.field("DELETED_AT", pa.timestamp("us", tz="UTC")),
+        pa.field("DELETED_BY_USER_ID", pa.int64()),
+    ])
+    tabla = archivo.read().to_pydict()
+    assert tabla["ID_IMSS"] == ["1", "2", "3"]
+    assert tabla["FECHA_ESTATUS"] == [date(2025, 1, 2), None, date(2025, 2, 3)]
+    assert tabla["DELETED_AT"] == [None, momento, momento]
+    assert tabla["DELETED_BY_USER_ID"] == [7, None, 9]
+
+
+def test_parquet_columna_de_dias_sin_id_extra(monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    proy = reportes_service.proyeccion_dinamica(
+        _solicitud(["nombre", reportes_service.COLUMNA_VIRTUAL], mes_evaluacion="2025-02")
+    )
+    # `lotes` ya entrega las filas sin el id_imss extra y con los días al final
+    _con_lotes(monkeypatch, [[("Ana", 28), ("Luis", 0)]])
+    destino = io.BytesIO()
+
+    reportes_service.escribir_parquet(proy, destino)
+
+    destino.seek(0)
+    tabla = pq.read_table(destino)
+    assert tabla.schema == pa.schema([
+        pa.field("NOMBRE", pa.string()),
+        pa.field("DÍAS ACTIVOS (2025-02)", pa.int64()),
+    ])
+    assert tabla.to_pydict()["DÍAS ACTIVOS (2025-02)"] == [28, 0]
+
+
+def test_proyeccion_solo_selecciona_columnas_pedidas():
+    proy = reportes_service.proyeccion_dinamica(_solicitud(["nombre", "no_existe", "id_imss", "entidad"]))
+
+    # id_imss va primero y lo que no es columna del modelo se descarta
+    assert proy.encabezados == ["ID_IMSS", "NOMBRE", "ENTIDAD"]
+    assert [c.name for c in proy.query.selected_columns] == ["id_imss", "nombre", "entidad"]
+    assert proy.dias is None and proy.id_extra is False
+
+
+def test_proyeccion_dias_sin_id_imss_agrega_id_extra():
+    proy = reportes_service.proyeccion_dinamica(
+        _solicitud([reportes_service.COLUMNA_VIRTUAL, "nombre"], mes_evaluacion="2024-02")
+    )
+
+    assert proy.encabezados == ["NOMBRE", "DÍAS ACTIVOS (2024-02)"]
+    assert [c.name for c in proy.query.selected_columns] == ["nombre", "id_imss"]
+    assert proy.id_extra is True
+    assert proy.dias == (date(2024, 2, 1), date(2024, 2, 29))
+
+
+def test_proyeccion_dias_con_id_imss_no_repite_columna():
+    proy = reportes_service.proyeccion_dinamica(
+        _solicitud(["nombre", reportes_service.COLUMNA_VIRTUAL, "id_imss"], mes_evaluacion="2024-02")
+    )
+
+    assert [c.name for c in proy.query.selected_columns] == ["id_imss", "nombre"]
+    assert proy.id_extra is False
+
+
+def test_quitar_tz_solo_en_columnas_indicadas():
+    con_tz = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+    lote = [("1", con_tz, con_tz), ("2", None, con_tz)]
+
+    assert reportes_service._quitar_tz(lote, [1]) == [
+        ("1", datetime(2025, 3, 1, 12, 0), con_tz),
+        ("2", None, con_tz),
+    ]
+
+
+def test_columnas_con_tz_ignora_id_extra():
+    proy = reportes_service.proyeccion_dinamica(_solicitud(["deleted_at", "fecha_estatus", "nombre"]))
+
+    assert reportes_service._columnas_con_tz(proy) == [0]
+
+
+def test_lotes_agregan_dias_y_quitan_id_extra(db, monkeypatch):
+    for id_imss, nombre in [("B2", "Beto"), ("A1", "Ana"), ("C3", "Caro")]:
+        db.add(models.Doctor(id_imss=id_imss, nombre=nombre, coordinacion="0", is_deleted=False))
+    db.add(models.Doctor(id_imss="D4", nombre="Admin", coordinacion="1", is_deleted=False))
+    db.flush()
+    db.add(models.EstatusHistorico(id_imss="A1", tipo_cambio="prueba", estatus="01 ACTIVO",
+                                   fecha_inicio=date(2024, 2, 10), fecha_fin=None))
+    db.flush()
+    # lotes abre su propia sesión; aquí se le da la de la prueba para ver los datos sin confirmar
+    monkeypatch.setattr(reportes_service, "SessionLocal", lambda: db)
+    proy = reportes_service.proyeccion_dinamica(
+        _solicitud(["nombre", reportes_service.COLUMNA_VIRTUAL], mes_evaluacion="2024-02")
+    )
+    avance = []
+
+    lotes = list(reportes_service.lotes(proy, tamano=2, progreso=avance.append))
+
+    assert lotes == [[("Ana", 20), ("Beto", 0)], [("Caro", 0)]]
+    assert avance == [2, 1]
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from backend_api import models
+from backend_api.api_peas import obtener_reportes_validados
+
+
+def _cargar(db, cantidad: int, entidad: str = "JALISCO", periodo: str = "2025-03-Q1"):
+    for n in range(cantidad):
+        reporte = models.ReporteQuincenal(quincena=periodo, url_documento=f"reportes/{entidad}/{n}.pdf")
+        db.add(reporte)
+        db.flush()
+        db.add(models.BitacoraEstatalValidada(
+            id_reporte_quincenal=reporte.id, id_imss=f"D{n}", quincena_validada=periodo,
+            profesional_salud=f"MEDICO {n:03d}", entidad=entidad, dias_participacion=10
+        ))
+    db.flush()
+
+
+def _consultar(db_async, entidad: str = "jalisco", periodo: str = "2025-03-Q1"):
+    return asyncio.run(obtener_reportes_validados(entidad, periodo, db=db_async))
+
+
+@pytest.mark.parametrize("cantidad", [1, 10, 50])
+def test_una_sola_consulta_sin_importar_cuantos_reportes(db, db_async, contar_consultas, cantidad):
+    _cargar(db, cantidad)
+    contar_consultas.clear()
+
+    resultado = _consultar(db_async)
+
+    assert len(resultado) == cantidad
+    assert len(contar_consultas) == 1
+
+
+def test_trae_la_url_del_reporte_y_tolera_reportes_borrados(db, db_async):
+    _cargar(db, 3)
+    huerfano = db.query(models.BitacoraEstatalValidada).filter_by(id_imss="D1").one()
+    huerfano.id_reporte_quincenal = None
+    db.flush()
+
+    por_medico = {r["id_imss"]: r for r in _consultar(db_async)}
+
+    assert por_medico["D0"]["url_pdf"] == "reportes/JALISCO/0.pdf"
+    assert por_medico["D1"]["url_pdf"] is None
+    assert [r["medico"] for r in _consultar(db_async)] == ["MEDICO 000", "MEDICO 001", "MEDICO 002"]
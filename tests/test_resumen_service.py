@@ -0,0 +1,82 @@
+import random
+
+from sqlalchemy import select
+
+from backend_api import models
+from backend_api.services import resumen_service
+
+# snapshot()/registrar_cambio() y _SQL_RECONSTRUIR son dos copias de las mismas reglas:
+# lo que se acumula con los deltas tiene que ser exactamente lo que da la reconstrucción
+
+ENTIDADES = ["JALISCO", "SONORA", "", None]
+COORDINACIONES = ["0", "1", "", None]
+ESTATUS = ["01 ACTIVO", "06 BAJA", " 05 incapacidad", "02 VACACIONES", "", None]
+NIVELES = ["PRIMER NIVEL", "SEGUNDO NIVEL", None]
+SEXOS = ["F", "M", None]
+CEDULAS = ["1234567", "EN TRAMITE", "baja", "NULL", "", None]
+
+
+def _doctor(azar: random.Random, n: int) -> models.Doctor:
+    return models.Doctor(
+        id_imss=f"R{n:04d}",
+        entidad=azar.choice(ENTIDADES),
+        coordinacion=azar.choice(COORDINACIONES),
+        estatus=azar.choice(ESTATUS),
+        nivel_atencion=azar.choice(NIVELES),
+        sexo=azar.choice(SEXOS),
+        cedula_lic=azar.choice(CEDULAS),
+        cedula_esp=azar.choice(CEDULAS),
+        is_deleted=azar.random() < 0.1,
+    )
+
+
+def _resumen(db) -> dict:
+    tabla = models.DoctorResumen
+    llaves = (tabla.entidad, tabla.coordinacion, tabla.estatus_code, tabla.nivel_atencion, tabla.sexo)
+    medidas = [getattr(tabla, m) for m in resumen_service.MEDIDAS]
+    return {
+        tuple(fila[:5]): tuple(fila[5:])
+        for fila in db.execute(select(*llaves, *medidas))
+        if any(fila[5:])
+    }
+
+
+def _reconstruido(db) -> dict:
+    resumen_service.reconstruir_resumen(db)
+    return _resumen(db)
+
+
+def test_altas_coinciden_con_la_reconstruccion(db):
+    azar = random.Random(7)
+    for n in range(300):
+        doctor = _doctor(azar, n)
+        db.add(doctor)
+        db.flush()
+        resumen_service.registrar_cambio(db, None, resumen_service.snapshot(doctor))
+
+    incremental = _resumen(db)
+    assert incremental
+    assert incremental == _reconstruido(db)
+
+
+def test_cambios_y_bajas_coinciden_con_la_reconstruccion(db):
+    azar = random.Random(11)
+    doctores = []
+    for n in range(200):
+        doctor = _doctor(azar, n)
+        db.add(doctor)
+        doctores.append(doctor)
+    db.flush()
+    resumen_service.reconstruir_resumen(db)
+
+    for doctor in azar.sample(doctores, 120):
+        antes = resumen_service.snapshot(doctor)
+        campo = azar.choice(["estatus", "coordinacion", "entidad", "cedula_lic", "cedula_esp", "is_deleted"])
+        valores = {"estatus": ESTATUS, "coordinacion": COORDINACIONES, "entidad": ENTIDADES,
+                   "cedula_lic": CEDULAS, "cedula_esp": CEDULAS, "is_deleted": [True, False]}[campo]
+        setattr(doctor, campo, azar.choice(valores))
+        db.flush()
+        resumen_service.registrar_cambio(db, antes, resumen_service.snapshot(doctor))
+
+    incremental = _resumen(db)
+    assert incremental == _reconstruido(db)
@@ -0,0 +1,115 @@
+import asyncio
+from io import BytesIO
+
+import pytest
+
+from backend_api.services import storage
+
+
+async def _juntar(iterador) -> list:
+    return [trozo async for trozo in iterador]
+
+
+@pytest.fixture(params=["memoria", "local"])
+def backend(request, tmp_path):
+    if request.param == "memoria":
+        return storage.MemoryBackend()
+    return storage.LocalBackend(str(tmp_path / "raiz"), "http://archivos.local/")
+
+
+def test_put_get_stream_delete(backend):
+    contenido = b"x" * (storage.CHUNK_BYTES + 10)
+
+    async def escenario():
+        assert await backend.put("peas/reporte 1.pdf", BytesIO(contenido), "application/pdf") == "peas/reporte 1.pdf"
+        leido = await backend.get("peas/reporte 1.pdf")
+        trozos = await _juntar(backend.stream("peas/reporte 1.pdf", chunk=storage.CHUNK_BYTES))
+        await backend.delete("peas/reporte 1.pdf")
+        return leido, trozos, await backend.try_delete("peas/reporte 1.pdf")
+
+    leido, trozos, borrado_otra_vez = asyncio.run(escenario())
+    assert leido == contenido
+    assert [len(t) for t in trozos] == [storage.CHUNK_BYTES, 10]
+    assert borrado_otra_vez is False
+
+
+def test_presign_se_reutiliza_y_se_invalida_al_borrar(backend):
+    firmas = []
+    original = backend._presign
+
+    def contar(key, expira):
+        firmas.append((key, expira))
+        return original(key, expira)
+
+    backend._presign = contar
+
+    async def escenario():
+        await backend.put("a/b.xlsx", BytesIO(b"1"))
+        primera = await backend.presign("a/b.xlsx")
+        segunda = await backend.presign("a/b.xlsx")
+        otra_vigencia = await backend.presign("a/b.xlsx", expira=600)
+        await backend.delete("a/b.xlsx")
+        await backend.put("a/b.xlsx", BytesIO(b"2"))
+        await backend.presign("a/b.xlsx")
+        await backend.presign("a/b.xlsx", expira=600)
+        return primera, segunda, otra_vigencia
+
+    primera, segunda, otra_vigencia = asyncio.run(escenario())
+    assert primera == segunda == otra_vigencia
+    # delete invalida las URL del objeto con cualquier vigencia
+    assert firmas == [("a/b.xlsx", 3600), ("a/b.xlsx", 600)] * 2
+
+
+def test_presign_de_objeto_borrado_falla():
+    backend = storage.MemoryBackend()
+    firmas = []
+    original = backend._presign
+
+    def contar(key, expira):
+        firmas.append(key)
+        return original(key, expira)
+
+    backend._presign = contar
+
+    async def escenario():
+        await backend.put("x.pdf", BytesIO(b"1"))
+        await backend.presign("x.pdf")
+        await backend.presign("x.pdf")
+        await backend.delete("x.pdf")
+        with pytest.raises(KeyError):
+            await backend.presign("x.pdf")
+
+    asyncio.run(escenario())
+    assert firmas == ["x.pdf", "x.pdf"]
+
+
+def test_presign_muchos_marca_fallidos_y_quita_repetidos():
+    backend = storage.MemoryBackend()
+
+    async def escenario():
+        await backend.put("uno.pdf", BytesIO(b"1"))
+        return await backend.presign_muchos(["uno.pdf", "falta.pdf", "uno.pdf", None, ""])
+
+    assert asyncio.run(escenario()) == {"uno.pdf": "memory://uno.pdf", "falta.pdf": None}
+
+
+def test_local_rechaza_rutas_fuera_de_la_raiz(tmp_path):
+    backend = storage.LocalBackend(str(tmp_path / "raiz"))
+
+    for key in ("../fuera.txt", "a/../../fuera.txt", "/../fuera.txt"):
+        with pytest.raises(ValueError):
+            asyncio.run(backend.put(key, BytesIO(b"1")))
+    assert not (tmp_path / "fuera.txt").exists()
+
+
+def test_local_no_deja_parciales_y_firma_con_url_base(tmp_path):
+    backend = storage.LocalBackend(str(tmp_path / "raiz"), "http://archivos.local/")
+
+    async def escenario():
+        await backend.put("dir/con espacio.pdf", BytesIO(b"pdf"))
+        return await backend.presign("dir/con espacio.pdf")
+
+    url = asyncio.run(escenario())
+
+    assert url == "http://archivos.local/dir/con%20espacio.pdf"
+    assert [p.name for p in (tmp_path / "raiz" / "dir").iterdir()] == ["con espacio.pdf"]
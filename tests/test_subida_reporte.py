@@ -0,0 +1,73 @@
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend_api import api_peas, models
+from backend_api.services import asistencia_excel, plantillas_service, storage
+
+
+class BackendConFalla(storage.MemoryBackend):
+    """Backend en memoria que falla al subir las llaves que terminan en `falla_en`."""
+
+    def __init__(self, falla_en: str = None):
+        super().__init__()
+        self.falla_en = falla_en
+
+    def _put(self, key, fileobj, content_type):
+        if self.falla_en and key.endswith(self.falla_en):
+            raise IOError("conexión cortada")
+        super()._put(key, fileobj, content_type)
+
+
+def _excel() -> bytes:
+    buffer = BytesIO()
+    pd.DataFrame(
+        [["03/03/2025", "Matutino", "08:00", "15:00", None]],
+        columns=[asistencia_excel.COL_FECHA, asistencia_excel.COL_TURNO, asistencia_excel.COL_ENTRADA,
+                 asistencia_excel.COL_SALIDA, asistencia_excel.COL_OBSERVACIONES],
+    ).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def _subir(db, monkeypatch, backend):
+    db.add(models.Doctor(id_imss="A1", is_deleted=False))
+    db.flush()
+    monkeypatch.setattr(storage, "peas", backend)
+    app = FastAPI()
+    app.include_router(api_peas.router)
+    app.dependency_overrides[api_peas.get_db] = lambda: db
+    return TestClient(app).post(
+        "/api/peas/reporte-quincenal/subir",
+        data={"id_imss": "A1", "anio": 2025, "mes": 3, "quincena": 1, "subido_por": "prueba"},
+        files={
+            "archivo_pdf": ("reporte.pdf", b"%PDF-1.4", "application/pdf"),
+            "archivo_excel": ("datos.xlsx", _excel(), plantillas_service.MEDIA_TYPE),
+        },
+    )
+
+
+def test_subida_completa(db, monkeypatch):
+    backend = BackendConFalla()
+
+    respuesta = _subir(db, monkeypatch, backend)
+
+    assert respuesta.status_code == 200
+    assert sorted(backend._objetos) == [
+        "reportes/2025/03/Q1/A1_DATOS.xlsx", "reportes/2025/03/Q1/A1_FIRMADO.pdf",
+    ]
+    assert db.query(models.ReporteQuincenal).filter_by(id_imss="A1").count() == 1
+
+
+@pytest.mark.parametrize("falla_en", ["_FIRMADO.pdf", "_DATOS.xlsx"])
+def test_falla_una_subida_no_deja_huerfanos(db, monkeypatch, falla_en):
+    backend = BackendConFalla(falla_en)
+
+    respuesta = _subir(db, monkeypatch, backend)
+
+    assert respuesta.status_code == 500
+    assert "conexión cortada" in respuesta.json()["detail"]
+    assert backend._objetos == {}
+    assert db.query(models.ReporteQuincenal).filter_by(id_imss="A1").count() == 0
@@ -0,0 +1,64 @@
+from datetime import date, datetime
+from decimal import Decimal
+from io import BytesIO
+
+import openpyxl
+
+from backend_api.services import xlsx_stream
+
+
+def _abrir(trozos) -> openpyxl.Workbook:
+    return openpyxl.load_workbook(BytesIO(b"".join(trozos)))
+
+
+def test_tipos_de_celda_se_leen_con_openpyxl():
+    filas = [
+        ["texto <&> \"comillas\"", 7, 2.5, Decimal("3.25"), True, date(2025, 3, 1),
+         datetime(2025, 3, 1, 13, 30, 15), None],
+        ["con\x01control\x0bilegal", -1, 0.0, Decimal("0"), False, None, None, "fin"],
+    ]
+    encabezados = ["a", "b", "c", "d", "e", "f", "g", "h"]
+
+    ws = _abrir(xlsx_stream.generar_xlsx(encabezados, filas, hoja='Médicos "activos"')).active
+
+    assert ws.title == 'Médicos "activos"'
+    valores = [list(fila) for fila in ws.iter_rows(values_only=True)]
+    assert valores[0] == encabezados
+    assert valores[1][:5] == ["texto <&> \"comillas\"", 7, 2.5, 3.25, True]
+    assert valores[1][5] == datetime(2025, 3, 1)
+    assert valores[1][6] == datetime(2025, 3, 1, 13, 30, 15)
+    assert valores[1][7] is None
+    assert valores[2] == ["concontrolilegal", -1, 0, 0, False, None, None, "fin"]
+    assert ws["F2"].number_format == "yyyy-mm-dd"
+
+
+def test_texto_se_recorta_al_maximo_de_excel():
+    largo = "x" * (xlsx_stream.MAX_CHARS_CELDA + 100)
+    ws = _abrir(xlsx_stream.generar_xlsx(["a"], [[largo]])).active
+
+    assert len(ws["A2"].value) == xlsx_stream.MAX_CHARS_CELDA
+
+
+def test_genera_por_trozos_sin_consumir_todas_las_filas():
+    consumidas = []
+
+    def filas():
+        for n in range(50_000):
+            consumidas.append(n)
+            yield [n, f"doctor {n}", date(2025, 1, 1)]
+
+    generador = xlsx_stream.generar_xlsx(["n", "nombre", "fecha"], filas())
+    primero = next(generador)
+    assert primero
+    assert len(consumidas) < 50_000
+
+    trozos = [primero, *generador]
+    assert len(trozos) > 2
+    ws = _abrir(trozos).active
+    assert ws.max_row == 50_001
+    assert ws["A50001"].value == 49_999
+    assert ws["B2"].value == "doctor 0"
+
+
+def test_columnas_despues_de_la_z():
+    assert [xlsx_stream._columna(i) for i in (1, 26, 27, 52, 703)] == ["A", "Z", "AA", "AZ", "AAA"]